@@ -0,0 +1,206 @@
+"""
+Benchmarks the LogTab hot paths against the GUI-free engine, on seeded synthetic logs.
+
+    python benchmarks/bench_hot_paths.py [--size 10MB 100MB 1GB] [--file LOG] [--save BASELINE.json] [--compare BASELINE.json]
+
+Every operation is the engine call the tab makes for it (loading, rendering, search,
+filters, statistics, go-to-time, field queries, tailing). For each one the wall time,
+the peak RSS while it ran (Linux resets the peak per operation; elsewhere it is the
+process peak so far) and the UI blocking time are reported. Operations the tab runs on
+the UI thread block it for as long as their longest call; for background operations a
+heartbeat thread standing in for the Tk event loop measures its longest stall (the
+GIL held by the worker). --save writes the results as a JSON baseline; --compare
+reports the operations that got slower than a baseline and exits with 1 if any did.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loggen
+from omnilog_core import FieldQuery, LineFilter, SearchEngine, TermPattern, build_view, candidate_view, field_view, iter_text_batches, open_log
+
+RENDER_ROWS = 60 # Rows of a typical viewport
+RENDERS = 300
+TAIL_BURSTS = 100
+TAIL_BURST_BYTES = 64 * 1024
+
+# --- Measurement ---
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5") # Linux: resets VmHWM
+    except OSError: pass
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"): return int(line.split()[1]) / 1024
+    except OSError: pass
+    try: import resource
+    except ImportError: return None # Windows without /proc: not reported
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+class Heartbeat:
+    """Stands in for the Tk event loop: a thread that wants to run every TICK seconds; its longest lateness is the UI stall."""
+    TICK = 0.005
+
+    def __enter__(self):
+        self.max_stall = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            t = time.perf_counter()
+            time.sleep(self.TICK)
+            self.max_stall = max(self.max_stall, time.perf_counter() - t - self.TICK)
+
+def measure(fn, ui_thread):
+    """Runs fn() and returns {wall_s, peak_rss_mb, ui_block_ms}. fn returns the durations of its UI-thread calls, if any."""
+    reset_peak_rss()
+    with Heartbeat() as heartbeat:
+        start = time.perf_counter()
+        calls = fn()
+        wall = time.perf_counter() - start
+    block = max(calls) if ui_thread and calls else wall if ui_thread else heartbeat.max_stall
+    rss = peak_rss_mb()
+    return {"wall_s": round(wall, 4), "peak_rss_mb": round(rss, 1) if rss is not None else None, "ui_block_ms": round(block * 1000, 1)}
+
+def timed_calls(calls):
+    durations = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+# --- Operations ---
+def bench_log(path):
+    """Runs every operation on one log. Returns {operation: measurements}."""
+    results, state = {}, {}
+
+    def load(): # LogTab._load_file_content (+ _update_text_area after the first chunk)
+        index, _ = open_log(path)
+        start = time.perf_counter()
+        index.build(on_progress=lambda done: state.setdefault("first_screen", time.perf_counter() - start))
+        state["index"] = index
+    results["load"] = measure(load, ui_thread=False)
+    results["load"]["first_screen_s"] = round(state["first_screen"], 4)
+    index = state["index"]
+
+    try: from omnilog import SyntaxHighlighter # Needs customtkinter, not a display
+    except ImportError: SyntaxHighlighter = None
+    if SyntaxHighlighter:
+        def render(): # LogTab._render_viewport / _apply_syntax_coloring at random scroll positions
+            highlighter, rnd = SyntaxHighlighter(), random.Random(1)
+            def one(top):
+                texts = index.get_text(top, min(top + RENDER_ROWS, index.line_count))
+                for line, text in enumerate(texts, top): highlighter.spans(line, text, index.levels.code(line))
+            return timed_calls(lambda top=rnd.randrange(index.line_count): one(top) for _ in range(RENDERS))
+        results["render"] = measure(render, ui_thread=True)
+
+    def search(): # LogTab.run_search: streamed from a worker thread
+        done = threading.Event()
+        pattern = TermPattern("took 7", False)
+        SearchEngine().start(pattern, iter_text_batches(index, candidate_view(index, pattern)), on_batch=lambda batch: None, on_done=lambda batch: done.set())
+        done.wait()
+    results["search"] = measure(search, ui_thread=False)
+
+    # filter_by_term_only / apply_advanced_filter: LogTab._apply_filter runs them as a tab task
+    results["filter_term"] = measure(lambda: timed_calls([lambda: build_view(index, LineFilter(include="user=42"))]), ui_thread=False)
+    results["filter_levels"] = measure(lambda: timed_calls([lambda: build_view(index, LineFilter(exclude="Heartbeat", levels=["ERROR", "WARN"]))]), ui_thread=False)
+    results["stats"] = measure(lambda: timed_calls([index.levels.counts, index.timeline.series, lambda: index.timeline.series(3600)]), ui_thread=True) # show_stats
+    results["goto_time"] = measure(lambda: timed_calls(lambda t=t: index.line_at_time(t) for t in range(loggen.START, loggen.START + 86400, 864)), ui_thread=True)
+    query = FieldQuery("user<100 AND path~/api/") # Fields of the logfmt lines loggen writes (the file is detected as logfmt)
+    results["field_query"] = measure(lambda: timed_calls([lambda: field_view(index, query)]), ui_thread=False) # First parse: a tab task
+    results["field_query_cached"] = measure(lambda: timed_calls([lambda: field_view(index, query)]), ui_thread=True)
+    assert len(field_view(index, query)), "field query matched no line: the benchmark would only time an empty scan"
+    index.close()
+    return results
+
+def bench_tail(path):
+    """Live Watch: bursts appended to a growing copy, each picked up by LineIndex.refresh() (watcher thread)."""
+    size = os.path.getsize(path)
+    head = max(0, size - TAIL_BURSTS * TAIL_BURST_BYTES)
+    fd, tail_path = tempfile.mkstemp(prefix="omnilog-bench-tail-", suffix=".log")
+    with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+        remaining = head
+        while remaining:
+            chunk = src.read(min(remaining, 16 * 1024 * 1024))
+            dst.write(chunk)
+            remaining -= len(chunk)
+    index, _ = open_log(tail_path)
+    index.build()
+    try:
+        def tail():
+            with open(path, "rb") as src, open(tail_path, "ab") as dst:
+                src.seek(head)
+                for _ in range(TAIL_BURSTS):
+                    dst.write(src.read(TAIL_BURST_BYTES))
+                    dst.flush()
+                    index.refresh()
+        return measure(tail, ui_thread=False)
+    finally:
+        index.close()
+        os.remove(tail_path)
+
+# --- Baseline ---
+def compare(results, baseline, tolerance):
+    """Prints the operations slower than the baseline by more than `tolerance` (and 5 ms). Returns their number."""
+    regressions = 0
+    for label, ops in results.items():
+        for op, now in ops.items():
+            before = baseline.get("results", {}).get(label, {}).get(op)
+            if not before: continue
+            ratio = now["wall_s"] / before["wall_s"] if before["wall_s"] else 1.0
+            slower = ratio > 1 + tolerance and now["wall_s"] - before["wall_s"] > 0.005
+            regressions += slower
+            print(f"{label:<8}{op:<20}{before['wall_s']:>10.3f}{now['wall_s']:>10.3f}{ratio:>8.2f}x{'  REGRESSION' if slower else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", nargs="+", default=["10MB"], help="generated log sizes: 10MB 100MB 1GB (or MB numbers)")
+    parser.add_argument("--file", help="benchmark this log instead of generated ones")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare with a JSON baseline; exit code 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression is reported (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logs = {"file": args.file} if args.file else {size: loggen.cached(loggen.parse_size(size), args.seed) for size in args.size}
+    results = {}
+    print(f"{'log':<8}{'operation':<20}{'wall s':>10}{'peak MB':>10}{'UI block ms':>13}")
+    for label, path in logs.items():
+        results[label] = bench_log(path)
+        results[label]["tail"] = bench_tail(path)
+        for op, m in results[label].items():
+            rss = f"{m['peak_rss_mb']:.0f}" if m["peak_rss_mb"] is not None else "-"
+            print(f"{label:<8}{op:<20}{m['wall_s']:>10.3f}{rss:>10}{m['ui_block_ms']:>13.1f}")
+
+    report = {"meta": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                       "seed": args.seed, "date": time.strftime("%Y-%m-%d %H:%M:%S")}, "results": results}
+    if args.save:
+        with open(args.save, "w") as f: json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+        print(f"\n{'log':<8}{'operation':<20}{'baseline':>10}{'now':>10}{'ratio':>9}")
+        if compare(results, baseline, args.tolerance): return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
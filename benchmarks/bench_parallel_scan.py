@@ -0,0 +1,87 @@
+"""
+Compares the single-core scan with ParallelScanner for "Apply Filter" and "Statistics".
+
+    python benchmarks/bench_parallel_scan.py [FILE] [--size-mb 512] [--workers 1 2 4 8]
+
+Without FILE a synthetic log of --size-mb is written to a temp file first.
+Worker pools are started (and warmed up) before timing, as the app keeps its pool alive.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from omnilog_core import LevelIndex, LineFilter, LineRuns, ParallelScanner, stream_lines
+
+LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "WARN", "ERROR"]
+
+def generate(path, size_mb):
+    rnd = random.Random(42)
+    with open(path, "w") as f:
+        written, n = 0, 0
+        while written < size_mb * 1024 * 1024:
+            line = f"2024-01-01 12:{n // 60 % 60:02d}:{n % 60:02d} {rnd.choice(LEVELS)} service-{rnd.randrange(50)} request id={n} took {rnd.randrange(900)}ms\n"
+            written += f.write(line)
+            n += 1
+
+def single_filter(path, line_filter):
+    view = LineRuns()
+    for first_line, texts, codes in stream_lines(path): view.add_mask(line_filter.mask(texts, codes), first_line)
+    return len(view)
+
+def single_stats(path):
+    total = [0] * (len(LevelIndex.NAMES) + 1)
+    for _, texts, codes in stream_lines(path):
+        for level in range(len(total)): total[level] += codes.count(level)
+    return total
+
+def parallel_filter(scanner, line_filter):
+    view = LineRuns()
+    for first_line, _, runs in scanner.scan("runs", line_filter): view.extend(runs, first_line)
+    return len(view)
+
+def parallel_stats(scanner):
+    total = [0] * (len(LevelIndex.NAMES) + 1)
+    for _, _, (counts, *_) in scanner.scan("stats"): total = [a + b for a, b in zip(total, counts)]
+    return total
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?")
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    path = args.file
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"omnilog-bench-{args.size_mb}mb.log")
+        if not os.path.exists(path): generate(path, args.size_mb)
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    line_filter = LineFilter(include="service-1", exclude="took 0ms", levels=["ERROR", "WARN"])
+    print(f"{path}: {size_mb:.0f} MB, {os.cpu_count()} cores")
+
+    base_filter, kept = timed(single_filter, path, line_filter)
+    base_stats, counts = timed(single_stats, path)
+    print(f"{'path':<14}{'filter s':>10}{'speedup':>9}{'stats s':>10}{'speedup':>9}")
+    print(f"{'single-core':<14}{base_filter:>10.2f}{1:>9.2f}{base_stats:>10.2f}{1:>9.2f}")
+    for workers in args.workers:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            list(pool.map(abs, range(workers))) # Start the workers outside the timing
+            scanner = ParallelScanner(path, executor=pool, workers=workers)
+            t_filter, view_len = timed(parallel_filter, scanner, line_filter)
+            t_stats, par_counts = timed(parallel_stats, scanner)
+        assert view_len == kept and par_counts == counts, "parallel results differ from the single-core scan"
+        print(f"{f'{workers} workers':<14}{t_filter:>10.2f}{base_filter / t_filter:>9.2f}{t_stats:>10.2f}{base_stats / t_stats:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Seeded generator of realistic synthetic logs for the benchmarks: time-ordered ISO
+timestamps, mixed levels, stack traces, JSON lines, occasional very long lines and
+non-UTF-8 bytes. The same seed and size always give the same file.
+
+    python benchmarks/loggen.py OUT [--size 10MB|100MB|1GB] [--seed 42]
+"""
+import argparse
+import json
+import os
+import random
+
+LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "INFO", "WARN", "ERROR"]
+SERVICES = ["api", "auth", "billing", "search", "worker", "scheduler"]
+PATHS = ["/api/users", "/api/orders", "/api/v2/items", "/login", "/static/app.js", "/health"]
+SIZES = {"10MB": 10, "100MB": 100, "1GB": 1024}
+START = 1704110400 # 2024-01-01 12:00:00 UTC
+FLUSH_BYTES = 1024 * 1024
+
+def parse_size(text):
+    """'10MB', '1GB' or a plain number of MB -> bytes."""
+    text = text.upper()
+    if text in SIZES: return SIZES[text] * 1024 * 1024
+    if text.endswith("GB"): return int(float(text[:-2]) * 1024 ** 3)
+    return int(float(text[:-2] if text.endswith("MB") else text) * 1024 * 1024)
+
+def _stamp(ms):
+    seconds = START + ms // 1000
+    day, rest = divmod(seconds, 86400)
+    h, rest = divmod(rest, 3600)
+    y, mo, d = 2024, 1, 1 + day - START // 86400 # Even 1 GB spans well under a month
+    return f"{y}-{mo:02d}-{d:02d} {h:02d}:{rest // 60:02d}:{rest % 60:02d}.{ms % 1000:03d}"
+
+def lines(rnd):
+    """Yields the lines (bytes, with newline) of an endless log."""
+    ms, n = 0, 0
+    choice, randrange, random_ = rnd.choice, rnd.randrange, rnd.random
+    while True:
+        ms += randrange(0, 40)
+        n += 1
+        stamp, service = _stamp(ms), choice(SERVICES)
+        roll = random_()
+        if roll < 0.10:
+            status = choice((200, 200, 200, 201, 301, 404, 500, 503))
+            record = {"ts": stamp, "level": "error" if status >= 500 else "info", "service": service,
+                      "path": choice(PATHS), "status": status, "ms": randrange(1, 2000), "req": {"id": n}}
+            yield json.dumps(record).encode() + b"\n"
+            continue
+        level = choice(LEVELS)
+        if roll < 0.15: message = "Heartbeat ok"
+        else: message = f"request id={n} user={randrange(5000)} path={choice(PATHS)} took {randrange(900)}ms"
+        line = f"{stamp} {level:<5} [{service}] {message}".encode()
+        if roll > 0.995: line += " caf\xe9 na\xefve".encode("latin-1") # Non-UTF-8 bytes
+        elif roll > 0.99: line += b" payload=" + b"x" * randrange(2000, 20000) # Long line
+        yield line + b"\n"
+        if level == "ERROR" and roll < 0.5:
+            yield b"Traceback (most recent call last):\n"
+            for depth in range(randrange(2, 8)): yield f'  File "/srv/{service}/handler.py", line {100 + depth}, in handle\n'.encode()
+            yield b"RuntimeError: upstream timeout\n"
+
+def generate(path, size, seed=42):
+    """Writes `size` bytes (rounded up to a whole line) of synthetic log to path."""
+    rnd = random.Random(seed)
+    written, buf = 0, []
+    with open(path, "wb") as f:
+        for line in lines(rnd):
+            buf.append(line)
+            written += len(line)
+            if written >= size or len(buf) >= 20000:
+                f.write(b"".join(buf))
+                buf = []
+            if written >= size: break
+    return path
+
+def cached(size, seed=42, directory=None):
+    """Path of a generated log in the temp directory, generated on first use."""
+    import tempfile
+    path = os.path.join(directory or tempfile.gettempdir(), f"omnilog-bench-{size // (1024 * 1024)}mb-s{seed}.log")
+    if not os.path.exists(path) or os.path.getsize(path) < size: generate(path, size, seed)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out")
+    parser.add_argument("--size", default="10MB", help="10MB, 100MB, 1GB or a number of MB")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(args.out, parse_size(args.size), args.seed)
+
+if __name__ == "__main__":
+    main()
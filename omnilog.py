@@ -1,37 +1,67 @@
+import time
+_STARTED = time.perf_counter() # Reference point of the --startup-time report
+import sys
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support() # Scan workers of the frozen .exe start through this entry point
+    if len(sys.argv) > 1 and sys.argv[1] in ("grep", "filter", "stats", "merge", "patterns"):
+        # `omnilog grep|filter|stats|merge FILE ...` runs headless: leave before any GUI toolkit is imported
+        import omnilog_core
+        sys.exit(omnilog_core.main())
+
+# matplotlib (Statistics), webbrowser (context search) and chardet (encoding detection) are
+# imported where they are first needed, they would otherwise dominate the startup time
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, Menu, messagebox
 from tkinterdnd2 import DND_FILES, TkinterDnD
 import threading
 import os
-import sys
 import re
-import json
-import chardet
-import time
-import webbrowser
-from collections import Counter
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import tkinter.font as tkfont
+from collections import OrderedDict
+from omnilog_core import (AlertEngine, AlertRule, EXPORT_FORMATS, IndexCache, LevelIndex, LineIndex, LineFilter, LineRuns, LogMeta, SearchEngine, SearchMatches, TailWatcher, TaskGroup, TermPattern, THREAD_WORKERS,
+                          TrigramIndex, build_view, candidate_view, export_view, FieldQuery, FieldStore, field_view, iter_text_batches, open_log, open_merged,
+                          parse_time_range, template_view, thread_pool_status, time_view)
 
 # --- Configuration ---
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("dark-blue")
+INDEX_CACHE = IndexCache() # Sidecar indexes: reopening a large log skips the bytes indexed before
+
+# --- Startup Timing ---
+class StartupTimer:
+    """
+    Prints startup milestones to stderr when started with --startup-time.
+    TARGET_FIRST_WINDOW_MS is the time-to-first-window budget documented in the README.
+    """
+    TARGET_FIRST_WINDOW_MS = 1000
+    enabled = False
+    marks = {}
+
+    @classmethod
+    def mark(cls, name):
+        """Records the first occurrence of a milestone, in ms since the interpreter reached omnilog.py."""
+        if not cls.enabled or name in cls.marks: return
+        ms = cls.marks[name] = (time.perf_counter() - _STARTED) * 1000
+        note = ""
+        if name == "first window":
+            note = f" (target {cls.TARGET_FIRST_WINDOW_MS} ms: {'OK' if ms <= cls.TARGET_FIRST_WINDOW_MS else 'MISSED'})"
+        print(f"[startup] {name:<13}{ms:8.1f} ms{note}", file=sys.stderr)
 
 # --- Optimized Line Numbers (Synced Text Widget) ---
 class LineNumberWidget(tk.Text):
     """
     Renders line numbers using a secondary Text widget.
-    Guarantees perfect synchronization with the main text area.
+    Only the numbers of the rendered viewport window are drawn, so the cost
+    does not depend on the size of the file.
     """
     def __init__(self, master, target_widget, **kwargs):
         super().__init__(master, width=6, padx=4, highlightthickness=0, takefocus=0, bd=0,
                          background="#1e1e1e", foreground="#666666", state="disabled", **kwargs)
         self.target_widget = target_widget
-        self.configure(font=("Consolas", 13)) 
-        
-        # Tag configuration for hiding lines (Must match main text behavior)
-        self.tag_config("hidden", elide=True)
+        self.configure(font=("Consolas", 13))
 
         # Disable mouse interaction
         self.bind('<Button-1>', lambda e: "break")
@@ -39,12 +69,13 @@ class LineNumberWidget(tk.Text):
         self.bind('<Double-Button-1>', lambda e: "break")
         self.bind('<Control-Button-1>', lambda e: "break")
 
-    def populate(self, line_count):
-        """Re-populates the line numbers from scratch (1 to N)."""
-        self.configure(state="normal")
+    def populate(self, line_numbers):
+        """Re-populates the widget with the given (1-based) line numbers, one per row."""
+        labels = [str(n) for n in line_numbers]
+        width = max(6, len(labels[-1]) + 1) if labels else 6
+        self.configure(state="normal", width=width)
         self.delete("1.0", "end")
-        line_content = "\n".join(str(i) for i in range(1, line_count + 1))
-        self.insert("1.0", line_content)
+        self.insert("1.0", "\n".join(labels))
         self.configure(state="disabled")
         self.sync_scroll()
 
@@ -53,114 +84,195 @@ class LineNumberWidget(tk.Text):
         yview = self.target_widget.yview()
         self.yview_moveto(yview[0])
 
-# --- Data Management ---
-class LogMeta:
+# --- Syntax Highlighting ---
+class SyntaxHighlighter:
+    """
+    Colors log level keywords with one precompiled alternation regex.
+    Only the lines handed in (the rendered window) are scanned; lines whose level code
+    says they hold no keyword are skipped, and spans are cached per line, so scrolling
+    back or tailing a live log never rescans old lines.
+    """
+    TAGS = {LevelIndex.ERROR: "syntax_error", LevelIndex.WARN: "syntax_warn",
+            LevelIndex.INFO: "syntax_info", LevelIndex.DEBUG: "syntax_debug"}
+    PATTERN = re.compile("|".join(f"(?P<{tag}>{'|'.join(w.decode() for w in LevelIndex.KEYWORDS[level])})"
+                                  for level, tag in TAGS.items()), re.IGNORECASE)
+    SPAN_CACHE_SIZE = 5000
+
     def __init__(self):
-        self.annotations = {} 
+        self._spans = OrderedDict() # LRU of line -> ((tag, start, end), ...) for lines with keywords
 
-    def add_annotation(self, line_index, color=None, note=None):
-        line_key = str(line_index)
-        if line_key not in self.annotations: self.annotations[line_key] = {}
-        if color: self.annotations[line_key]['color'] = color
-        if note: self.annotations[line_key]['note'] = note
-    
-    def get_annotation(self, line_index):
-        return self.annotations.get(str(line_index), {})
-    
-    def get_all_notes(self):
-        return {k: v for k, v in self.annotations.items() if 'note' in v}
+    def spans(self, line, text, level):
+        """Returns the (tag, start col, end col) keyword spans of a line with the given level code."""
+        if level == LevelIndex.NONE: return ()
+        cached = self._spans.get(line)
+        if cached is not None:
+            self._spans.move_to_end(line)
+            return cached
+
+        spans = tuple((m.lastgroup, m.start(), m.end()) for m in self.PATTERN.finditer(text))
+        self._spans[line] = spans
+        if len(self._spans) > self.SPAN_CACHE_SIZE: self._spans.popitem(last=False)
+        return spans
+
+    def invalidate_from(self, line):
+        """Forgets cached spans from a line onwards (e.g. a partial last line that grew)."""
+        for key in [k for k in self._spans if k >= line]: del self._spans[key]
 
 # --- Main Log Tab ---
 class LogTab(ctk.CTkFrame):
-    def __init__(self, master, file_path=None, content=None, title="Untitled", **kwargs):
+    VIEW_MARGIN = 10 # Extra rows rendered below the visible area
+    NOTIFY_INTERVAL = 5 # Seconds between desktop notifications; alerts in between are summed up
+
+    def __init__(self, master, file_path=None, content=None, title="Untitled", max_lines=None, merge_paths=None, **kwargs):
         super().__init__(master, **kwargs)
         self.file_path = file_path
+        self.merge_paths = merge_paths # Merge view: several logs shown as one timeline
         self.file_name = title if not file_path else os.path.basename(file_path)
-        self.content_source = content 
+        self.content_source = content
         self.meta_data = LogMeta()
-        
+        self.highlighter = SyntaxHighlighter()
+
         # State variables
-        self.search_matches = []
+        self.tasks = TaskGroup(title) # Loading, indexing and searches of this tab, on the shared thread pool
+        self.closed = False # Set once destroyed: results still arriving from workers are dropped
+        self.search_matches = SearchMatches()
+        self.search_engine = SearchEngine(self.tasks)
+        self.search_generation = 0 # Drops batches of superseded searches
         self.current_match_index = -1
         self.font_size = 13
-        self.is_watching = False 
-        self.last_file_size = 0
+        self.is_watching = False
+        self.watcher = None
+        self.alerts = None # AlertEngine checking the lines Live Watch appends (None = no alert rules)
+        self._alerts_unnotified = [] # Alerts since the last desktop notification
+        self._notify_after = None
+        self._notified_at = 0
+        self.max_lines = max_lines # Ring-buffer mode: keep only the last N lines (None = all)
         self.total_lines = 0
-        
+        self.encoding = "utf-8"
+        self._reloading = False # Set while a rotated/truncated file is re-indexed
+        self.export_task = None # Export of the view running in the background
+
+        # Virtual viewport state
+        self.line_index = None
+        self._loading = None # Index being opened by the loader, until it is shown
+        self.view_map = None # None = all lines visible, else the LineRuns of the filtered view
+        self.field_query = None # FieldQuery behind the view, also applied to lines appended by Live Watch
+        self.line_filter = None # LineFilter behind the view, likewise applied to appended lines
+        self.filter_view = None # The view before hidden templates are taken out (None = all lines)
+        self.hidden_templates = set() # Template IDs hidden from the Patterns window
+        self.filter_task = None # Filter being computed in the background; its view replaces the current one
+        self.filter_generation = 0 # Drops the results of superseded filters
+        self.view_top = 0 # First view row shown at the top of the widget
+        self.rendered_lines = range(0) # File line index of every rendered row
+        self.cursor_pos = None # (line, col) of the insert cursor, kept across re-renders
+        self._render_pending = False
+
         # Layout
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
 
-        # 1. Text Area
-        self.text_area = ctk.CTkTextbox(self, font=("Consolas", self.font_size), activate_scrollbars=True, undo=True, wrap="none")
-        
+        # 1. Text Area (only ever holds the visible window of lines)
+        self.text_area = ctk.CTkTextbox(self, font=("Consolas", self.font_size), activate_scrollbars=False, wrap="none")
+
         # 2. Line Numbers
         self.line_numbers = LineNumberWidget(self, self.text_area._textbox)
         self.line_numbers.grid(row=0, column=0, sticky="ns")
-        
-        # 3. Place Text Area
+
+        # 3. Place Text Area & Scrollbars (vertical one drives the virtual viewport)
         self.text_area.grid(row=0, column=1, sticky="nsew", padx=(0, 5), pady=5)
         self.text_area.configure(state="disabled", fg_color="#2b2b2b")
+        self.v_scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.v_scrollbar.grid(row=0, column=2, sticky="ns", pady=5)
+        self.h_scrollbar = ctk.CTkScrollbar(self, orientation="horizontal", command=self.text_area._textbox.xview)
+        self.h_scrollbar.grid(row=1, column=1, sticky="ew", padx=(0, 5))
+        self.text_area._textbox.configure(xscrollcommand=self.h_scrollbar.set)
 
         # 4. Tags & UI Setup
         self._configure_tags()
         self.status_bar = ctk.CTkFrame(self, height=30, fg_color="transparent")
-        self.status_bar.grid(row=1, column=0, columnspan=2, sticky="ew", padx=10, pady=(0, 5))
+        self.status_bar.grid(row=2, column=0, columnspan=3, sticky="ew", padx=10, pady=(0, 5))
         self._setup_status_bar()
         self._setup_proxy_events()
         self.create_context_menu()
-        
+
         # 5. Load Content
-        if self.file_path: 
-            try: self.last_file_size = os.path.getsize(self.file_path)
-            except: pass
+        if self.file_path or self.merge_paths:
             self.start_loading_file()
-        elif self.content_source: 
-            self._update_text_area(self.content_source, "Clipboard")
+        elif self.content_source:
+            self._update_text_area(LineIndex.from_text(self.content_source), "Clipboard")
+
+    def destroy(self):
+        # Stop every worker and release the indexes at once, even while windows still refer to this tab
+        self.closed = True
+        self.is_watching = False
+        self.tasks.cancel()
+        self.search_engine.cancel()
+        if self._notify_after: self.after_cancel(self._notify_after)
+        if self.watcher: self.watcher.stop()
+        for index in (self.line_index, self._loading):
+            if index: index.close()
+        self.line_index = self._loading = self.view_map = self.filter_view = None
+        self.search_matches = SearchMatches()
+        self.highlighter = SyntaxHighlighter()
+        super().destroy()
+
+    def _post(self, callback):
+        """Runs callback on the UI thread (from a worker), unless the tab is closed by then."""
+        def run():
+            if not self.closed: callback()
+        try: self.after(0, run)
+        except (RuntimeError, tk.TclError): pass # Main loop or widget already gone
 
     def _setup_status_bar(self):
         self.lbl_status = ctk.CTkLabel(self.status_bar, text="Loading...", text_color="orange", font=("Arial", 11))
         self.lbl_status.pack(side="left")
+        self.btn_cancel_export = ctk.CTkButton(self.status_bar, text="✖ Cancel", width=70, height=20, fg_color="#8B0000", command=self.cancel_export) # Shown while exporting
         self.lbl_note_display = ctk.CTkLabel(self.status_bar, text="", text_color="#aaaaaa", font=("Arial", 11, "italic"))
         self.lbl_note_display.pack(side="left", padx=20)
         self.lbl_cursor = ctk.CTkLabel(self.status_bar, text="Ln 1, Col 1", text_color="gray", font=("Arial", 11))
         self.lbl_cursor.pack(side="right")
+        self.lbl_alerts = ctk.CTkLabel(self.status_bar, text="", text_color="#ff4d4d", font=("Arial", 11, "bold"))
+        self.lbl_alerts.pack(side="right", padx=20)
 
     def _configure_tags(self):
-        # Hidden tag (Synchronized name for both widgets)
-        self.text_area.tag_config("hidden", elide=True)
-        
         # Highlights
-        self.text_area.tag_config("search_highlight", background="#D4AF37", foreground="black") 
-        self.text_area.tag_config("search_current", background="#FF4500", foreground="white") 
+        self.text_area.tag_config("search_highlight", background="#D4AF37", foreground="black")
+        self.text_area.tag_config("search_current", background="#FF4500", foreground="white")
         self.text_area.tag_config("has_note", underline=True)
-        
+
         # User Marks
-        self.text_area.tag_config("mark_red", background="#4a0e0e")    
-        self.text_area.tag_config("mark_blue", background="#0e2a4a")   
-        self.text_area.tag_config("mark_yellow", background="#4a4a0e") 
-        
+        self.text_area.tag_config("mark_red", background="#4a0e0e")
+        self.text_area.tag_config("mark_blue", background="#0e2a4a")
+        self.text_area.tag_config("mark_yellow", background="#4a4a0e")
+
         # Syntax
-        self.text_area.tag_config("syntax_error", foreground="#ff6b6b") 
-        self.text_area.tag_config("syntax_warn", foreground="#ffa502")  
-        self.text_area.tag_config("syntax_info", foreground="#7bed9f")  
-        self.text_area.tag_config("syntax_debug", foreground="#70a1ff") 
+        self.text_area.tag_config("syntax_error", foreground="#ff6b6b")
+        self.text_area.tag_config("syntax_warn", foreground="#ffa502")
+        self.text_area.tag_config("syntax_info", foreground="#7bed9f")
+        self.text_area.tag_config("syntax_debug", foreground="#70a1ff")
+        self.text_area.tag_config("source_badge", foreground="#a29bfe")
 
     def _setup_proxy_events(self):
-        """Hooks scrolling and inputs to sync line numbers."""
+        """Hooks scrolling and inputs to drive the virtual viewport."""
         tk_text = self.text_area._textbox
-        
-        # Scroll Sync
-        def sync(*args):
-            self.line_numbers.sync_scroll()
-        
-        tk_text.bind("<MouseWheel>", lambda e: self.after_idle(sync))
-        tk_text.bind("<Button-4>", lambda e: self.after_idle(sync))
-        tk_text.bind("<Button-5>", lambda e: self.after_idle(sync))
-        
-        # Override Scrollbar command (CustomTkinter specific)
-        # We hook into the scrollbar callback if needed, but MouseWheel covers most use cases.
-        
+
+        # Scrolling moves the viewport instead of the widget content
+        for widget in (tk_text, self.line_numbers):
+            widget.bind("<MouseWheel>", self.on_mouse_wheel)
+            widget.bind("<Button-4>", self.on_mouse_wheel)
+            widget.bind("<Button-5>", self.on_mouse_wheel)
+        tk_text.bind("<Configure>", lambda e: self.request_render())
+
+        # Keyboard navigation past the rendered window
+        tk_text.bind("<Prior>", lambda e: self.scroll_rows(-self._visible_rows()) or "break")
+        tk_text.bind("<Next>", lambda e: self.scroll_rows(self._visible_rows()) or "break")
+        tk_text.bind("<Control-Home>", lambda e: self.scroll_to_row(0) or "break")
+        tk_text.bind("<Control-End>", lambda e: self.scroll_to_row(self._view_len()) or "break")
+        tk_text.bind("<Up>", self.on_key_up)
+        tk_text.bind("<Down>", self.on_key_down)
+        tk_text.bind("<F2>", lambda e: self.goto_mark(1) or "break")
+        tk_text.bind("<Shift-F2>", lambda e: self.goto_mark(-1) or "break")
+
         # Interaction
         tk_text.bind("<KeyRelease>", self.on_ui_interaction)
         tk_text.bind("<ButtonRelease-1>", self.on_ui_interaction)
@@ -168,9 +280,29 @@ class LogTab(ctk.CTkFrame):
         self.text_area.bind("<Button-3>", self.show_context_menu)
 
     def on_ui_interaction(self, event=None):
+        # The Text widget may have scrolled inside the margin (e.g. cursor keys); re-anchor the viewport
+        first_row = int(self.text_area.index("@0,0").split('.')[0])
+        if first_row > 1:
+            self.view_top += first_row - 1
+            self._render_viewport()
         self.line_numbers.sync_scroll()
         self.update_cursor_info()
 
+    def on_mouse_wheel(self, event):
+        if event.num == 4: delta = -3
+        elif event.num == 5: delta = 3
+        elif abs(event.delta) >= 120: delta = -3 * int(event.delta / 120)
+        else: delta = -event.delta
+        self.scroll_rows(delta)
+        return "break"
+
+    def on_key_up(self, event):
+        # Scroll one row first, the default binding then moves the cursor onto the revealed line
+        if self.text_area.index(tk.INSERT).split('.')[0] == "1": self.scroll_rows(-1)
+
+    def on_key_down(self, event):
+        if int(self.text_area.index(tk.INSERT).split('.')[0]) >= self._visible_rows(): self.scroll_rows(1)
+
     def on_zoom_scroll(self, event):
         if event.delta > 0: self.change_font_size(1)
         else: self.change_font_size(-1)
@@ -181,8 +313,8 @@ class LogTab(ctk.CTkFrame):
         self.font_size = max(8, min(self.font_size, 30)) # Clamp between 8 and 30
         new_font = ("Consolas", self.font_size)
         self.text_area.configure(font=new_font)
-        self.line_numbers.configure(font=new_font) 
-        self.line_numbers.sync_scroll()
+        self.line_numbers.configure(font=new_font)
+        self.request_render()
 
     def create_context_menu(self):
         self.context_menu = Menu(self, tearoff=0, bg="#2b2b2b", fg="white", activebackground="#1f538d")
@@ -196,104 +328,364 @@ class LogTab(ctk.CTkFrame):
         self.context_menu.add_separator()
         self.context_menu.add_command(label="Add Note", command=self.add_note_dialog)
         self.context_menu.add_command(label="Remove Mark", command=self.clear_mark)
+        self.context_menu.add_separator()
+        self.context_menu.add_command(label="Next Mark (F2)", command=lambda: self.goto_mark(1))
+        self.context_menu.add_command(label="Previous Mark (Shift+F2)", command=lambda: self.goto_mark(-1))
 
     # --- Loading Logic ---
     def start_loading_file(self):
-        threading.Thread(target=self._load_file_content, daemon=True).start()
+        self.tasks.submit("load", self._load_file_content)
 
-    def _load_file_content(self):
+    def _load_file_content(self, task):
         try:
-            with open(self.file_path, 'rb') as f:
-                raw = f.read(100000)
-                enc = chardet.detect(raw)['encoding'] or 'utf-8'
-            with open(self.file_path, 'r', encoding=enc, errors='replace') as f:
-                content = f.read()
-            self.after(0, lambda: self._update_text_area(content, enc))
+            if self.merge_paths: index, enc = open_merged(self.merge_paths)
+            else: index, enc = open_log(self.file_path, cache=INDEX_CACHE)
+            self._loading = index
+            if task.stopped(): index.close(); return # Closed while opening
+            index.max_lines = self.max_lines
+            if self.max_lines: index.trim(self.max_lines) # A cached index comes complete
+            # The first screen is shown after the first chunk, the rest is indexed in the background
+            index.build(on_progress=lambda done: self._post(lambda: self._on_index_progress(index, enc, done)), stopped=task.stopped)
+            if task.stopped(): return
+            INDEX_CACHE.save(index)
+            self._build_trigrams(index, task)
         except Exception as e:
-            self.after(0, lambda: self.lbl_status.configure(text=f"Error: {str(e)}", text_color="red"))
-
-    def _update_text_area(self, content, encoding):
-        self.text_area.configure(state="normal")
-        self.text_area.insert("0.0", content)
-        self._apply_syntax_coloring()
-        self.text_area.configure(state="disabled")
-        
-        # Calculate lines
-        try: self.total_lines = int(self.text_area.index('end-1c').split('.')[0])
-        except: self.total_lines = 0
-        
-        self.line_numbers.populate(self.total_lines)
+            if not task.stopped(): self._post(lambda: self.lbl_status.configure(text=f"Error: {str(e)}", text_color="red"))
+
+    def _build_trigrams(self, index, task):
+        """Loader task: indexes the trigrams of a large log, so later searches only read candidate lines."""
+        if not TrigramIndex.worthwhile(index): return
+        if index.trigrams is None: index.trigrams = TrigramIndex() # Searches use it while it grows
+        try: index.trigrams.extend(index, stopped=task.stopped) # Also stops if the index is closed
+        except (OSError, ValueError):
+            if not index.closed: raise
+            return # Tab closed or file reloaded meanwhile
+        if not index.closed: INDEX_CACHE.save(index)
+
+    def _update_text_area(self, index, encoding):
+        if index is self._loading: self._loading = None
+        if self.line_index and self.line_index is not index:
+            # Reloaded after rotation/truncation: nothing computed for the old file applies any more
+            self.line_index.close()
+            self._reset_view_state()
+        self.line_index = index
+        self.encoding = encoding
+        self.total_lines = index.line_count
+        self._render_viewport()
+        StartupTimer.mark("first screen")
         self.update_status_label(encoding)
 
-    def update_status_label(self, encoding="utf-8"):
-        info = f"Ready ({encoding}) • {self.total_lines} lines"
+    def _on_index_progress(self, index, encoding, done):
+        if self.line_index is not index:
+            self._update_text_area(index, encoding)
+        else:
+            self.total_lines = index.line_count
+            self._render_viewport()
+        if not done:
+            self.lbl_status.configure(text=f"Indexing... {self.total_lines} lines ({index.progress:.0%})", text_color="orange")
+        else:
+            self._reloading = False
+            self.update_status_label(encoding)
+
+    def _reset_view_state(self):
+        self._cancel_filter()
+        self.view_map = self.filter_view = None
+        self.field_query = self.line_filter = None
+        self.hidden_templates = set() # Template IDs belong to the old file
+        self.view_top = 0
+        self.rendered_lines = range(0)
+        self.cursor_pos = None
+        self.search_generation += 1
+        self.search_engine.cancel()
+        self.search_matches = SearchMatches()
+        self.current_match_index = -1
+        self.highlighter = SyntaxHighlighter()
+
+    def update_status_label(self, encoding=None):
+        info = f"Ready ({encoding or self.encoding}) • {self.total_lines} lines"
         if self.file_path:
             try: fs = os.path.getsize(self.file_path) / 1024
             except: fs = 0
             info += f" • {fs:.1f} KB"
+        if self.max_lines: info += f" • keeping last {self.max_lines:,}"
         if self.is_watching: info += " • 🔴 LIVE"
         self.lbl_status.configure(text=info, text_color="#2CC985" if not self.is_watching else "#ff4d4d")
 
+    # --- Virtual Viewport ---
+    def _view_len(self):
+        if self.view_map is not None: return len(self.view_map)
+        return self.line_index.line_count - self.line_index.first_line if self.line_index else 0
+
+    def _view_slice(self, start, stop):
+        """Returns the file line indices shown at view rows [start, stop)."""
+        if self.view_map is not None: return self.view_map[start:stop]
+        first = self.line_index.first_line
+        return range(first + start, first + min(stop, self._view_len()))
+
+    def _view_row_of_line(self, line):
+        """Returns the view row of a file line (or of the next visible line if it is hidden)."""
+        if self.view_map is None: return max(0, line - self.line_index.first_line)
+        return self.view_map.row_of_line(line)
+
+    def _visible_rows(self):
+        tk_text = self.text_area._textbox
+        info = tk_text.dlineinfo("1.0")
+        if info: line_height = info[3]
+        else: line_height = tkfont.Font(font=tk_text.cget("font")).metrics("linespace")
+        return max(1, tk_text.winfo_height() // max(1, line_height))
+
+    def _line_at_index(self, index):
+        """Maps a Text widget index to (file line, col), or None outside the rendered window."""
+        row, col = self.text_area.index(index).split('.')
+        row = int(row) - 1
+        if 0 <= row < len(self.rendered_lines): return self.rendered_lines[row], int(col)
+        return None
+
+    def request_render(self):
+        """Coalesces several render requests into a single redraw."""
+        if self._render_pending: return
+        self._render_pending = True
+        self.after_idle(self._render_viewport)
+
+    def _render_viewport(self):
+        """Renders only the lines around the current view position into the Text widget."""
+        self._render_pending = False
+        if not self.line_index: return
+        tk_text = self.text_area._textbox
+        if self.rendered_lines: self.cursor_pos = self._line_at_index(tk.INSERT) or self.cursor_pos
+
+        rows = self._visible_rows()
+        total = self._view_len()
+        self.view_top = max(0, min(self.view_top, total - rows))
+        lines = self._view_slice(self.view_top, self.view_top + rows + self.VIEW_MARGIN)
+        texts = self.line_index.get_text_at(lines)
+
+        x_view = tk_text.xview()[0]
+        self.text_area.configure(state="normal")
+        self.text_area.delete("1.0", "end")
+        self.text_area.insert("1.0", "\n".join(texts))
+        self.rendered_lines = lines
+        self._apply_syntax_coloring(texts)
+        self._apply_annotation_tags()
+        self._apply_search_tags()
+        self.text_area.configure(state="disabled")
+        tk_text.xview_moveto(x_view)
+        tk_text.yview_moveto(0)
+        self._restore_cursor()
+
+        self.line_numbers.populate(n + 1 for n in lines)
+        if total: self.v_scrollbar.set(self.view_top / total, min(1.0, (self.view_top + rows) / total))
+        else: self.v_scrollbar.set(0, 1)
+
+    def _restore_cursor(self):
+        index = "1.0"
+        if self.cursor_pos:
+            line, col = self.cursor_pos
+            try: index = f"{self.rendered_lines.index(line) + 1}.{col}"
+            except ValueError: pass
+        self.text_area._textbox.mark_set(tk.INSERT, index)
+
+    def scroll_rows(self, delta):
+        self.scroll_to_row(self.view_top + delta)
+
+    def scroll_to_row(self, row):
+        self.view_top = row
+        self._render_viewport()
+
+    def scroll_to_line(self, line):
+        """Brings a file line into view, centering it if it is currently off-screen."""
+        row = self._view_row_of_line(line)
+        rows = self._visible_rows()
+        if not (self.view_top <= row < self.view_top + rows): self.view_top = row - rows // 2
+        self._render_viewport()
+
+    def _on_scrollbar(self, action, value, unit="units"):
+        if action == "moveto": self.view_top = int(float(value) * self._view_len())
+        elif action == "scroll": self.view_top += int(value) * (self._visible_rows() if unit == "pages" else 1)
+        self._render_viewport()
+
+    def start_export(self, path):
+        """
+        Writes the lines of the current view to path in the background, as TXT, JSONL or
+        CSV by extension, streamed from the index in batches with their line number, level,
+        mark and note. Progress shows in the status bar; a cancelled export is deleted.
+        """
+        if not self.line_index: return
+        self.cancel_export()
+        view = None
+        if self.view_map is not None:
+            view = LineRuns() # Snapshot: Live Watch keeps extending the view while the export runs
+            view.extend(self.view_map)
+        fmt = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), "txt")
+        self.export_task = self.tasks.submit("export", self._export, self.line_index, view, path, fmt)
+        if self.export_task: self.btn_cancel_export.pack(side="left", padx=10)
+
+    def cancel_export(self):
+        if self.export_task: self.export_task.cancel()
+
+    def _export(self, task, index, view, path, fmt):
+        def progress(done, total):
+            self._post(lambda: self.lbl_status.configure(text=f"Exporting... {done:,} / {total:,} lines ({done / max(1, total):.0%})", text_color="orange"))
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                written = export_view(index, f, fmt, view, self.meta_data, stopped=task.stopped, on_progress=progress)
+            if task.stopped():
+                os.remove(path)
+                written = None
+            error = None
+        except (OSError, ValueError) as e: written, error = None, e
+        self._post(lambda: self._on_export_done(task, path, written, error))
+
+    def _on_export_done(self, task, path, written, error):
+        if task is not self.export_task: return # Superseded by a newer export
+        self.export_task = None
+        self.btn_cancel_export.pack_forget()
+        self.update_status_label()
+        if error: messagebox.showerror("Export", f"Could not export {os.path.basename(path)}: {error}")
+        elif written is not None: messagebox.showinfo("Export", f"{written:,} lines saved to {os.path.basename(path)}.")
+
     # --- Tail -f Logic ---
     def toggle_live_watch(self, active):
-        self.is_watching = active
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        self.is_watching = active and bool(self.file_path)
+        if self.is_watching:
+            try: self.watcher = TailWatcher(self.file_path, on_change=self._on_tail_change, on_reset=self._on_tail_reset)
+            except OSError as e:
+                self.is_watching = False
+                self.lbl_status.configure(text=f"Error: {str(e)}", text_color="red")
+                return
+            if self.alerts and self.line_index: self.alerts.start(self.line_index)
+            self.watcher.start()
         self.update_status_label()
-        if self.is_watching and self.file_path:
-            threading.Thread(target=self._watch_loop, daemon=True).start()
-
-    def _watch_loop(self):
-        while self.is_watching and self.file_path:
-            try:
-                if not os.path.exists(self.file_path): break
-                current_size = os.path.getsize(self.file_path)
-                if current_size > self.last_file_size:
-                    with open(self.file_path, 'r', encoding='utf-8', errors='replace') as f:
-                        f.seek(self.last_file_size)
-                        new_content = f.read()
-                        self.last_file_size = current_size
-                        if new_content:
-                            self.after(0, lambda: self._append_content(new_content))
-                time.sleep(2)
-            except: break
-
-    def _append_content(self, content):
-        self.text_area.configure(state="normal")
-        self.text_area.insert("end", content)
-        self._apply_syntax_coloring()
-        self.text_area.see("end")
-        self.text_area.configure(state="disabled")
-        
-        # Update lines count and number widget
-        try: self.total_lines = int(self.text_area.index('end-1c').split('.')[0])
-        except: pass
-        self.line_numbers.populate(self.total_lines)
+
+    def set_alert_rules(self, rules):
+        """Checks the lines appended from now on against the alert rules (an empty list turns alerts off)."""
+        self.alerts = AlertEngine(rules) if rules else None
+        if self.alerts and self.line_index: self.alerts.start(self.line_index)
+        self.lbl_alerts.configure(text="")
+
+    def _on_tail_change(self):
+        # Watcher thread: index the appended bytes, then hand the dirty range to the UI
+        index = self.line_index
+        if not index or self._reloading or self.closed: return
+        dirty_from = index.line_count - 1 # The previous last line may have been partial
+        index.refresh()
+        alerts = self.alerts.scan(index) if self.alerts else None # One pass over the new lines for all rules
+        self._post(lambda: self._append_content(dirty_from))
+        if alerts: self._post(lambda: self._on_alerts(alerts))
+
+    def _on_alerts(self, alerts):
+        # Every alert marks its line, unless the user already marked or annotated it
+        for line, rule in alerts:
+            if not self.meta_data.get_annotation(line + 1): self.meta_data.add_annotation(line + 1, color="red", note=f"🔔 {rule.text}")
+        if self.rendered_lines and alerts[-1][0] >= self.rendered_lines[0] and alerts[0][0] <= self.rendered_lines[-1]: self.request_render()
+        self._alerts_unnotified.extend(alerts)
+        if self._notify_after is None:
+            delay = max(0, self._notified_at + self.NOTIFY_INTERVAL - time.monotonic())
+            self._notify_after = self.after(int(delay * 1000), self._notify_alerts)
+        self._update_alert_label()
+
+    def _update_alert_label(self):
+        if self.alerts: self.lbl_alerts.configure(text=f"🔔 {self.alerts.total:,} alerts • {self.alerts.recent(60):,} in the last minute")
+
+    def _notify_alerts(self):
+        self._notify_after = None
+        if self.closed or not self._alerts_unnotified: return
+        alerts, self._alerts_unnotified = self._alerts_unnotified, []
+        self._notified_at = time.monotonic()
+        line, rule = alerts[0]
+        message = f"{rule.text} (line {line + 1})" + (f" and {len(alerts) - 1} more" if len(alerts) > 1 else "")
+        if not desktop_notify(f"Omnilog alert: {self.file_name}", message): self.bell()
+        self._update_alert_label()
+
+    def _on_tail_reset(self):
+        self._post(self._reload_file)
+
+    def _reload_file(self):
+        """Re-indexes the file from scratch after it was rotated or truncated."""
+        if self._reloading: return
+        self._reloading = True
+        if self.alerts: self.alerts.next_line = 0 # The new file is all new lines
+        self.lbl_status.configure(text="File rotated or truncated, reloading...", text_color="orange")
+        self.start_loading_file()
+
+    def _append_content(self, dirty_from):
+        self.highlighter.invalidate_from(dirty_from)
+        count = self.line_index.line_count
+        if self.view_map is not None: self._extend_view(dirty_from + 1)
+        self._trim_view()
+        self.total_lines = count
+        self.scroll_to_row(self._view_len())
         self.update_status_label()
 
+    def set_max_lines(self, max_lines):
+        """Switches ring-buffer mode: only the last max_lines lines are kept (None = all)."""
+        self.max_lines = max_lines
+        index = self.line_index
+        if index:
+            index.max_lines = max_lines
+            if max_lines: index.trim(max_lines)
+            self._trim_view()
+            self._render_viewport()
+        self.update_status_label()
+
+    def _trim_view(self):
+        """Drops view rows and matches of lines trimmed from the head of the index."""
+        first = self.line_index.first_line
+        if self.view_map is not None: self.view_map.trim(first)
+        if self.filter_view not in (None, self.view_map): self.filter_view.trim(first)
+        dropped = self.search_matches.trim(first)
+        if dropped: self.current_match_index = max(-1, self.current_match_index - dropped)
+
     # --- Syntax & Styling ---
-    def _apply_syntax_coloring(self):
-        patterns = {
-            "syntax_error": ["ERROR", "CRITICAL", "FATAL", "FAIL", "EXCEPTION"],
-            "syntax_warn": ["WARN", "WARNING"],
-            "syntax_info": ["INFO", "SUCCESS"],
-            "syntax_debug": ["DEBUG", "TRACE"]
-        }
-        for tag, keywords in patterns.items():
-            for kw in keywords:
-                start_pos = "1.0"
-                while True:
-                    start_pos = self.text_area.search(kw, start_pos, stopindex="end", nocase=True)
-                    if not start_pos: break
-                    end_pos = f"{start_pos}+{len(kw)}c" 
-                    self.text_area.tag_add(tag, start_pos, end_pos)
-                    start_pos = end_pos
+    def _apply_syntax_coloring(self, texts):
+        """Tags keyword spans of the rendered rows, one batched tag_add per tag."""
+        ranges = {}
+        for row, (line, text) in enumerate(zip(self.rendered_lines, texts), 1):
+            for tag, start, end in self.highlighter.spans(line, text, self.line_index.levels.code(line)):
+                ranges.setdefault(tag, []).extend((f"{row}.{start}", f"{row}.{end}"))
+            # Merge view: every line starts with its [file name] badge
+            badge_end = text.find("] ") + 1 if self.merge_paths and text.startswith("[") else 0
+            if badge_end: ranges.setdefault("source_badge", []).extend((f"{row}.0", f"{row}.{badge_end}"))
+        for tag, indices in ranges.items(): self.text_area._textbox.tag_add(tag, *indices)
+
+    def _apply_annotation_tags(self):
+        if not self.rendered_lines: return
+        meta, first, last = self.meta_data, self.rendered_lines[0] + 1, self.rendered_lines[-1] + 2
+        if meta.count_range(first, last) <= len(self.rendered_lines):
+            # One range slice of the sorted store (annotations are keyed by 1-based line numbers)
+            rows = {line + 1: row for row, line in enumerate(self.rendered_lines, 1)}
+            marked = [(rows[line], item) for line, item in meta.in_range(first, last) if line in rows]
+        else: # A sparse filtered view spanning many marks: look up the rendered rows instead
+            marked = [(row, item) for row, item in enumerate(map(meta.get_annotation, (line + 1 for line in self.rendered_lines)), 1) if item]
+        for row, item in marked:
+            if item.color: self.text_area.tag_add(f"mark_{item.color}", f"{row}.0", f"{row}.end")
+            if item.note: self.text_area.tag_add("has_note", f"{row}.0", f"{row}.end")
+
+    def _apply_search_tags(self):
+        matches = self.search_matches
+        if not matches or not self.rendered_lines: return
+        first, last = self.rendered_lines[0], self.rendered_lines[-1]
+        rows = {line: row for row, line in enumerate(self.rendered_lines, 1)}
+        i = matches.first_from_line(first)
+        while i < len(matches) and matches.lines[i] <= last:
+            line, start, end = matches[i]
+            if line in rows:
+                tag = "search_current" if i == self.current_match_index else "search_highlight"
+                self.text_area.tag_add(tag, f"{rows[line]}.{start}", f"{rows[line]}.{end}")
+            i += 1
 
     def update_cursor_info(self):
         try:
-            idx = self.text_area.index(tk.INSERT)
-            row, col = idx.split('.')
-            self.lbl_cursor.configure(text=f"Ln {row}, Col {int(col)+1}")
-            meta = self.meta_data.get_annotation(row)
-            self.lbl_note_display.configure(text=f"📝 {meta['note']}" if 'note' in meta else "")
+            pos = self._line_at_index(tk.INSERT)
+            if not pos: return
+            self.cursor_pos = pos
+            line, col = pos
+            self.lbl_cursor.configure(text=f"Ln {line + 1}, Col {col + 1}")
+            meta = self.meta_data.get_annotation(line + 1)
+            self.lbl_note_display.configure(text=f"📝 {meta.note}" if meta and meta.note else "")
         except: pass
 
     # --- Context Actions ---
@@ -304,142 +696,444 @@ class LogTab(ctk.CTkFrame):
     def search_google(self):
         try:
             sel = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
-            if sel: webbrowser.open(f"https://www.google.com/search?q={sel}")
+            if sel:
+                import webbrowser
+                webbrowser.open(f"https://www.google.com/search?q={sel}")
         except: pass
 
     def add_mark(self, tag, color):
-        line = self.text_area.index(tk.INSERT).split('.')[0]
-        start, end = f"{line}.0", f"{line}.end"
-        for t in ["mark_red", "mark_blue", "mark_yellow"]: self.text_area.tag_remove(t, start, end)
-        self.text_area.tag_add(tag, start, end)
-        self.meta_data.add_annotation(line, color=color)
+        pos = self._line_at_index(tk.INSERT)
+        if not pos: return
+        self.meta_data.add_annotation(pos[0] + 1, color=color)
+        self._render_viewport()
 
     def clear_mark(self):
-        line = self.text_area.index(tk.INSERT).split('.')[0]
-        for t in ["mark_red", "mark_blue", "mark_yellow", "has_note"]:
-            self.text_area.tag_remove(t, f"{line}.0", f"{line}.end")
+        pos = self._line_at_index(tk.INSERT)
+        if not pos: return
+        self.meta_data.clear_annotation(pos[0] + 1)
+        self._render_viewport()
+        self.lbl_note_display.configure(text="")
+
+    def goto_mark(self, direction):
+        """Moves the cursor to the next (1) or previous (-1) marked or noted line. O(log n) per step."""
+        if not self.line_index: return
+        pos = self.cursor_pos or (self.rendered_lines[0] if self.rendered_lines else 0, 0)
+        line = self.meta_data.next_line(pos[0] + 1, direction)
+        while line is not None and self.view_map is not None and line - 1 not in self.view_map:
+            line = self.meta_data.next_line(line, direction) # Hidden by the filter: skip
+        if line is None or line > self.line_index.line_count: return
+        self.cursor_pos = (line - 1, 0)
+        self.scroll_to_line(line - 1)
 
     def add_note_dialog(self):
-        line = self.text_area.index(tk.INSERT).split('.')[0]
+        pos = self._line_at_index(tk.INSERT)
+        if not pos: return
+        line = pos[0] + 1
         d = ctk.CTkInputDialog(text=f"Note for line {line}:", title="Add Note")
         txt = d.get_input()
         if txt:
             self.meta_data.add_annotation(line, note=txt)
-            self.text_area.tag_add("has_note", f"{line}.0", f"{line}.end")
+            self._render_viewport()
             self.lbl_note_display.configure(text=f"📝 {txt}")
 
     # --- Search & Filter Implementation ---
-    def run_search(self, term, use_regex=False):
-        self.text_area.tag_remove("search_highlight", "1.0", "end")
-        self.text_area.tag_remove("search_current", "1.0", "end")
-        self.search_matches = []
+    @staticmethod
+    def _compile_term(term, use_regex):
+        try: return TermPattern(term, use_regex)
+        except re.error: return None
+
+    def run_search(self, term, use_regex=False, on_progress=None):
+        """
+        Starts a background search over the visible lines, cancelling the previous one.
+        on_progress(match count, done) is called on the UI thread as matches stream in.
+        """
+        self.search_generation += 1
+        self.search_matches = SearchMatches()
         self.current_match_index = -1
-        
-        if not term: return 0
-        
-        pos = "1.0"
-        while True:
-            # Tkinter search returns the start position
-            # We use 'count' variable to get accurate match length, especially for Regex
-            count_var = tk.IntVar()
-            pos = self.text_area.search(term, pos, stopindex="end", nocase=True, regexp=use_regex, count=count_var)
-            
-            if not pos: break
-            
-            match_len = count_var.get()
-            if match_len == 0: match_len = 1 # Safety fallback
-            
-            end = f"{pos}+{match_len}c"
-            self.text_area.tag_add("search_highlight", pos, end)
-            self.search_matches.append((pos, end))
-            pos = end
-            
-        return len(self.search_matches)
+        self._render_viewport()
+
+        pattern = self._compile_term(term, use_regex) if term else None
+        if not pattern or not self.line_index:
+            self.search_engine.cancel()
+            if on_progress: on_progress(0, True)
+            return
+
+        generation = self.search_generation
+        def deliver(batch, done):
+            if generation != self.search_generation: return
+            self.search_matches.extend(batch)
+            # Only redraw if the new matches touch the rendered window
+            if batch and self.rendered_lines and batch.lines[0] <= self.rendered_lines[-1] and batch.lines[-1] >= self.rendered_lines[0]:
+                self.request_render()
+            if on_progress: on_progress(len(self.search_matches), done)
+
+        # With a trigram index, only the lines that can contain the term are read
+        view = candidate_view(self.line_index, pattern, self.view_map)
+        self.search_engine.start(pattern, iter_text_batches(self.line_index, view),
+                                 on_batch=lambda batch: self._post(lambda: deliver(batch, False)),
+                                 on_done=lambda batch: self._post(lambda: deliver(batch, True)))
 
     def cycle_matches(self, direction):
         if not self.search_matches: return 0, 0
         self.current_match_index += direction
         if self.current_match_index >= len(self.search_matches): self.current_match_index = 0
         elif self.current_match_index < 0: self.current_match_index = len(self.search_matches) - 1
-        
-        self.text_area.tag_remove("search_current", "1.0", "end")
-        start, end = self.search_matches[self.current_match_index]
-        self.text_area.tag_add("search_current", start, end)
-        self.text_area.see(start)
+
+        self.scroll_to_line(self.search_matches[self.current_match_index][0])
         return self.current_match_index + 1, len(self.search_matches)
 
     def filter_by_term_only(self, term, use_regex=False):
-        """Hides lines that do not contain the term in both Text area and Line Numbers."""
-        self.text_area.configure(state="normal")
-        self.line_numbers.configure(state="normal")
-        
-        # Reset visibility
-        self.text_area.tag_remove("hidden", "1.0", "end")
-        self.line_numbers.tag_remove("hidden", "1.0", "end")
-        
-        if not term:
-            self._finalize_filter()
-            return
-            
-        line_count = int(self.text_area.index('end-1c').split('.')[0])
-        
-        for i in range(1, line_count + 1):
-            line_text = self.text_area.get(f"{i}.0", f"{i}.end")
-            match = False
-            try:
-                if use_regex:
-                    if re.search(term, line_text, re.IGNORECASE): match = True
-                else:
-                    if term.lower() in line_text.lower(): match = True
-            except: pass # Regex error fallback
-            
-            if not match:
-                self.text_area.tag_add("hidden", f"{i}.0", f"{i+1}.0")
-                self.line_numbers.tag_add("hidden", f"{i}.0", f"{i+1}.0")
-        
-        self._finalize_filter()
+        """Restricts the view to the lines that contain the term."""
+        try: self._apply_filter(LineFilter(include=term, use_regex=use_regex))
+        except re.error: pass # Regex error: keep the current view
 
     def apply_advanced_filter(self, levels, exclude_text):
-        self.text_area.configure(state="normal")
-        self.line_numbers.configure(state="normal")
-        
-        self.text_area.tag_remove("hidden", "1.0", "end")
-        self.line_numbers.tag_remove("hidden", "1.0", "end")
-
-        level_map = {
-            "ERROR": ["ERROR", "CRITICAL", "FATAL", "FAIL", "EXCEPTION", "404", "500"],
-            "WARN": ["WARN", "WARNING"],
-            "INFO": ["INFO"],
-            "DEBUG": ["DEBUG", "TRACE"]
-        }
-        allowed_keywords = []
-        for lvl in levels: allowed_keywords.extend(level_map.get(lvl, []))
-        
-        line_count = int(self.text_area.index('end-1c').split('.')[0])
-        for i in range(1, line_count + 1):
-            line_text = self.text_area.get(f"{i}.0", f"{i}.end").upper()
-            should_hide = False
-            
-            if exclude_text and exclude_text.upper() in line_text: should_hide = True
-            if not should_hide and levels:
-                if not any(k in line_text for k in allowed_keywords): should_hide = True
-            
-            if should_hide:
-                self.text_area.tag_add("hidden", f"{i}.0", f"{i+1}.0")
-                self.line_numbers.tag_add("hidden", f"{i}.0", f"{i+1}.0")
-        
-        self._finalize_filter()
-
-    def _finalize_filter(self):
-        self.text_area.configure(state="disabled")
-        self.line_numbers.configure(state="disabled")
-        # Ensure UI updates and scroll sync happens
-        self.text_area.update_idletasks()
-        self.line_numbers.sync_scroll()
+        self._apply_filter(LineFilter(exclude=exclude_text, levels=levels))
+
+    def goto_time(self, query):
+        """
+        Jumps to the first line at a time ("14:32:05") or shows only a time range
+        ("14:00-14:15"), using binary searches over the timestamp index. Times without a
+        date are taken on the day of the line at the top of the view; an empty query
+        shows all lines again. Raises ValueError for an unreadable query.
+        """
+        if not self.line_index: return
+        if not query.strip():
+            self._cancel_filter()
+            return self._finalize_filter(None)
+        top = self.rendered_lines[0] if self.rendered_lines else self.line_index.first_line
+        start, stop = parse_time_range(query, self.line_index.time_of_line(top))
+        if stop is not None:
+            self._cancel_filter()
+            return self._finalize_filter(time_view(self.line_index, start, stop))
+        line = min(self.line_index.line_at_time(start), self.line_index.line_count - 1)
+        self.cursor_pos = (line, 0)
+        self.scroll_to_line(line)
+
+    def apply_field_query(self, query):
+        """
+        Shows only the lines whose fields match a query such as `status>=500 AND path~/api/`
+        (JSON lines, logfmt and access logs). Fields are parsed on first use, on a tab task,
+        and cached per block, so refining a query runs at once over the cached columns; an
+        empty query shows all lines. Raises ValueError for an invalid query.
+        """
+        index = self.line_index
+        if not index: return
+        self._cancel_filter()
+        if not query.strip(): return self._finalize_filter(None)
+        field_query = FieldQuery(query)
+        if index.fields is None: index.fields = FieldStore(index)
+        if index.fields.cached(): return self._finalize_filter(field_view(index, field_query), field_query)
+        self._start_filter("fields", lambda task, index, stop: field_view(index, field_query, stop=stop, stopped=task.stopped), field_query)
+
+    def _apply_filter(self, line_filter):
+        """Computes the filtered view with the engine on a tab task; the UI thread only swaps in the finished LineRuns."""
+        if not self.line_index: return
+        if not line_filter:
+            self._cancel_filter()
+            return self._finalize_filter(None)
+        def progress(done): # Large files are scanned chunk by chunk, on all cores
+            self._post(lambda: self.filter_task and self.lbl_status.configure(text=f"Filtering... {done:.0%}", text_color="orange"))
+        self._start_filter("filter", lambda task, index, stop: build_view(index, line_filter, stop=stop, stopped=task.stopped, on_progress=progress), line_filter=line_filter)
+
+    def _start_filter(self, name, compute, field_query=None, line_filter=None):
+        """
+        Runs compute(task, index, stop) -> LineRuns of the lines before `stop` on a tab task,
+        cancelling the filter still running. The current view stays until the result is
+        posted back; lines Live Watch appended meanwhile are then added as usual.
+        """
+        self._cancel_filter()
+        generation, index, stop = self.filter_generation, self.line_index, self.line_index.line_count
+
+        def run(task):
+            try: view = compute(task, index, stop)
+            except Exception as e: # E.g. the file vanished under the scan
+                if not task.stopped(): self._post(lambda: self.lbl_status.configure(text=f"Error: {str(e)}", text_color="red"))
+                return
+            if view is not None and not task.stopped(): self._post(lambda: deliver(view))
+
+        def deliver(view):
+            if generation != self.filter_generation or index is not self.line_index: return # Superseded or reloaded
+            self.filter_task = None
+            self._finalize_filter(view, field_query, line_filter)
+            if index.line_count > stop: self._extend_view(stop)
+            self._trim_view() # Ring-buffer mode may have dropped lines meanwhile
+            self.update_status_label()
+
+        self.filter_task = self.tasks.submit(name, run)
+        if self.filter_task: self.lbl_status.configure(text="Filtering...", text_color="orange")
+
+    def _cancel_filter(self):
+        self.filter_generation += 1
+        if self.filter_task:
+            self.filter_task.cancel()
+            self.filter_task = None
+
+    def _extend_view(self, start):
+        """Adds the lines from `start` on to the filtered view (Live Watch appends)."""
+        # New lines pass the same field query or line filter as the rest of the view; hidden templates stay hidden
+        if self.field_query: added = field_view(self.line_index, self.field_query, start)
+        else:
+            added = LineRuns()
+            added.add_run(start, self.line_index.line_count)
+        if self.line_filter: added = added.intersect(build_view(self.line_index, self.line_filter, start=start)) # Only the appended lines are scanned
+        if self.filter_view not in (None, self.view_map): self.filter_view.extend(added)
+        if self.hidden_templates: added = added.intersect(template_view(self.line_index, self.hidden_templates, start))
+        self.view_map.extend(added)
+
+    def set_hidden_templates(self, hidden):
+        """Hides the lines of the given template IDs on top of the current filter: a mask over the per-line template IDs, no text is read."""
+        if not self.line_index: return
+        self.hidden_templates = set(hidden)
+        self._finalize_filter(self.filter_view, self.field_query, self.line_filter)
+
+    def _finalize_filter(self, view_map, field_query=None, line_filter=None):
+        # Keep the first visible line anchored at the top when the view changes
+        anchor = self.rendered_lines[0] if self.rendered_lines else 0
+        self.filter_view = view_map
+        if self.hidden_templates and self.line_index:
+            shown = template_view(self.line_index, self.hidden_templates)
+            view_map = shown if view_map is None else view_map.intersect(shown)
+        self.view_map = view_map
+        self.field_query = field_query
+        self.line_filter = line_filter
+        self.view_top = self._view_row_of_line(anchor)
+        self._render_viewport()
+
+
+# --- Statistics Window ---
+class StatsWindow(ctk.CTkToplevel):
+    """
+    Level counts and the per-minute (or per-hour) timeline of a tab, read from the
+    counters kept while indexing, so nothing is rescanned. Redraws once a second while
+    the counters change, which makes it follow Live Watch.
+    """
+    REFRESH_MS = 1000
+    HOURLY_SPAN = 6 * 3600 # Timelines spanning more seconds than this are shown per hour
+    COLORS = {"ERROR": '#ff6b6b', "WARN": '#ffa502', "INFO": '#7bed9f', "DEBUG": '#70a1ff'}
+
+    def __init__(self, master, tab):
+        super().__init__(master)
+        # Deferred: matplotlib costs more than the rest of the startup (Figure avoids pyplot altogether)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.tab = tab
+        self.geometry("700x650"); self.title(f"Stats: {tab.file_name}")
+        self.fig = Figure(figsize=(6, 6)); self.fig.patch.set_facecolor('#2b2b2b')
+        self.ax_levels, self.ax_timeline = self.fig.subplots(2, 1, gridspec_kw={"height_ratios": [1, 1.3]})
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
+        self._drawn = None # Counter state of the last redraw
+        self._refresh()
+
+    def _refresh(self):
+        if not self.winfo_exists(): return
+        index = self.tab.line_index if self.tab.winfo_exists() else None
+        if index:
+            state = (index, index.line_count, index.first_line, index.timeline.version)
+            if state != self._drawn:
+                self._drawn = state
+                self._draw(index)
+        self.after(self.REFRESH_MS, self._refresh)
+
+    @staticmethod
+    def _style(ax):
+        ax.clear(); ax.set_facecolor('#2b2b2b')
+        ax.tick_params(colors='white'); ax.spines['bottom'].set_color('white'); ax.spines['left'].set_color('white')
+        ax.spines['top'].set_visible(False); ax.spines['right'].set_visible(False)
 
+    def _draw(self, index):
+        import datetime
+        ax = self.ax_levels; self._style(ax)
+        counts = {k: v for k, v in index.levels.counts().items() if v}
+        bars = ax.bar(counts.keys(), counts.values(), color=[self.COLORS[k] for k in counts])
+        for bar in bars: ax.annotate(f'{bar.get_height()}', (bar.get_x()+bar.get_width()/2, bar.get_height()), xytext=(0,3), textcoords="offset points", ha='center', color='white')
+        ax.margins(y=0.15) # Room for the labels
+
+        ax = self.ax_timeline; self._style(ax)
+        resolution = 60
+        series = index.timeline.series(resolution)
+        if series and series[-1][0] - series[0][0] > self.HOURLY_SPAN:
+            resolution = 3600
+            series = index.timeline.series(resolution)
+        if series:
+            x = [datetime.datetime.fromtimestamp(start, datetime.timezone.utc).replace(tzinfo=None) for start, _ in series]
+            levels = [(level, name) for level, name in LevelIndex.NAMES.items() if any(counts[level] for _, counts in series)]
+            ax.stackplot(x, *[[counts[level] for _, counts in series] for level, _ in levels], step="post",
+                         colors=[self.COLORS[name] for _, name in levels], labels=[name for _, name in levels])
+            ax.set_title(f"Lines per {'minute' if resolution == 60 else 'hour'}", color='white', fontsize=10)
+            ax.legend(loc="upper left", fontsize=8, facecolor='#2b2b2b', labelcolor='white', frameon=False)
+            self.fig.autofmt_xdate()
+        else: ax.text(0.5, 0.5, "No timestamps found", ha='center', va='center', color='gray', transform=ax.transAxes)
+        self.canvas.draw_idle()
+
+# --- Patterns Window ---
+class PatternsWindow(ctk.CTkToplevel):
+    """
+    The message templates of a tab by line count, mined while indexing. Unticking a
+    template hides its lines; the rows are a fixed set of widgets relabelled once a
+    second while the counts change, so Live Watch does not rebuild the window.
+    """
+    REFRESH_MS = 1000
+    MAX_ROWS = 200 # Most frequent templates listed; rarer ones stay shown
+
+    def __init__(self, master, tab):
+        super().__init__(master)
+        self.tab = tab
+        self.geometry("900x600"); self.title(f"Patterns: {tab.file_name}")
+        top = ctk.CTkFrame(self, fg_color="transparent"); top.pack(fill="x", padx=10, pady=(10, 0))
+        self.lbl_summary = ctk.CTkLabel(top, text="", anchor="w")
+        self.lbl_summary.pack(side="left")
+        ctk.CTkButton(top, text="Show All", width=90, command=lambda: self._set_hidden(set())).pack(side="right")
+        sf = ctk.CTkScrollableFrame(self); sf.pack(fill="both", expand=True, padx=10, pady=10)
+        sf.grid_columnconfigure(2, weight=1)
+        self.tids = [] # Template ID of every used row
+        self.rows = [] # (checkbox, count label, template label)
+        for row in range(self.MAX_ROWS):
+            chk = ctk.CTkCheckBox(sf, text="", width=24, command=lambda row=row: self._toggle(row))
+            lbl_count = ctk.CTkLabel(sf, text="", width=110, anchor="e", font=("Consolas", 12))
+            lbl_template = ctk.CTkLabel(sf, text="", anchor="w", font=("Consolas", 12))
+            self.rows.append((chk, lbl_count, lbl_template))
+        self._drawn = None # Template state of the last redraw
+        self._refresh()
+
+    def _refresh(self):
+        if not self.winfo_exists(): return
+        index = self.tab.line_index if self.tab.winfo_exists() else None
+        if index:
+            state = (index, index.templates.version, frozenset(self.tab.hidden_templates))
+            if state != self._drawn:
+                self._drawn = state
+                self._draw(index)
+        self.after(self.REFRESH_MS, self._refresh)
+
+    def _draw(self, index):
+        templates = index.templates
+        top = templates.top()
+        total = max(1, sum(n for _, n in top))
+        hidden = self.tab.hidden_templates
+        self.lbl_summary.configure(text=f"{len(top)} templates over {total:,} lines • {len(hidden)} hidden")
+        self.tids = [tid for tid, _ in top[:self.MAX_ROWS]]
+        for row, (chk, lbl_count, lbl_template) in enumerate(self.rows):
+            if row >= len(self.tids):
+                for widget in (chk, lbl_count, lbl_template): widget.grid_remove()
+                continue
+            tid, n = top[row]
+            if tid in hidden: chk.deselect()
+            else: chk.select()
+            lbl_count.configure(text=f"{n:,} ({n / total:.1%})")
+            lbl_template.configure(text=templates.template(tid)[:300], text_color="gray" if tid in hidden else ("gray10", "#DCE4EE"))
+            chk.grid(row=row, column=0, padx=(5, 0)); lbl_count.grid(row=row, column=1, padx=5); lbl_template.grid(row=row, column=2, sticky="w")
+
+    def _toggle(self, row):
+        hidden = set(self.tab.hidden_templates)
+        hidden.symmetric_difference_update((self.tids[row],))
+        self._set_hidden(hidden)
+
+    def _set_hidden(self, hidden):
+        if not self.tab.winfo_exists() or not self.tab.line_index: return
+        self.tab.set_hidden_templates(hidden)
+        self._draw(self.tab.line_index)
+        self._drawn = (self.tab.line_index, self.tab.line_index.templates.version, frozenset(hidden))
+
+# --- Diagnostics Window ---
+def process_rss():
+    """Resident memory of the process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError): pass
+    try:
+        import resource # Unix only: peak instead of current
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError: return 0
+
+class DiagnosticsWindow(ctk.CTkToplevel):
+    """Live workers of the shared thread pool and the memory held by every open tab, refreshed once a second."""
+    REFRESH_MS = 1000
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.app = master
+        self.geometry("760x420"); self.title("Diagnostics")
+        self.lbl_summary = ctk.CTkLabel(self, text="", anchor="w", justify="left", font=("Consolas", 12))
+        self.lbl_summary.pack(fill="x", padx=10, pady=(10, 5))
+        self.txt = ctk.CTkTextbox(self, font=("Consolas", 12), wrap="none")
+        self.txt.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        self._refresh()
+
+    @staticmethod
+    def _mb(size):
+        return f"{size / 2**20:8.1f} MB"
+
+    def _refresh(self):
+        if not self.winfo_exists(): return
+        workers, queued = thread_pool_status()
+        self.lbl_summary.configure(text=f"Process: {self._mb(process_rss()).strip()} resident, {threading.active_count()} threads\n"
+                                        f"Worker pool: {workers}/{THREAD_WORKERS} threads, {queued} tasks queued")
+        rows = [f"{'Tab':<32} {'Lines':>10} {'Memory':>11}  Tasks"]
+        for name, tab in list(self.app.tabs.items()):
+            index = tab.line_index
+            usage = index.memory() if index else {}
+            usage["search"] = tab.search_matches.memory()
+            if tab.view_map is not None: usage["view"] = tab.view_map.memory()
+            tasks = ", ".join(f"{task.name} ({task.state}, {time.monotonic() - task.started:.0f}s)" if task.started else f"{task.name} ({task.state})"
+                              for task in tab.tasks.active()) or ("watching" if tab.is_watching else "idle")
+            rows.append(f"{name[:32]:<32} {tab.total_lines:>10,} {self._mb(sum(usage.values())):>11}  {tasks}")
+            rows.append("    " + "  ".join(f"{part} {size / 2**20:.1f}" for part, size in usage.items() if size) + " (MB)")
+        self.txt.configure(state="normal")
+        self.txt.delete("1.0", "end"); self.txt.insert("1.0", "\n".join(rows))
+        self.txt.configure(state="disabled")
+        self.after(self.REFRESH_MS, self._refresh)
+
+# --- Alert Rules ---
+def desktop_notify(title, message):
+    """Best-effort desktop notification: plyer if installed, else the platform's own tool. Returns False if none worked."""
+    try:
+        from plyer import notification # Optional dependency, the only route on Windows
+        notification.notify(title=title, message=message, app_name="Omnilog", timeout=5)
+        return True
+    except Exception: pass
+    import subprocess # Deferred: only needed once an alert fires
+    quote = lambda text: '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    try:
+        if sys.platform == "darwin": subprocess.Popen(["osascript", "-e", f"display notification {quote(message)} with title {quote(title)}"])
+        elif sys.platform.startswith("linux"): subprocess.Popen(["notify-send", "-a", "Omnilog", title, message])
+        else: return False
+        return True
+    except OSError: return False
+
+class AlertRulesDialog(ctk.CTkToplevel):
+    """Edits the alert rules checked by Live Watch in every tab, one rule per line."""
+    HELP = ("One rule per line (# starts a comment):\n"
+            "  timeout                  keyword, any case\n"
+            "  /conn(ection)? reset/    regular expression\n"
+            "  >50 ERROR in 60s         more than 50 ERROR lines within 60 s (also WARN, INFO, DEBUG)\n"
+            "  >10 timeout in 5m        more than 10 keyword or /regex/ hits within 5 minutes\n"
+            "Hits mark their line red with a note and raise a desktop notification.")
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.app = master
+        self.geometry("620x460"); self.title("Alert Rules")
+        ctk.CTkLabel(self, text=self.HELP, anchor="w", justify="left", font=("Consolas", 11)).pack(fill="x", padx=10, pady=(10, 5))
+        self.txt = ctk.CTkTextbox(self, font=("Consolas", 12), wrap="none")
+        self.txt.pack(fill="both", expand=True, padx=10)
+        self.txt.insert("1.0", master.alert_rules_text)
+        ctk.CTkButton(self, text="Save", command=self.save).pack(pady=10)
+
+    def save(self):
+        text = self.txt.get("1.0", "end-1c")
+        try: rules = AlertRule.parse(text)
+        except ValueError as e:
+            messagebox.showerror("Alert Rules", f"Invalid rule: {e}", parent=self); return
+        self.app.set_alert_rules(text, rules)
+        self.destroy()
 
 # --- App Structure ---
 class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
+    SEARCH_DEBOUNCE_MS = 250
+    KEEP_LINES_CHOICES = {"All": None, "10k": 10_000, "100k": 100_000, "1M": 1_000_000} # Ring-buffer sizes
+
     def __init__(self):
         super().__init__()
         self.TkdndVersion = TkinterDnD._require(self)
@@ -448,22 +1142,35 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
         self.clipboard_counter = 1
+        self.tabs = {} # Tab name -> LogTab, in opening order
+        self.alert_rules_text, self.alert_rules = "", [] # Checked by Live Watch in every tab
+        self._search_after_id = None
+        self._startup_file = None # File passed on the command line (context menu), opened once the window is up
+        self._first_mapped = False
         
         self._setup_sidebar()
         self._setup_main_area()
         self._setup_dnd()
         self._check_cli_args()
+        self.bind("<Map>", self._on_map, add="+")
 
     def _check_cli_args(self):
         if len(sys.argv) > 1:
             file_path = sys.argv[1]
-            if os.path.isfile(file_path):
-                self.after(500, lambda: self.add_log_tab(file_path=file_path))
+            if os.path.isfile(file_path): self._startup_file = file_path
+
+    def _on_map(self, event):
+        # Child widgets report <Map> through the toplevel's bindtag too: only the window itself counts
+        if event.widget is not self or self._first_mapped: return
+        self._first_mapped = True
+        StartupTimer.mark("first window")
+        # Open the context-menu file right after the first frame is painted instead of after a fixed delay
+        if self._startup_file: self.after_idle(lambda: self.add_log_tab(file_path=self._startup_file))
 
     def _setup_sidebar(self):
         self.sidebar = ctk.CTkFrame(self, width=250, corner_radius=0)
         self.sidebar.grid(row=0, column=0, sticky="nsew")
-        self.sidebar.grid_rowconfigure(30, weight=1)
+        self.sidebar.grid_rowconfigure(34, weight=1)
 
         ctk.CTkLabel(self.sidebar, text="OMNILOG", font=ctk.CTkFont(size=22, weight="bold")).grid(row=0, column=0, padx=20, pady=(20, 10))
         ctk.CTkButton(self.sidebar, text="📂 Open File", command=self.open_file_dialog).grid(row=1, column=0, padx=20, pady=5)
@@ -490,38 +1197,57 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
         self.combo_regex = ctk.CTkComboBox(self.sidebar, values=["Regex Presets...", "IP Address", "Email", "URL", "Date (YYYY-MM-DD)", "Error Codes"], command=self.apply_regex_preset)
         self.combo_regex.grid(row=7, column=0, padx=20, pady=(10, 10))
 
-        ctk.CTkLabel(self.sidebar, text="Level Filter:", anchor="w", font=("Arial", 14, "bold")).grid(row=8, column=0, padx=20, pady=(15,5), sticky="w")
+        ctk.CTkLabel(self.sidebar, text="Go to Time:", anchor="w").grid(row=8, column=0, padx=20, pady=(5,0), sticky="w")
+        self.entry_time = ctk.CTkEntry(self.sidebar, placeholder_text="14:32:05 or 14:00-14:15")
+        self.entry_time.grid(row=9, column=0, padx=20, pady=(5, 5))
+        self.entry_time.bind("<Return>", self.on_time_enter)
+
+        ctk.CTkLabel(self.sidebar, text="Field Query:", anchor="w").grid(row=10, column=0, padx=20, pady=(5,0), sticky="w")
+        self.entry_fields = ctk.CTkEntry(self.sidebar, placeholder_text="status>=500 AND path~/api/")
+        self.entry_fields.grid(row=11, column=0, padx=20, pady=(5, 5))
+        self.entry_fields.bind("<Return>", self.on_field_query_enter)
+
+        ctk.CTkLabel(self.sidebar, text="Level Filter:", anchor="w", font=("Arial", 14, "bold")).grid(row=12, column=0, padx=20, pady=(15,5), sticky="w")
         self.chk_error = ctk.CTkCheckBox(self.sidebar, text="ERROR / CRITICAL", text_color="#ff6b6b")
-        self.chk_error.grid(row=9, column=0, padx=20, pady=5, sticky="w")
+        self.chk_error.grid(row=13, column=0, padx=20, pady=5, sticky="w")
         self.chk_warn = ctk.CTkCheckBox(self.sidebar, text="WARNING", text_color="#ffa502")
-        self.chk_warn.grid(row=10, column=0, padx=20, pady=5, sticky="w")
+        self.chk_warn.grid(row=14, column=0, padx=20, pady=5, sticky="w")
         self.chk_info = ctk.CTkCheckBox(self.sidebar, text="INFO", text_color="#7bed9f")
-        self.chk_info.grid(row=11, column=0, padx=20, pady=5, sticky="w")
+        self.chk_info.grid(row=15, column=0, padx=20, pady=5, sticky="w")
         self.chk_debug = ctk.CTkCheckBox(self.sidebar, text="DEBUG", text_color="#70a1ff")
-        self.chk_debug.grid(row=12, column=0, padx=20, pady=5, sticky="w")
+        self.chk_debug.grid(row=16, column=0, padx=20, pady=5, sticky="w")
         
-        ctk.CTkLabel(self.sidebar, text="Exclude:", anchor="w").grid(row=13, column=0, padx=20, pady=(10,0), sticky="w")
+        ctk.CTkLabel(self.sidebar, text="Exclude:", anchor="w").grid(row=17, column=0, padx=20, pady=(10,0), sticky="w")
         self.entry_exclude = ctk.CTkEntry(self.sidebar, placeholder_text="e.g. Heartbeat...")
-        self.entry_exclude.grid(row=14, column=0, padx=20, pady=(5, 10))
+        self.entry_exclude.grid(row=18, column=0, padx=20, pady=(5, 10))
         self.entry_exclude.bind("<Return>", lambda event: self.apply_sidebar_filter())
         self.btn_apply = ctk.CTkButton(self.sidebar, text="Apply Filter", fg_color="#444", command=self.apply_sidebar_filter)
-        self.btn_apply.grid(row=15, column=0, padx=20, pady=5)
+        self.btn_apply.grid(row=19, column=0, padx=20, pady=5)
 
-        ctk.CTkLabel(self.sidebar, text="View Control:", anchor="w", font=("Arial", 14, "bold")).grid(row=16, column=0, padx=20, pady=(15,5), sticky="w")
+        ctk.CTkLabel(self.sidebar, text="View Control:", anchor="w", font=("Arial", 14, "bold")).grid(row=20, column=0, padx=20, pady=(15,5), sticky="w")
         frm_zoom = ctk.CTkFrame(self.sidebar, fg_color="transparent")
-        frm_zoom.grid(row=17, column=0)
+        frm_zoom.grid(row=21, column=0)
         ctk.CTkButton(frm_zoom, text="Zoom -", width=60, command=lambda: self.change_zoom(-2)).pack(side="left", padx=5)
         ctk.CTkButton(frm_zoom, text="Zoom +", width=60, command=lambda: self.change_zoom(2)).pack(side="left", padx=5)
-        self.sw_live = ctk.CTkSwitch(self.sidebar, text="🔴 Live Watch", command=self.toggle_live_watch)
-        self.sw_live.grid(row=18, column=0, padx=20, pady=10)
-
-        ctk.CTkLabel(self.sidebar, text="Tools:", anchor="w", font=("Arial", 14, "bold")).grid(row=19, column=0, padx=20, pady=(15,5), sticky="w")
-        ctk.CTkButton(self.sidebar, text="📊 Statistics", fg_color="#2CC985", text_color="white", command=self.show_stats).grid(row=20, column=0, padx=20, pady=5)
-        ctk.CTkButton(self.sidebar, text="📝 All Notes", fg_color="#D4AF37", text_color="white", command=self.show_notes_overview).grid(row=21, column=0, padx=20, pady=5)
+        frm_live = ctk.CTkFrame(self.sidebar, fg_color="transparent")
+        frm_live.grid(row=22, column=0, padx=20, pady=10)
+        self.sw_live = ctk.CTkSwitch(frm_live, text="🔴 Live Watch", width=110, command=self.toggle_live_watch)
+        self.sw_live.pack(side="left")
+        self.opt_keep = ctk.CTkOptionMenu(frm_live, values=list(self.KEEP_LINES_CHOICES), width=80, command=self.set_keep_lines)
+        self.opt_keep.pack(side="left", padx=(5, 0))
+
+        ctk.CTkLabel(self.sidebar, text="Tools:", anchor="w", font=("Arial", 14, "bold")).grid(row=23, column=0, padx=20, pady=(15,5), sticky="w")
+        ctk.CTkButton(self.sidebar, text="📊 Statistics", fg_color="#2CC985", text_color="white", command=self.show_stats).grid(row=24, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="📝 All Notes", fg_color="#D4AF37", text_color="white", command=self.show_notes_overview).grid(row=25, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="🔀 Merge Files", fg_color="#6c5ce7", text_color="white", command=self.open_merge_dialog).grid(row=26, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="🩺 Diagnostics", fg_color="#636e72", text_color="white", command=self.show_diagnostics).grid(row=27, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="🔔 Alert Rules", fg_color="#c0392b", text_color="white", command=self.show_alert_rules).grid(row=28, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="🧩 Patterns", fg_color="#0984e3", text_color="white", command=self.show_patterns).grid(row=29, column=0, padx=20, pady=5)
         
-        ctk.CTkButton(self.sidebar, text="❌ Close Tab", fg_color="#8B0000", hover_color="#B22222", text_color="white", command=self.close_current_tab).grid(row=22, column=0, padx=20, pady=(20, 5))
-        ctk.CTkButton(self.sidebar, text="Export .JSON", fg_color="transparent", border_width=2, command=self.export_log_json).grid(row=23, column=0, padx=20, pady=5)
-        ctk.CTkButton(self.sidebar, text="Export .TXT", fg_color="transparent", border_width=2, command=self.export_log_txt).grid(row=24, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="❌ Close Tab", fg_color="#8B0000", hover_color="#B22222", text_color="white", command=self.close_current_tab).grid(row=30, column=0, padx=20, pady=(20, 5))
+        ctk.CTkButton(self.sidebar, text="Export .JSON", fg_color="transparent", border_width=2, command=self.export_log_json).grid(row=31, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="Export View", fg_color="transparent", border_width=2, command=self.export_view).grid(row=32, column=0, padx=20, pady=5)
+        ctk.CTkButton(self.sidebar, text="Import Marks", fg_color="transparent", border_width=2, command=self.import_annotations).grid(row=33, column=0, padx=20, pady=5)
 
     def _setup_main_area(self):
         self.tab_view = ctk.CTkTabview(self, anchor="nw")
@@ -538,6 +1264,9 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
     def open_file_dialog(self): 
         path = filedialog.askopenfilename()
         if path: self.add_log_tab(file_path=path)
+    def open_merge_dialog(self):
+        paths = filedialog.askopenfilenames(title="Select the logs to merge by time")
+        if len(paths) > 1: self.add_log_tab(merge_paths=list(paths))
     def paste_from_clipboard(self):
         try:
             content = self.clipboard_get()
@@ -546,30 +1275,45 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
             self.add_log_tab(content=content, title=f"Clipboard #{self.clipboard_counter}")
         except: pass
 
-    def add_log_tab(self, file_path=None, content=None, title=None):
+    def add_log_tab(self, file_path=None, content=None, title=None, merge_paths=None):
         name = os.path.basename(file_path) if file_path else (title or "Untitled")
-        try: self.tab_view.add(name)
-        except: pass 
+        if merge_paths: name = f"🔀 {os.path.basename(merge_paths[0])} +{len(merge_paths) - 1}"
+        # Tabs are keyed by name: files sharing a basename get "app.log (2)", ...
+        base, n = name, 1
+        while name in self.tabs or name == "Home":
+            n += 1
+            name = f"{base} ({n})"
+        self.tab_view.add(name)
         self.tab_view.set(name)
-        LogTab(self.tab_view.tab(name), file_path=file_path, content=content, title=name).pack(fill="both", expand=True)
+        tab = self.tabs[name] = LogTab(self.tab_view.tab(name), file_path=file_path, content=content, title=name,
+                                       max_lines=self.KEEP_LINES_CHOICES[self.opt_keep.get()], merge_paths=merge_paths)
+        tab.pack(fill="both", expand=True)
+        if self.alert_rules: tab.set_alert_rules(self.alert_rules)
 
     def _get_current_log_tab(self):
-        cur = self.tab_view.get()
-        if cur == "Home": return None
-        for w in self.tab_view.tab(cur).winfo_children():
-            if isinstance(w, LogTab): return w
-        return None
+        return self.tabs.get(self.tab_view.get())
 
     def close_current_tab(self):
         selected = self.tab_view.get()
         if selected == "Home": return
-        try: self.tab_view.delete(selected)
+        self.tabs.pop(selected, None)
+        try: self.tab_view.delete(selected) # Destroys the LogTab, which stops its tasks and frees its indexes
         except: pass
 
     # Feature Proxies
     def on_search_typing(self, event):
+        # Debounced: the search only starts once typing pauses
+        if self._search_after_id: self.after_cancel(self._search_after_id)
+        self._search_after_id = self.after(self.SEARCH_DEBOUNCE_MS, self._start_search)
+
+    def _start_search(self):
+        self._search_after_id = None
         tab = self._get_current_log_tab()
-        if tab: self.lbl_search_stats.configure(text=f"0 / {tab.run_search(self.entry_search.get(), bool(self.chk_regex.get()))}")
+        if not tab: return
+        def progress(count, done):
+            if tab is self._get_current_log_tab():
+                self.lbl_search_stats.configure(text=f"0 / {count}" if done else f"0 / {count}…")
+        tab.run_search(self.entry_search.get(), bool(self.chk_regex.get()), on_progress=progress)
     
     def navigate_search(self, direction):
         tab = self._get_current_log_tab()
@@ -595,6 +1339,22 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
             self.chk_regex.select()
             self.on_search_typing(None)
 
+    def on_time_enter(self, event):
+        tab = self._get_current_log_tab()
+        if not tab: return
+        try:
+            tab.goto_time(self.entry_time.get())
+            self.entry_time.configure(text_color=("gray10", "#DCE4EE"))
+        except ValueError: self.entry_time.configure(text_color="#ff6b6b")
+
+    def on_field_query_enter(self, event):
+        tab = self._get_current_log_tab()
+        if not tab: return
+        try:
+            tab.apply_field_query(self.entry_fields.get())
+            self.entry_fields.configure(text_color=("gray10", "#DCE4EE"))
+        except ValueError: self.entry_fields.configure(text_color="#ff6b6b")
+
     def change_zoom(self, delta):
         tab = self._get_current_log_tab()
         if tab: tab.change_font_size(delta)
@@ -603,6 +1363,10 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
         tab = self._get_current_log_tab()
         if tab: tab.toggle_live_watch(bool(self.sw_live.get()))
 
+    def set_keep_lines(self, choice):
+        tab = self._get_current_log_tab()
+        if tab: tab.set_max_lines(self.KEEP_LINES_CHOICES[choice])
+
     def apply_sidebar_filter(self):
         tab = self._get_current_log_tab()
         if tab:
@@ -616,37 +1380,53 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
     def export_log_json(self):
         tab = self._get_current_log_tab()
         if tab:
-            path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")], initialfile=f"{tab.file_name}_audit.json")
+            path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json"), ("JSON Lines", "*.jsonl")], initialfile=f"{tab.file_name}_audit.json")
             if path:
-                with open(path, 'w', encoding='utf-8') as f: json.dump({"filename": tab.file_name, "annotations": tab.meta_data.annotations}, f, indent=4)
+                with open(path, 'w', encoding='utf-8') as f:
+                    if path.lower().endswith(".jsonl"): tab.meta_data.export_jsonl(f)
+                    else: tab.meta_data.export_json(f, tab.file_name)
 
-    def export_log_txt(self):
+    def import_annotations(self):
+        """Loads marks and notes exported before (.json or .jsonl) onto the current tab, e.g. after reopening the file."""
         tab = self._get_current_log_tab()
-        if tab:
-            path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text", "*.txt")], initialfile=f"{tab.file_name}.txt")
-            if path:
-                with open(path, 'w', encoding='utf-8') as f: f.write(tab.text_area.get("1.0", "end-1c"))
-                messagebox.showinfo("Export", "File saved.")
+        if not tab: return
+        path = filedialog.askopenfilename(filetypes=[("Annotations", "*.json *.jsonl"), ("All files", "*.*")])
+        if not path: return
+        try:
+            with open(path, encoding='utf-8') as f: count = tab.meta_data.import_file(f)
+        except (OSError, ValueError) as e: # import_file raises ValueError for any malformed export
+            messagebox.showerror("Import", f"Could not import {os.path.basename(path)}: {e}"); return
+        tab.request_render()
+        messagebox.showinfo("Import", f"{count} annotations loaded.")
+
+    def export_view(self):
+        """Exports the lines shown by the current filters (TXT, JSONL or CSV) in the background."""
+        tab = self._get_current_log_tab()
+        if tab and tab.line_index:
+            path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text", "*.txt"), ("JSON Lines", "*.jsonl"), ("CSV", "*.csv")],
+                                                initialfile=f"{tab.file_name}_view.txt")
+            if path: tab.start_export(path)
 
     def show_stats(self):
         tab = self._get_current_log_tab()
-        if not tab: return
-        content = tab.text_area.get("1.0", "end")
-        counts = Counter()
-        patterns = {"ERROR": r'ERROR|CRITICAL|FATAL|FAIL', "WARN": r'WARN|WARNING', "INFO": r'INFO', "DEBUG": r'DEBUG'}
-        for line in content.split('\n'):
-            for k, v in patterns.items():
-                if re.search(v, line, re.IGNORECASE): 
-                    counts[k] += 1; break
-        if sum(counts.values()) == 0: 
+        if not tab or not tab.line_index: return
+        if not any(tab.line_index.levels.counts().values()) and not tab.is_watching:
             messagebox.showinfo("Stats", "No log levels found."); return
-        win = ctk.CTkToplevel(self); win.geometry("600x500"); win.title(f"Stats: {tab.file_name}")
-        fig, ax = plt.subplots(figsize=(5, 4)); fig.patch.set_facecolor('#2b2b2b'); ax.set_facecolor('#2b2b2b')
-        bars = ax.bar(counts.keys(), counts.values(), color=['#ff6b6b', '#ffa502', '#7bed9f', '#70a1ff'])
-        ax.tick_params(colors='white'); ax.spines['bottom'].set_color('white'); ax.spines['left'].set_color('white')
-        ax.spines['top'].set_visible(False); ax.spines['right'].set_visible(False)
-        for bar in bars: ax.annotate(f'{bar.get_height()}', (bar.get_x()+bar.get_width()/2, bar.get_height()), xytext=(0,3), textcoords="offset points", ha='center', color='white')
-        FigureCanvasTkAgg(fig, master=win).get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
+        StatsWindow(self, tab)
+
+    def show_patterns(self):
+        tab = self._get_current_log_tab()
+        if tab and tab.line_index: PatternsWindow(self, tab)
+
+    def show_diagnostics(self):
+        DiagnosticsWindow(self)
+
+    def show_alert_rules(self):
+        AlertRulesDialog(self)
+
+    def set_alert_rules(self, text, rules):
+        self.alert_rules_text, self.alert_rules = text, rules
+        for tab in self.tabs.values(): tab.set_alert_rules(rules)
 
     def show_notes_overview(self):
         tab = self._get_current_log_tab()
@@ -655,11 +1435,16 @@ class OmnilogApp(ctk.CTk, TkinterDnD.DnDWrapper):
         if not notes: messagebox.showinfo("Notes", "No notes found."); return
         win = ctk.CTkToplevel(self); win.geometry("500x400"); win.title(f"Notes: {tab.file_name}")
         sf = ctk.CTkScrollableFrame(win); sf.pack(fill="both", expand=True, padx=10, pady=10)
-        for k in sorted(notes.keys(), key=lambda x: int(x)):
+        for line, note in notes: # Already in line order
             c = ctk.CTkFrame(sf, fg_color="#333"); c.pack(fill="x", pady=5, padx=5)
-            ctk.CTkLabel(c, text=f"Line {k}", font=("Arial",12,"bold"), text_color="#D4AF37").pack(anchor="w", padx=10)
-            ctk.CTkLabel(c, text=notes[k]['note'], font=("Arial",12), text_color="#eee").pack(anchor="w", padx=10)
+            ctk.CTkLabel(c, text=f"Line {line}", font=("Arial",12,"bold"), text_color="#D4AF37").pack(anchor="w", padx=10)
+            ctk.CTkLabel(c, text=note, font=("Arial",12), text_color="#eee").pack(anchor="w", padx=10)
 
 if __name__ == "__main__":
+    if "--startup-time" in sys.argv:
+        sys.argv.remove("--startup-time")
+        StartupTimer.enabled = True
+    StartupTimer.mark("imports")
     app = OmnilogApp()
+    StartupTimer.mark("app built")
     app.mainloop()
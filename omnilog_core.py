@@ -0,0 +1,2926 @@
+"""
+Omnilog core: the GUI-free log engine (indexing, encodings, search, filters, stats, Live Watch).
+
+It never imports customtkinter, tkinterdnd2 or matplotlib, so it can be imported and run
+on headless servers. The desktop app (omnilog.py) is a thin client over it. Run it
+directly for the command line interface:
+
+    python omnilog_core.py grep FILE PATTERN [--regex] [-n] [-c]
+    python omnilog_core.py filter FILE [--level ERROR WARN] [--include TEXT] [--exclude TEXT] [--where QUERY]
+    python omnilog_core.py stats FILE [--json] [--timeline minute|hour]
+    python omnilog_core.py merge FILE FILE...
+"""
+import threading
+import os
+import sys
+import select
+import struct
+import re
+import json
+import calendar
+import mmap
+import operator
+import codecs
+import time
+import heapq
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from collections import Counter
+from collections import OrderedDict
+from itertools import accumulate, chain, compress, islice, repeat
+
+# --- Log Level Index ---
+class LevelIndex:
+    """
+    One level code per line, classified once when lines are indexed (load and Live Watch).
+    Filtering, statistics and highlighting all read this array instead of re-parsing
+    the text, so they can no longer disagree with each other.
+    """
+    NONE, DEBUG, INFO, WARN, ERROR = range(5)
+    NAMES = {ERROR: "ERROR", WARN: "WARN", INFO: "INFO", DEBUG: "DEBUG"}
+    KEYWORDS = {
+        ERROR: (b"error", b"critical", b"fatal", b"fail", b"exception"),
+        WARN: (b"warning", b"warn"), # "warning" first so highlighting covers the whole word
+        INFO: (b"info", b"success"),
+        DEBUG: (b"debug", b"trace"),
+    }
+    # Keyword hits are OR-ed as bits per line (ERROR = 8 ... DEBUG = 1); the most severe bit wins
+    _BITS = {ERROR: 8, WARN: 4, INFO: 2, DEBUG: 1}
+    _PRIORITY = bytes(4 if b & 8 else 3 if b & 4 else 2 if b & 2 else 1 if b & 1 else 0 for b in range(256))
+
+    def __init__(self):
+        self.codes = bytearray()
+        self.first_line = 0 # Line of codes[0]; moves forward when the head is trimmed
+
+    @classmethod
+    def classify(cls, data):
+        """Returns one level code per line of `data` (bytes in an ASCII-compatible encoding)."""
+        lowered = data.lower()
+        starts = list(accumulate(map((1).__add__, map(len, lowered.split(b'\n'))), initial=0))
+        bits = bytearray(len(starts) - 1)
+        for level, words in cls.KEYWORDS.items():
+            bit = cls._BITS[level]
+            for word in words:
+                # Jump from hit to hit with bytes.find; the rest of a matched line is skipped
+                pos = lowered.find(word)
+                while pos >= 0:
+                    row = bisect_right(starts, pos) - 1
+                    bits[row] |= bit
+                    pos = lowered.find(word, starts[row + 1])
+        return bits.translate(cls._PRIORITY)
+
+    @classmethod
+    def mask_table(cls, names):
+        """Translate table turning level codes into a keep mask for the given level names."""
+        keep = {level for level, name in cls.NAMES.items() if name in names}
+        return bytes(1 if code in keep else 0 for code in range(256))
+
+    def update(self, first_line, data):
+        """Replaces the codes from first_line on with those of `data` (whole lines, the last may be partial)."""
+        self.codes[first_line - self.first_line:] = self.classify(data)
+
+    def trim(self, first_line):
+        """Forgets the codes of the lines before first_line (ring-buffer mode)."""
+        del self.codes[:first_line - self.first_line]
+        self.first_line = first_line
+
+    def get_state(self):
+        """(JSON-able state, [binary blobs]) saved by IndexCache."""
+        return {}, [bytes(self.codes)]
+
+    def set_state(self, state, blobs):
+        self.codes = bytearray(blobs[0])
+
+    def code(self, line):
+        line -= self.first_line
+        return self.codes[line] if 0 <= line < len(self.codes) else self.NONE
+
+    def slice(self, start, stop):
+        """Codes of lines [start, stop), zero-padded if classification lags behind."""
+        base = self.first_line
+        head = b"\0" * max(0, min(stop, base) - start)
+        return (head + bytes(self.codes[max(0, start - base):max(0, stop - base)])).ljust(stop - start, b"\0")
+
+    def counts(self):
+        """Returns {level name: line count}, one C-level count per level."""
+        return {name: self.codes.count(level) for level, name in self.NAMES.items()}
+
+# --- Timestamps ---
+class TimestampParser:
+    """
+    Reads the timestamp near the start of a line (ISO 8601, syslog, Apache/nginx access
+    logs) as seconds since the epoch. Times are taken as written, without time zone
+    conversion, so they compare directly with times typed by the user. Syslog lines
+    carry no year and get the current one.
+    """
+    TIMESTAMP = re.compile(rb"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d)(?::(\d\d))?" # ISO 8601
+                           rb"|([A-Z][a-z]{2}) +(\d{1,2}) (\d\d):(\d\d)(?::(\d\d))?" # syslog (no year)
+                           rb"|\[(\d\d)/([A-Z][a-z]{2})/(\d{4}):(\d\d):(\d\d)(?::(\d\d))?") # Apache/nginx
+    SEARCH_WIDTH = 100 # Bytes at the start of a line searched for a timestamp
+    MAX_LOOKBACK = 64 # Lines walked back from a line without a timestamp
+    CACHE_SIZE = 10000
+    MONTHS = {m.encode(): i for i, m in enumerate(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)}
+
+    def __init__(self):
+        self.year = time.gmtime().tm_year
+        self._parsed = {} # Timestamp text -> seconds; consecutive lines mostly share a timestamp
+
+    def parse(self, line):
+        """Returns the timestamp of a line (bytes) in seconds since the epoch, or None."""
+        m = self.TIMESTAMP.search(line, 0, self.SEARCH_WIDTH)
+        if not m: return None
+        seconds = self._parsed.get(m.group())
+        if seconds is not None: return seconds
+        g = m.groups()
+        try:
+            if g[0]: y, mo, d, h, mi, s = int(g[0]), int(g[1]), int(g[2]), int(g[3]), int(g[4]), g[5]
+            elif g[6]: y, mo, d, h, mi, s = self.year, self.MONTHS[g[6]], int(g[7]), int(g[8]), int(g[9]), g[10]
+            else: y, mo, d, h, mi, s = int(g[13]), self.MONTHS[g[12]], int(g[11]), int(g[14]), int(g[15]), g[16]
+            seconds = calendar.timegm((y, mo, d, h, mi, int(s or 0)))
+        except (KeyError, ValueError, OverflowError): return None
+        if len(self._parsed) > self.CACHE_SIZE: self._parsed.clear()
+        self._parsed[m.group()] = seconds
+        return seconds
+
+    def time_at(self, data, pos, floor):
+        """Timestamp of the line starting at data[pos]; lines without one inherit the one before (down to floor)."""
+        for _ in range(self.MAX_LOOKBACK):
+            stop = data.find(b'\n', pos, pos + self.SEARCH_WIDTH)
+            seconds = self.parse(data[pos:stop if stop >= 0 else pos + self.SEARCH_WIDTH])
+            if seconds is not None or pos <= floor: return seconds
+            pos = data.rfind(b'\n', 0, pos - 1) + 1
+        return None
+
+    def search(self, data, seconds, start, end):
+        """Byte offset of the first line in data[start:end] stamped at or after `seconds` (end if there is none)."""
+        time_at = self.time_at
+        if start >= end: return end
+        first = time_at(data, start, start)
+        if first is not None and first >= seconds: return start
+        lo, hi = start, end
+        while True:
+            mid = data.rfind(b'\n', lo, (lo + hi) // 2) + 1
+            if mid <= lo: mid = data.find(b'\n', (lo + hi) // 2, hi - 1) + 1
+            if mid <= lo: return hi
+            t = time_at(data, mid, lo)
+            if t is not None and t >= seconds: hi = mid
+            else: lo = mid
+
+class TimestampIndex:
+    """
+    Sparse timestamp -> line index, for going to a point in time. While a file loads,
+    the first timestamped line after every STRIDE bytes is sampled; a lookup is a
+    binary search over the samples followed by one over the bytes between two of them,
+    so a jump into a multi-GB log parses a few dozen lines instead of scanning it.
+    Logs are assumed to be in time order: samples that go back in time are skipped.
+    """
+    STRIDE = 64 * 1024
+    MAX_PROBES = 64 # Lines without a timestamp skipped before a sample is given up
+
+    def __init__(self):
+        self.parser = TimestampParser()
+        self.lines = array('Q') # Line number of every sample
+        self.times = array('q') # Its timestamp in seconds since the epoch (ascending)
+        self._gap = 0 # Bytes fed since the last sample
+
+    def update(self, first_line, data):
+        lines, times = self.lines, self.times
+        if lines and lines[-1] >= first_line:
+            # The partial last line comes again, now complete: it is sampled anew
+            k = bisect_left(lines, first_line)
+            del lines[k:]
+            del times[k:]
+        end, pos, line, probes = len(data), 0, first_line, 0
+        target, last = max(0, self.STRIDE - self._gap), None
+        while target < end:
+            start = data.rfind(b'\n', pos, target) + 1 or pos
+            line += data.count(b'\n', pos, start)
+            pos = start
+            stop = data.find(b'\n', pos)
+            if stop < 0: break # A partial last line is sampled once it is complete
+            seconds = self.parser.parse(data[pos:stop])
+            if seconds is None and probes < self.MAX_PROBES:
+                target, probes = stop + 1, probes + 1 # No timestamp (e.g. a stack trace): try the next line
+                continue
+            if seconds is not None and (not times or seconds >= times[-1]):
+                lines.append(line)
+                times.append(seconds)
+                last = pos
+            target, probes = pos + self.STRIDE, 0
+        self._gap = end - last if last is not None else self._gap + end
+
+    def trim(self, first_line):
+        k = bisect_left(self.lines, first_line)
+        del self.lines[:k]
+        del self.times[:k]
+
+    def get_state(self):
+        return {"gap": self._gap}, [self.lines.tobytes(), self.times.tobytes()]
+
+    def set_state(self, state, blobs):
+        self.lines, self.times = array('Q', blobs[0]), array('q', blobs[1])
+        self._gap = state["gap"]
+
+    def block(self, seconds):
+        """Returns the lines (first, stop) between the samples around a point in time; stop is None past the last sample."""
+        k = bisect_left(self.times, seconds)
+        return (self.lines[k - 1] if k else 0), (self.lines[k] if k < len(self.lines) else None)
+
+# --- Stats Timeline ---
+class TimelineIndex:
+    """
+    Lines per level per minute, from the timestamps of the lines (see TimestampParser).
+    Fed like LevelIndex with every chunk of whole lines, so the counters grow while a file
+    loads or is watched; hours are summed up on demand.
+
+    Logs are written in time order, so a chunk is not parsed line by line: a binary
+    search over the bytes finds where the minute changes and every run of lines is
+    counted with one bytes.count per level. Lines without a timestamp (stack traces,
+    continuations) count towards the minute of the line before them. Lines trimmed in
+    ring-buffer mode stay counted.
+    """
+    SPARSE_LINES = 16 # Below this many lines per minute, every line is parsed instead
+
+    def __init__(self, levels=None):
+        self.levels = levels # LevelIndex the codes are read from when fed as a consumer
+        self.buckets = {} # minute since the epoch -> array('I') of line counts per level code
+        self.version = 0 # Bumped on every change, so views can skip redundant redraws
+        self.parser = TimestampParser()
+        self._minute = None # Minute of the last line seen, inherited by continuation lines
+        self._tail = None # (minute, code) of a partial last line; it is fed again once complete
+        self._step = 4096 # Bytes of the last run: where the next minute change is expected
+
+    def update(self, first_line, data):
+        self.add(data, self.levels.slice(first_line, first_line + data.count(b'\n') + 1))
+
+    def trim(self, first_line):
+        pass
+
+    def get_state(self):
+        minutes = array('q', self.buckets)
+        counts = array('I')
+        for minute in minutes: counts.extend(self.buckets[minute])
+        return {"minute": self._minute, "tail": self._tail, "step": self._step}, [minutes.tobytes(), counts.tobytes()]
+
+    def set_state(self, state, blobs):
+        minutes, counts = array('q', blobs[0]), array('I', blobs[1])
+        width = len(LevelIndex.NAMES) + 1
+        self.buckets = {minute: counts[i * width:(i + 1) * width] for i, minute in enumerate(minutes)}
+        self._minute, self._step = state["minute"], state["step"]
+        self._tail = tuple(state["tail"]) if state["tail"] else None
+        self.version += 1
+
+    def _minute_at(self, data, pos, floor):
+        seconds = self.parser.time_at(data, pos, floor)
+        return None if seconds is None else seconds // 60
+
+    def add(self, data, codes):
+        """Counts a chunk of lines (the last may be partial) with their level codes."""
+        if self._tail:
+            # The partial last line of the previous chunk comes again, now complete
+            minute, code = self._tail
+            self.buckets[minute][code] -= 1
+            self._tail = None
+        if self._is_sparse(data, len(codes)): self._count_lines(data, codes)
+        else: self._count_runs(data, codes)
+        self.version += 1
+
+    def _bucket(self, minute):
+        bucket = self.buckets.get(minute)
+        if bucket is None: bucket = self.buckets[minute] = array('I', bytes(4 * (len(LevelIndex.NAMES) + 1)))
+        return bucket
+
+    def _is_sparse(self, data, lines):
+        """True if a chunk spans so many minutes that parsing every line beats searching for the changes."""
+        first = self._minute_at(data, 0, 0)
+        last = self._minute_at(data, data.rfind(b'\n', 0, len(data) - 1) + 1, 0)
+        if first is None or last is None: return False
+        return lines < self.SPARSE_LINES * (abs(last - first) + 1)
+
+    def _count_lines(self, data, codes):
+        minute = self._minute
+        texts = data.split(b'\n')
+        if data.endswith(b'\n'): texts.pop() # An empty line after the last newline is not a line yet
+        parse, buckets = self.parser.parse, self.buckets
+        for text, code in zip(texts, codes):
+            seconds = parse(text)
+            if seconds is not None: minute = seconds // 60
+            elif minute is None: continue
+            bucket = buckets.get(minute)
+            if bucket is None: bucket = self._bucket(minute)
+            bucket[code] += 1
+        if minute is not None and not data.endswith(b'\n'): self._tail = (minute, codes[len(texts) - 1])
+        self._minute = minute
+
+    def _count_runs(self, data, codes):
+        pos = line = 0
+        end = len(data)
+        while pos < end:
+            minute = self._minute_at(data, pos, pos)
+            if minute is None: minute = self._minute
+            # Find the first line of a later minute: galloping from the length of the last run,
+            # then a binary search over byte positions
+            step, lo, hi = self._step, pos, None
+            while hi is None:
+                probe = data.rfind(b'\n', 0, min(lo + step, end)) + 1
+                if probe <= lo: probe = data.find(b'\n', lo, end) + 1 or end # Lines longer than step
+                if probe >= end: hi = end
+                elif self._minute_at(data, probe, lo) == minute: lo, step = probe, step * 2
+                else: hi = probe
+            while True:
+                mid = data.rfind(b'\n', lo, (lo + hi) // 2) + 1
+                if mid <= lo: mid = data.find(b'\n', (lo + hi) // 2, hi - 1) + 1
+                if mid <= lo: break
+                if self._minute_at(data, mid, lo) == minute: lo = mid
+                else: hi = mid
+            # An empty line after the last newline is not a line yet, a partial one is
+            count = data.count(b'\n', pos, hi) + (hi == end and not data.endswith(b'\n'))
+            if minute is not None and count:
+                bucket = self._bucket(minute)
+                run = codes[line:line + count]
+                total = len(run)
+                for level in LevelIndex.NAMES:
+                    n = run.count(level)
+                    bucket[level] += n
+                    total -= n
+                bucket[LevelIndex.NONE] += total
+                if hi == end and not data.endswith(b'\n'): self._tail = (minute, codes[line + count - 1])
+            self._minute = minute
+            self._step = max(1, hi - pos)
+            pos, line = hi, line + count
+
+    def merge(self, buckets):
+        """Adds the buckets of another TimelineIndex (chunks scanned in parallel)."""
+        for minute, counts in buckets.items():
+            bucket = self.buckets.get(minute)
+            if bucket is None: self.buckets[minute] = array('I', counts)
+            else:
+                for level, n in enumerate(counts): bucket[level] += n
+        self.version += 1
+
+    def series(self, resolution=60):
+        """Returns sorted [(bucket start in epoch seconds, [lines per level code])] per minute (60) or hour (3600)."""
+        merged = {}
+        for minute, counts in self.buckets.items():
+            key = minute * 60 // resolution * resolution
+            acc = merged.get(key)
+            if acc is None: merged[key] = list(counts)
+            else:
+                for level, n in enumerate(counts): acc[level] += n
+        return sorted(merged.items())
+
+# --- Log Templates ---
+class TemplateIndex:
+    """
+    One template ID per line, mined online with a Drain-style fixed-depth parse tree
+    (He et al., ICWS 2017): lines are grouped by token count, then by their first
+    tokens, and a leaf holds the templates a line is compared against. A line joins the
+    most similar template when at least SIMILARITY of its tokens match, and the tokens
+    that differ become wildcards; otherwise it starts a new template.
+
+    Fed like LevelIndex with every chunk of whole lines. Every digit of a chunk is turned
+    into 0 with one bytes.translate, and lines seen before in that form are resolved by a
+    dict lookup, so only new line shapes are tokenized and walk the tree. There the
+    timestamp (found as by TimestampParser) is cut off, so the level and the source lead
+    the tree; tokens with a digit (IDs, IPs, numbers) are masked as wildcards, and a level
+    name is never generalized: lines of different levels never share a template.
+    Template IDs are kept in an array('I'), which turns hiding templates into a mask.
+    """
+    DEPTH = 4 # Tree levels: token count, DEPTH - 2 leading tokens, leaf
+    SIMILARITY = 0.4
+    MAX_CHILDREN = 100 # Further distinct tokens at a tree level share the wildcard branch
+    MAX_CACHED = 200_000 # Line shapes remembered; the cache starts over past this
+    WILDCARD = b"<*>"
+    DIGITS = bytes(48 if 48 <= b <= 57 else b for b in range(256)) # Every digit -> "0"
+    # The timestamp (digits zeroed) with its fraction, time zone and closing bracket
+    TIMESTAMP = re.compile(b"(?:" + TimestampParser.TIMESTAMP.pattern + rb")(?:[.,]0+)?(?:Z| ?[+-]00:?00)?\]?")
+    LEVELS = frozenset(b"ERROR WARN WARNING INFO DEBUG TRACE FATAL CRITICAL NOTICE SEVERE".split())
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding # Of the lines, for template()
+        self.ids = array('I') # Template ID of every line from first_line on
+        self.first_line = 0
+        self.templates = [] # ID -> list of tokens (bytes)
+        self.counts = [] # ID -> lines currently indexed with it
+        self.version = 0 # Bumped on every change, so views can skip redundant redraws
+        self._tree = {} # token count -> {token: ... {None: [template IDs]}}
+        self._cache = {} # Line with its digits zeroed -> template ID
+
+    def update(self, first_line, data):
+        keep = first_line - self.first_line
+        if keep < len(self.ids): self._count(self.ids[keep:], -1) # The partial last line comes again
+        del self.ids[keep:]
+        lines = data.translate(self.DIGITS).split(b'\n')
+        new = self._mine(lines, len(lines) - 1 if lines[-1] else None) # A partial last line is fed again once complete
+        self._count(new, 1)
+        self.ids.extend(new)
+        self.version += 1
+
+    def count(self, data):
+        """Mines a chunk of complete lines for the counts only, keeping no ID per line (memory stays constant, CLI)."""
+        self._count(self._mine(data.translate(self.DIGITS).split(b'\n')), 1)
+        self.version += 1
+
+    def _mine(self, lines, partial=None):
+        """array('I') of the template IDs of lines with their digits zeroed; line `partial` does not shape templates."""
+        ids = list(map(self._cache.get, lines))
+        for i in compress(range(len(ids)), map(operator.is_, ids, repeat(None))):
+            line = lines[i]
+            ids[i] = self._cache.get(line)
+            if ids[i] is None:
+                stamp = self.TIMESTAMP.search(line, 0, TimestampParser.SEARCH_WIDTH)
+                if stamp: line = line[:stamp.start()] + line[stamp.end():]
+                tokens = [self.WILDCARD if b"0" in token else token for token in line.split()]
+                if i == partial: ids[i] = self._match(tokens, learn=False); continue
+                if len(self._cache) >= self.MAX_CACHED: self._cache.clear()
+                ids[i] = self._cache[lines[i]] = self._match(tokens)
+        return array('I', ids)
+
+    def trim(self, first_line):
+        drop = first_line - self.first_line
+        if drop <= 0: return
+        self._count(self.ids[:drop], -1)
+        del self.ids[:drop]
+        self.first_line = first_line
+        self.version += 1
+
+    def _count(self, ids, sign):
+        counts = self.counts
+        for tid, n in Counter(ids).items(): counts[tid] += sign * n
+
+    def _match(self, tokens, learn=True):
+        """The ID of the template a tokenized (masked) line belongs to, creating or (if learn) generalizing one."""
+        node = self._tree.setdefault(len(tokens), {})
+        for token in tokens[:self.DEPTH - 2]:
+            if token not in node: token = token if len(node) < self.MAX_CHILDREN else self.WILDCARD
+            node = node.setdefault(token, {})
+        leaf = node.setdefault(None, [])
+        best, best_score = None, (self.SIMILARITY if tokens else 0, -1)
+        levels = self._levels(tokens)
+        for tid in leaf:
+            template = self.templates[tid]
+            if self._levels(template) != levels: continue # Another level: never the same template
+            same = sum(map(operator.eq, template, tokens))
+            score = (same / len(tokens) if tokens else 1, template.count(self.WILDCARD))
+            if score >= best_score: best, best_score = tid, score
+        if best is None:
+            best = len(self.templates)
+            self.templates.append(list(tokens))
+            self.counts.append(0)
+            leaf.append(best)
+        elif learn:
+            template = self.templates[best]
+            for i, token in enumerate(tokens):
+                if template[i] != token: template[i] = self.WILDCARD
+        return best
+
+    def _levels(self, tokens):
+        """[(position, token)] of the level names among the tokens."""
+        return [(i, token) for i, token in enumerate(tokens) if token.strip(b"[]():|").upper() in self.LEVELS]
+
+    def template(self, tid):
+        return b" ".join(self.templates[tid]).decode(self.encoding, errors='replace')
+
+    def top(self):
+        """[(ID, line count)] of the templates in use, most frequent first."""
+        return sorted(((tid, n) for tid, n in enumerate(self.counts) if n), key=lambda item: -item[1])
+
+    def mask(self, hidden, start, stop):
+        """Keep mask (one byte per line, 0 = hidden template) of lines [start, stop); trimmed or unmined lines are kept."""
+        table = bytearray(b"\x01" * len(self.templates))
+        for tid in hidden:
+            if tid < len(table): table[tid] = 0
+        base = self.first_line
+        head = b"\x01" * max(0, min(stop, base) - start)
+        body = bytes(map(table.__getitem__, self.ids[max(0, start - base):max(0, stop - base)]))
+        return (head + body).ljust(stop - start, b"\x01")
+
+    def memory(self):
+        return _array_bytes(self.ids) + len(self._cache) * 120 + sum(map(len, self.templates)) * 48
+
+    def get_state(self):
+        return {"templates": [b" ".join(tokens).decode('latin-1') for tokens in self.templates]}, [self.ids.tobytes()]
+
+    def set_state(self, state, blobs):
+        self.__init__(self.encoding)
+        for text in state["templates"]:
+            tokens = text.encode('latin-1').split(b" ") if text else []
+            self.templates.append(tokens)
+            self.counts.append(0)
+            # Re-file the template in the tree so later lines find it
+            node = self._tree.setdefault(len(tokens), {})
+            for token in tokens[:self.DEPTH - 2]:
+                if token not in node and len(node) >= self.MAX_CHILDREN: token = self.WILDCARD
+                node = node.setdefault(token, {})
+            node.setdefault(None, []).append(len(self.templates) - 1)
+        self.ids.frombytes(blobs[0])
+        self._count(self.ids, 1)
+
+# --- Encoding Detection ---
+class EncodingDetector:
+    """
+    Detects a file's encoding with cheap checks first (BOM, pure ASCII, valid UTF-8)
+    and only falls back to chardet on a small sample. Results are cached per file, so
+    reopening a log and Live Watch reuse the same encoding.
+    """
+    SAMPLE_SIZE = 64 * 1024
+    CHARDET_SAMPLE_SIZE = 16 * 1024
+    # UTF-32 LE must be tested before UTF-16 LE, its BOM starts with the same two bytes
+    BOMS = ((codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+            (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+    _cache = {}
+
+    @classmethod
+    def detect(cls, file_path):
+        st = os.stat(file_path)
+        key = (os.path.realpath(file_path), st.st_dev, st.st_ino)
+        if key not in cls._cache:
+            with open_decompressed(file_path, detect_compression(file_path)) as f: cls._cache[key] = cls.detect_bytes(f.read(cls.SAMPLE_SIZE))
+        return cls._cache[key]
+
+    @classmethod
+    def detect_bytes(cls, sample):
+        for bom, encoding in cls.BOMS:
+            if sample.startswith(bom): return encoding
+        if sample.isascii(): return "utf-8"
+        try:
+            # final=False: a character cut off at the end of the sample is not an error
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+            return "utf-8"
+        except UnicodeDecodeError as e: bad = e.start
+        import chardet # Deferred: most logs never get this far, and chardet is slow to import
+        # chardet reads the lines around the first byte that is not UTF-8: a window from the
+        # start of the sample may hold nothing but ASCII
+        start = max(0, min(sample.rfind(b'\n', 0, bad) + 1, len(sample) - cls.CHARDET_SAMPLE_SIZE))
+        encoding = chardet.detect(sample[start:start + cls.CHARDET_SAMPLE_SIZE])['encoding']
+        # The sample is known to hold non-ASCII bytes: an "ascii" answer would turn them into U+FFFD
+        if not encoding or encoding.lower() == "ascii": return "cp1252"
+        return encoding
+
+class Transcoder:
+    """
+    Streams a source that cannot be memory-mapped as it is into a spool file: UTF-16/32
+    (converted to UTF-8, it cannot be split on b'\n') and compressed files other than
+    ASCII-compatible gzip (decompressed on the fly). An incremental decoder carries
+    characters split across chunk boundaries over to the next chunk, so the source is
+    read exactly once; Live Watch calls pump() again to convert appended bytes.
+    """
+    def __init__(self, source_path, encoding, compression=None):
+        self.source_path = source_path
+        self.decoder = None if LineIndex.is_ascii_compatible(encoding) else codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.encoding = encoding if self.decoder is None else "utf-8" # Encoding of the spool
+        self.position = 0 # Source bytes converted so far (decompressed bytes for a compressed source)
+        # Compressed sources can only be read forward: the stream stays open
+        self._raw = open(source_path, 'rb') if compression else None
+        self.stream = open_decompressed(self._raw, compression) if compression else None
+        import tempfile
+        self.spool = tempfile.NamedTemporaryFile(prefix="omnilog-", suffix=".log", delete=False)
+        self.path = self.spool.name
+
+    @property
+    def progress(self):
+        """Fraction of the source read so far (0.0 - 1.0)."""
+        total = os.path.getsize(self.source_path)
+        return min(1.0, (self._raw.tell() if self._raw else self.position) / total) if total else 1.0
+
+    def pump(self, max_bytes=None):
+        """Converts (up to max_bytes of) the source bytes written since the last call. Returns the bytes read."""
+        if self.stream: chunk = self.stream.read(max_bytes if max_bytes else -1)
+        else:
+            with open(self.source_path, 'rb') as source:
+                source.seek(self.position)
+                chunk = source.read(max_bytes if max_bytes else -1)
+        if chunk:
+            self.position += len(chunk)
+            self.spool.write(self.decoder.decode(chunk).encode('utf-8') if self.decoder else chunk)
+            self.spool.flush()
+        return len(chunk)
+
+    def close(self):
+        if self.stream: self.stream.close()
+        if self._raw: self._raw.close()
+        self.spool.close()
+        try: os.remove(self.path)
+        except OSError: pass
+
+# --- Compressed Sources ---
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"), (b"\x28\xb5\x2f\xfd", "zstd"))
+
+def detect_compression(file_path):
+    """Returns "gzip", "bz2", "xz" or "zstd" from a file's magic bytes (not its name), or None."""
+    with open(file_path, 'rb') as f: head = f.read(6)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic): return compression
+    return None
+
+def open_decompressed(source, compression):
+    """Opens a path or binary file object for reading its decompressed bytes front to back."""
+    if compression is None: return open(source, 'rb') if isinstance(source, str) else source
+    # Deferred: most logs are not compressed
+    if compression == "gzip":
+        import gzip
+        return gzip.open(source, 'rb')
+    if compression == "bz2":
+        import bz2
+        return bz2.open(source, 'rb')
+    if compression == "xz":
+        import lzma
+        return lzma.open(source, 'rb')
+    try: import zstandard
+    except ImportError: raise OSError("Reading .zst logs needs the zstandard package (pip install zstandard)")
+    return zstandard.ZstdDecompressor().stream_reader(open(source, 'rb') if isinstance(source, str) else source)
+
+class GzipSource:
+    """
+    The decompressed bytes of a gzip file with random access, used in place of a memory
+    map. pump() inflates the file front to back in SPAN pieces and keeps a seek point
+    (compressed offset + a copy of the zlib state, about 40 KB) at the start of each, so
+    a later read inflates at most one SPAN from the closest seek point instead of the
+    whole file from the start. The last CACHE_SPANS inflated spans are kept for scrolling.
+    """
+    SPAN = 4 * 1024 * 1024
+    CACHE_SPANS = 4
+    READ_SIZE = 256 * 1024
+
+    def __init__(self, path):
+        import zlib # Deferred with the other decompressors
+        self.path = path
+        self.points = [(0, zlib.decompressobj(zlib.MAX_WBITS | 16))] # (compressed offset, inflater state) at span k * SPAN
+        self.size = 0 # Bytes inflated so far
+        self.complete = False
+        self._spans = {} # span number -> bytes, least recently used first
+        self._lock = threading.Lock()
+        self._zlib = zlib
+
+    def __len__(self):
+        return self.size
+
+    def memory(self):
+        """Approximate bytes of the cached spans and seek points."""
+        return sum(map(len, list(self._spans.values()))) + len(self.points) * 40 * 1024
+
+    @property
+    def progress(self):
+        if self.complete: return 1.0
+        total = os.path.getsize(self.path)
+        return min(1.0, self.points[-1][0] / total) if total else 1.0
+
+    def _inflate(self, pos, inflater, want):
+        """Inflates up to `want` bytes from compressed offset pos. Returns (data, inflater, offset after the input used)."""
+        out, n, buf = [], 0, b""
+        with open(self.path, 'rb') as f:
+            f.seek(pos)
+            while n < want:
+                if not buf:
+                    buf = f.read(self.READ_SIZE)
+                    if not buf: break
+                # Concatenated gzip members (e.g. appended by log rotation) follow each other
+                if inflater.eof: inflater = self._zlib.decompressobj(self._zlib.MAX_WBITS | 16)
+                try: data = inflater.decompress(buf, want - n)
+                except self._zlib.error: break # Trailing garbage or a truncated file: stop at what was readable
+                used = len(buf) - len(inflater.unused_data if inflater.eof else inflater.unconsumed_tail)
+                pos, buf = pos + used, buf[used:]
+                out.append(data)
+                n += len(data)
+        return b"".join(out), inflater, pos
+
+    def _cache(self, k, data):
+        with self._lock:
+            self._spans.pop(k, None)
+            self._spans[k] = data
+            while len(self._spans) > self.CACHE_SPANS: del self._spans[next(iter(self._spans))]
+
+    def pump(self, max_bytes=None):
+        """Inflates the next span(s), about max_bytes (all if None). Returns the compressed bytes consumed (0 at the end)."""
+        consumed = produced = 0
+        while not self.complete and (not max_bytes or produced < max_bytes):
+            pos, inflater = self.points[-1]
+            data, inflater, end = self._inflate(pos, inflater.copy(), self.SPAN)
+            self._cache(len(self.points) - 1, data)
+            self.size += len(data)
+            consumed, produced = consumed + end - pos, produced + len(data)
+            if len(data) < self.SPAN: self.complete = True
+            else: self.points.append((end, inflater))
+        return consumed
+
+    def _span(self, k):
+        with self._lock:
+            data = self._spans.get(k)
+        if data is None:
+            pos, inflater = self.points[k]
+            data = self._inflate(pos, inflater.copy(), self.SPAN)[0]
+        self._cache(k, data)
+        return data
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.size)
+        parts = []
+        for k in range(start // self.SPAN, (stop - 1) // self.SPAN + 1 if stop > start else 0):
+            base = k * self.SPAN
+            parts.append(self._span(k)[max(0, start - base):stop - base])
+        return b"".join(parts)
+
+    def find(self, sub, start=0, end=None):
+        end = self.size if end is None else min(end, self.size)
+        while start < end:
+            stop = min(end, (start // self.SPAN + 1) * self.SPAN + len(sub) - 1) # Overlap for a match across spans
+            i = self[start:stop].find(sub)
+            if i >= 0: return start + i
+            start = (start // self.SPAN + 1) * self.SPAN
+        return -1
+
+    def rfind(self, sub, start=0, end=None):
+        end = self.size if end is None else min(end, self.size)
+        while start < end:
+            base = max(start, (end - 1) // self.SPAN * self.SPAN - len(sub) + 1)
+            i = self[base:end].rfind(sub)
+            if i >= 0: return base + i
+            end = base + len(sub) - 1
+            if base == start: break
+        return -1
+
+    def close(self):
+        with self._lock: self._spans.clear()
+        self.points = self.points[:1]
+
+# --- Line Offset Index ---
+def _array_bytes(*arrays):
+    return sum(len(a) * a.itemsize for a in arrays)
+
+class LineIndex:
+    """
+    Memory-maps a log source and stores the byte offset of every line start.
+    The text itself is never copied: lines are sliced out of the map on demand,
+    so memory grows by 8 bytes per line. Line -> byte lookups are O(1) and
+    byte -> line lookups are a binary search over the offsets.
+    """
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, file_path=None, data=None, encoding="utf-8", transcoder=None):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.transcoder = transcoder # Produces the data of UTF-16/32 and compressed sources (a spool or a GzipSource)
+        self.offsets = array('Q', [0]) # offsets[i] = start of line first_line + i
+        self.first_line = 0 # Lines dropped from the head so far (ring-buffer mode)
+        self.max_lines = None # Ring-buffer mode: keep only the last N lines while indexing
+        self.size = 0 # Bytes indexed so far
+        self.levels = LevelIndex()
+        self.timeline = TimelineIndex(self.levels)
+        self.timestamps = TimestampIndex()
+        self.templates = TemplateIndex(encoding)
+        self.consumers = [self.levels, self.timeline, self.timestamps, self.templates] # Per-line indexes fed with every chunk of whole lines (update/trim)
+        self.trigrams = None # Optional TrigramIndex, built in the background once the log is loaded
+        self.fields = None # Optional FieldStore, created by the first field query
+        self.closed = False
+        self._lock = threading.Lock() # Guards offsets/size/map swaps against readers
+        self._build_lock = threading.RLock() # Serializes the loader, Live Watch and trimming
+        self._fh = open(file_path, 'rb') if file_path else None
+        self._map = data if data is not None else b""
+
+    @classmethod
+    def from_text(cls, text):
+        """Builds an in-memory index (used for clipboard content)."""
+        index = cls(data=text.encode('utf-8'))
+        index.extend()
+        return index
+
+    @staticmethod
+    def is_ascii_compatible(encoding):
+        """True if a newline is the single byte 0x0A in this encoding."""
+        try: encoding = codecs.lookup(encoding).name
+        except LookupError: return False
+        return encoding == "utf-8-sig" or "\n".encode(encoding) == b"\n"
+
+    @property
+    def line_count(self):
+        """Number of lines seen so far, including those trimmed from the head."""
+        return self.first_line + len(self.offsets)
+
+    @property
+    def source_size(self):
+        if not self._fh: return len(self._map)
+        return os.fstat(self._fh.fileno()).st_size
+
+    @property
+    def progress(self):
+        """Fraction of the source indexed so far (0.0 - 1.0)."""
+        if self.transcoder is not None: return self.transcoder.progress
+        total = self.source_size
+        return min(1.0, self.size / total) if total else 1.0
+
+    def _remap(self):
+        """Re-maps the file if it grew; a map has a fixed length once created."""
+        size = self.source_size
+        if self._fh and size > len(self._map):
+            new_map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            with self._lock:
+                old_map, self._map = self._map, new_map
+            if isinstance(old_map, mmap.mmap): old_map.close()
+        return min(size, len(self._map))
+
+    def extend(self, max_bytes=None):
+        """Indexes (up to max_bytes of) the data written since the last call. Returns the number of new lines."""
+        with self._build_lock:
+            before = self.line_count
+            pos, end = self.size, self._remap()
+            if max_bytes: end = min(end, pos + max_bytes)
+            while pos < end:
+                stop = min(pos + self.CHUNK_SIZE, end)
+                chunk = self._map[pos:stop]
+                if stop < end:
+                    # Cut at the last newline so consumers always see whole lines
+                    cut = chunk.rfind(b'\n') + 1
+                    if cut: chunk = chunk[:cut]
+                # Line starts = cumulative (length + 1) of every newline-terminated part
+                parts = chunk.split(b'\n')
+                starts = accumulate(map((1).__add__, map(len, parts[:-1])), initial=pos)
+                next(starts)
+
+                # The previous last line may have been partial: consumers restart from its beginning
+                first_line, line_start = self.line_count - 1, self.offsets[-1]
+                data = chunk if line_start == pos else self._map[line_start:pos + len(chunk)]
+                for consumer in self.consumers: consumer.update(first_line, data)
+
+                with self._lock:
+                    self.offsets.extend(starts)
+                    self.size = pos = pos + len(chunk)
+                if self.max_lines: self.trim(self.max_lines)
+            return self.line_count - before
+
+    def build(self, on_progress=None, interval=0.25, stopped=None):
+        """
+        Indexes the whole source chunk by chunk (call from a worker thread).
+        on_progress(done) fires after the first chunk, so the first screen can be
+        shown at once, and then at most every `interval` seconds. With a transcoder,
+        every step first converts the next chunk of the source. Returns early once
+        stopped() is true or the index is closed.
+        """
+        last_report = 0
+        while True:
+            if (stopped and stopped()) or self.closed: return
+            fed = self.transcoder.pump(self.CHUNK_SIZE) if self.transcoder is not None else 0
+            self.extend(self.CHUNK_SIZE)
+            done = not fed and self.size >= self.source_size
+            if on_progress and (done or time.monotonic() - last_report >= interval):
+                last_report = time.monotonic()
+                on_progress(done)
+            if done: return
+
+    def refresh(self):
+        """Picks up data appended to the source (Live Watch). Returns the number of new lines."""
+        if self.transcoder is not None: self.transcoder.pump()
+        return self.extend()
+
+    def trim(self, keep):
+        """
+        Ring-buffer mode: forgets the offsets (and consumer data) of all but the last
+        `keep` lines, so memory stays constant while a log grows. Line numbers are not
+        shifted: lines before first_line simply cannot be read any more.
+        """
+        with self._build_lock:
+            drop = len(self.offsets) - max(1, keep)
+            if drop <= 0: return
+            with self._lock:
+                del self.offsets[:drop]
+                self.first_line += drop
+            for consumer in self.consumers: consumer.trim(self.first_line)
+
+    def line_span(self, line):
+        """Returns the (start, end) byte range of a line, end excluding the newline. O(1)."""
+        with self._lock:
+            i = line - self.first_line
+            start = self.offsets[i]
+            end = self.offsets[i + 1] - 1 if i + 1 < len(self.offsets) else self.size
+        return start, end
+
+    def line_at_offset(self, offset):
+        """Returns the line containing the given byte offset. O(log n)."""
+        return self.first_line + max(0, bisect_right(self.offsets, offset) - 1)
+
+    def line_at_time(self, seconds):
+        """Returns the first line stamped at or after `seconds` (line_count if the log ends before). O(log n)."""
+        with self._build_lock:
+            first, stop = self.timestamps.block(seconds)
+            first = max(first, self.first_line)
+            start = self.line_span(first)[0]
+            end = self.line_span(max(stop, first))[0] if stop is not None else self.size
+            pos = self.timestamps.parser.search(self._map, seconds, start, end)
+            if pos >= self.size: return self.line_count
+            return self.line_at_offset(pos)
+
+    def time_of_line(self, line):
+        """Returns the timestamp of a line (or of the closest line before it that has one), or None."""
+        with self._build_lock:
+            start = self.line_span(max(line, self.first_line))[0]
+            seconds = self.timestamps.parser.time_at(self._map, start, 0)
+        if seconds is None and self.timestamps.times: seconds = self.timestamps.times[0]
+        return seconds
+
+    def read(self, start, end):
+        """Returns the raw bytes [start, end) of the source."""
+        return self._map[start:end]
+
+    def get_text(self, start, stop):
+        """Returns the decoded lines [start, stop) without line terminators."""
+        with self._lock:
+            first, count = self.first_line, len(self.offsets)
+            trimmed = max(0, min(stop, first + count, first) - start) # Lines dropped from the head read as empty
+            stop = min(stop - first, count)
+            start = max(0, start - first)
+            if start >= stop: return [""] * trimmed
+            a = self.offsets[start]
+            b = self.offsets[stop] if stop < count else self.size
+            raw = self._map[a:b]
+        raw = raw.replace(b'\r\n', b'\n')
+        return [""] * trimmed + raw.decode(self.encoding, 'replace').split('\n')[:stop - start]
+
+    def get_text_at(self, lines):
+        """Decodes the given sorted line indices, reading each contiguous run in one go."""
+        if isinstance(lines, range): return self.get_text(lines.start, lines.stop)
+        out = []
+        run_start = prev = None
+        for i in lines:
+            if prev is not None and i == prev + 1:
+                prev = i
+                continue
+            if run_start is not None: out.extend(self.get_text(run_start, prev + 1))
+            run_start = prev = i
+        if run_start is not None: out.extend(self.get_text(run_start, prev + 1))
+        return out
+
+    def close(self):
+        """Releases the source and everything indexed over it at once, even if something still holds the index."""
+        self.closed = True
+        with self._lock:
+            if isinstance(self._map, mmap.mmap): self._map.close()
+            self._map = b""
+            self.offsets, self.size = array('Q', [0]), 0
+        if self._fh: self._fh.close()
+        if self.transcoder is not None: self.transcoder.close()
+        self.levels, self.timestamps, self.templates = LevelIndex(), TimestampIndex(), TemplateIndex(self.encoding)
+        self.timeline = TimelineIndex(self.levels)
+        self.consumers = []
+        self.trigrams = self.fields = None
+
+    def memory(self):
+        """Approximate bytes held per part of the index (diagnostics; the memory map itself is the OS's page cache)."""
+        usage = {"offsets": _array_bytes(self.offsets), "levels": len(self.levels.codes),
+                 "timeline": len(self.timeline.buckets) * 120, # Dict entry + array('I') of 5 counters
+                 "timestamps": _array_bytes(self.timestamps.lines, self.timestamps.times), "templates": self.templates.memory()}
+        if self.trigrams is not None: usage["trigrams"] = self.trigrams.memory()
+        if self.fields is not None: usage["fields"] = self.fields.memory()
+        if isinstance(self.transcoder, GzipSource): usage["gzip"] = self.transcoder.memory()
+        return usage
+
+# --- Background Tasks ---
+THREAD_WORKERS = min(32, (os.cpu_count() or 1) + 4) # Loading and searching mostly wait on I/O or C-level work
+_thread_pool = None
+_thread_pool_lock = threading.Lock()
+
+def thread_pool():
+    """The shared bounded thread pool of background tasks (loading, indexing, searches), created on first use."""
+    global _thread_pool
+    from concurrent.futures import ThreadPoolExecutor
+    with _thread_pool_lock:
+        if _thread_pool is None: _thread_pool = ThreadPoolExecutor(THREAD_WORKERS, thread_name_prefix="omnilog")
+    return _thread_pool
+
+def thread_pool_status():
+    """(worker threads started, tasks queued) of the shared pool, for diagnostics."""
+    if _thread_pool is None: return 0, 0
+    return len(_thread_pool._threads), _thread_pool._work_queue.qsize() # No public API for either
+
+class Task:
+    """One piece of background work; the work polls stopped() between chunks and returns once it is cancelled."""
+    __slots__ = ("name", "future", "started", "_cancelled")
+
+    def __init__(self, name):
+        self.name = name
+        self.future = None
+        self.started = None # time.monotonic() when a worker picked it up
+        self._cancelled = threading.Event()
+
+    def stopped(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future: self.future.cancel() # Still queued: never runs
+
+    @property
+    def state(self):
+        if self.future.done(): return "done"
+        return "running" if self.started is not None else "queued"
+
+class TaskGroup:
+    """
+    The background tasks of one owner (a tab) on the shared thread pool. cancel() drops
+    the tasks still queued and stops the running ones at their next stopped() check;
+    no task can be submitted afterwards, so a closed tab cannot start new work.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.cancelled = False
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args):
+        """Runs fn(task, *args) on the shared pool. Returns the Task, or None once the group is cancelled."""
+        task = Task(name)
+        with self._lock:
+            if self.cancelled: return None
+            self._tasks = [t for t in self._tasks if not t.future.done()]
+            task.future = thread_pool().submit(self._run, task, fn, args)
+            self._tasks.append(task)
+        return task
+
+    @staticmethod
+    def _run(task, fn, args):
+        if task.stopped(): return None
+        task.started = time.monotonic()
+        return fn(task, *args)
+
+    def active(self):
+        """The tasks queued or running."""
+        with self._lock: return [t for t in self._tasks if not t.future.done()]
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            tasks, self._tasks = self._tasks, []
+        for task in tasks: task.cancel()
+
+# --- Background Search ---
+def required_literals(pattern):
+    """
+    Returns literal strings that every match of a regex contains, e.g. ["timeout after ",
+    "ms"] for r"timeout after \\d+ms". Alternatives, optional parts and character classes
+    end a literal; a regex with a top-level alternation gives [].
+    """
+    try: from re import _parser as sre_parse # Deferred: only regex searches need it
+    except ImportError: import sre_parse # Python < 3.11
+    try: parsed = sre_parse.parse(pattern)
+    except Exception: return []
+    literals, current = [], []
+
+    def flush():
+        if current: literals.append("".join(current))
+        current.clear()
+
+    def walk(items):
+        for op, arg in items:
+            if op is sre_parse.LITERAL and arg != 10: current.append(chr(arg)) # A newline would span two lines
+            elif op is sre_parse.SUBPATTERN: walk(arg[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+                flush()
+                walk(arg[2]) # The repeated part occurs at least once
+                flush()
+            else: flush()
+
+    if any(op is sre_parse.BRANCH for op, _ in parsed): return []
+    walk(parsed)
+    flush()
+    return literals
+
+class TermPattern:
+    """
+    A case-insensitive search term. Plain literals are located with str.find on a
+    lower-cased copy of each block, which is far faster than an IGNORECASE regex;
+    regex terms (or blocks whose length changes when lower-cased) use re.
+    """
+    def __init__(self, term, use_regex=False):
+        self.literal = None if use_regex else term.lower()
+        self.regex = re.compile(term, re.IGNORECASE | re.MULTILINE) if use_regex else None
+
+    def literals(self):
+        """Substrings every match contains, used to pre-filter lines with a TrigramIndex."""
+        if self.literal is not None: return [self.literal]
+        return required_literals(self.regex.pattern)
+
+    def _literal_regex(self):
+        if self.regex is None: self.regex = re.compile(re.escape(self.literal), re.IGNORECASE | re.MULTILINE)
+        return self.regex
+
+    def spans(self, block):
+        """Yields the (start, end) of every match in the block, in order."""
+        if self.literal is not None:
+            lit = self.literal
+            lowered = block.lower()
+            if lit and len(lowered) == len(block):
+                pos = lowered.find(lit)
+                while pos >= 0:
+                    yield pos, pos + len(lit)
+                    pos = lowered.find(lit, pos + len(lit))
+                return
+        for m in (self.regex or self._literal_regex()).finditer(block):
+            yield m.start(), m.end()
+
+    def line_mask(self, texts):
+        """
+        Returns one byte per line, 1 if the line contains a match. The per-line tests run
+        through map() over C functions, so there is no Python-level loop per line.
+        """
+        if self.literal is not None:
+            lowered = "\n".join(texts).lower().split("\n")
+            return bytes(map(operator.contains, lowered, repeat(self.literal)))
+        return bytes(map(bool, map(self.regex.search, texts)))
+
+class SearchMatches:
+    """Compact match store: parallel arrays of line, start col and end col, sorted by line."""
+    __slots__ = ("lines", "starts", "ends")
+
+    def __init__(self):
+        self.lines = array('Q')
+        self.starts = array('L')
+        self.ends = array('L')
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, i):
+        return self.lines[i], self.starts[i], self.ends[i]
+
+    def memory(self):
+        return _array_bytes(self.lines, self.starts, self.ends)
+
+    def append(self, line, start, end):
+        self.lines.append(line)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def extend(self, other):
+        self.lines.extend(other.lines)
+        self.starts.extend(other.starts)
+        self.ends.extend(other.ends)
+
+    def first_from_line(self, line):
+        """Returns the position of the first match on or after a line."""
+        return bisect_left(self.lines, line)
+
+    def trim(self, first_line):
+        """Drops the matches before first_line (ring-buffer mode). Returns how many were dropped."""
+        k = bisect_left(self.lines, first_line)
+        if k:
+            del self.lines[:k]
+            del self.starts[:k]
+            del self.ends[:k]
+        return k
+
+class SearchEngine:
+    """
+    Runs a regex over batches of lines on a worker thread and streams the matches
+    back in batches. Starting a new search cancels the one still in flight.
+    """
+    FLUSH_INTERVAL = 0.1 # Seconds between two streamed batches
+
+    def __init__(self, tasks=None):
+        self._cancel = None
+        self.tasks = tasks # TaskGroup whose pool runs the searches; without one, each search gets a thread
+
+    def start(self, pattern, batches, on_batch, on_done):
+        """
+        Scans `batches` of (line indices, texts) in the background. on_batch(matches) is
+        called with partial results, on_done(matches) with the last ones (both off the UI thread).
+        """
+        self.cancel()
+        cancel = self._cancel = threading.Event()
+        args = (pattern, batches, on_batch, on_done, cancel)
+        if self.tasks is not None: self.tasks.submit("search", lambda task: self._run(*args))
+        else: threading.Thread(target=self._run, args=args, daemon=True).start()
+
+    def cancel(self):
+        if self._cancel: self._cancel.set()
+
+    def _run(self, pattern, batches, on_batch, on_done, cancel):
+        pending = SearchMatches()
+        last_flush = time.monotonic()
+        for lines, texts in batches:
+            if cancel.is_set(): return
+            self.scan(pattern, lines, texts, pending)
+            if len(pending) and time.monotonic() - last_flush >= self.FLUSH_INTERVAL:
+                on_batch(pending)
+                pending = SearchMatches()
+                last_flush = time.monotonic()
+        if not cancel.is_set(): on_done(pending)
+
+    @staticmethod
+    def scan(pattern, lines, texts, out):
+        """Runs the TermPattern once over a whole batch and maps every match back to its line."""
+        block = "\n".join(texts)
+        starts = list(accumulate(map((1).__add__, map(len, texts)), initial=0))
+        for match_start, match_end in pattern.spans(block):
+            row = bisect_right(starts, match_start) - 1
+            start = match_start - starts[row]
+            end = min(match_end - starts[row], len(texts[row])) # Matches never span two lines
+            out.append(lines[row], start, max(end, start + 1))
+
+# --- Filtered View ---
+class LineRuns:
+    """
+    The visible lines of a filtered view as sorted [start, stop) runs of file lines.
+    Row -> line and line -> row lookups are binary searches over the run table,
+    so a filter costs memory per contiguous run instead of per line.
+    """
+    RUN_PATTERN = re.compile(b"\x01+")
+
+    def __init__(self):
+        self.starts = array('Q')
+        self.stops = array('Q')
+        self.rows = array('Q', [0]) # rows[k] = view rows before run k, rows[-1] = total
+
+    def __len__(self):
+        return self.rows[-1]
+
+    def memory(self):
+        return _array_bytes(self.starts, self.stops, self.rows)
+
+    def add_run(self, start, stop):
+        """Appends the lines [start, stop); runs must be added in ascending order."""
+        if start >= stop: return
+        if self.stops and self.stops[-1] == start:
+            self.stops[-1] = stop
+            self.rows[-1] += stop - start
+        else:
+            self.starts.append(start)
+            self.stops.append(stop)
+            self.rows.append(self.rows[-1] + stop - start)
+
+    def add_mask(self, mask, first_line):
+        """Appends the runs of a keep mask (one byte per line, 1 = visible) starting at first_line."""
+        for m in self.RUN_PATTERN.finditer(mask):
+            self.add_run(first_line + m.start(), first_line + m.end())
+
+    def __getitem__(self, rows):
+        """Returns the file lines shown at a slice of view rows."""
+        start, stop, _ = rows.indices(len(self))
+        lines = []
+        k = bisect_right(self.rows, start) - 1
+        while start < stop and k < len(self.starts):
+            offset = start - self.rows[k]
+            take = min(stop - start, self.stops[k] - self.starts[k] - offset)
+            lines.extend(range(self.starts[k] + offset, self.starts[k] + offset + take))
+            start += take
+            k += 1
+        return lines
+
+    def trim(self, first_line):
+        """Drops the lines before first_line (ring-buffer mode). Returns how many rows were dropped."""
+        k = bisect_right(self.stops, first_line) # Runs that end before first_line are gone
+        dropped = self.rows[k]
+        del self.starts[:k]
+        del self.stops[:k]
+        if self.starts and self.starts[0] < first_line:
+            dropped += first_line - self.starts[0]
+            self.starts[0] = first_line
+        if dropped: self.rows = array('Q', [0]) + array('Q', (rows - dropped for rows in self.rows[k + 1:]))
+        return dropped
+
+    def extend(self, other, offset=0):
+        """Appends the runs of another LineRuns, shifted by `offset` lines (merging chunk results)."""
+        for start, stop in zip(other.starts, other.stops): self.add_run(start + offset, stop + offset)
+
+    def intersect(self, other):
+        """Returns the LineRuns of the lines visible in both views."""
+        out = LineRuns()
+        i = j = 0
+        while i < len(self.starts) and j < len(other.starts):
+            out.add_run(max(self.starts[i], other.starts[j]), min(self.stops[i], other.stops[j]))
+            if self.stops[i] < other.stops[j]: i += 1
+            else: j += 1
+        return out
+
+    def __contains__(self, line):
+        k = bisect_right(self.starts, line) - 1
+        return k >= 0 and line < self.stops[k]
+
+    def row_of_line(self, line):
+        """Returns the view row of a line, or of the next visible line if it is hidden."""
+        k = bisect_right(self.starts, line) - 1
+        if k < 0: return 0
+        if line < self.stops[k]: return self.rows[k] + line - self.starts[k]
+        return self.rows[k + 1]
+
+# --- Trigram Index ---
+def _encode_postings(ids, last=-1):
+    """Delta + varint encodes ascending block ids that follow block `last`; mostly one byte per id."""
+    deltas = list(map(operator.sub, ids, [last] + list(ids[:-1])))
+    if max(deltas) < 128: return bytes(deltas)
+    out = bytearray()
+    for d in deltas:
+        while d >= 128:
+            out.append(d & 127 | 128)
+            d >>= 7
+        out.append(d)
+    return bytes(out)
+
+def _decode_postings(data):
+    """Returns the block ids of an encoded posting list."""
+    if data.isascii(): deltas = data # No delta needed a second byte
+    else:
+        deltas, value, shift = [], 0, 0
+        for b in data:
+            value |= (b & 127) << shift
+            if b & 128: shift += 7
+            else:
+                deltas.append(value)
+                value = shift = 0
+    ids = accumulate(deltas, initial=-1)
+    next(ids)
+    return ids
+
+def _chunk_trigrams(data, block_size):
+    """
+    Splits a chunk of whole lines into blocks of about block_size bytes and returns
+    (block start offsets, {trigram: (encoded block ids, last block id)}). Only trigrams
+    within whitespace-separated words are indexed: the distinct words of a block are
+    joined and read through four aligned array('I') views, one 4-gram per item, so
+    finding them costs C-level work only.
+    """
+    starts, postings = array('Q'), {}
+    pos, end, block = 0, len(data), 0
+    while pos < end:
+        stop = data.rfind(b'\n', pos, pos + block_size) + 1 if pos + block_size < end else end
+        if stop <= pos: stop = data.find(b'\n', pos + block_size) + 1 or end # A line longer than a block
+        text = b" ".join(set(data[pos:stop].lower().split())) + b"   "
+        quads = set()
+        for k in range(4): quads.update(array('I', text[k:k + (len(text) - k) // 4 * 4]))
+        trigrams = set(map(operator.and_, quads, repeat(0xFFFFFF))) # The two trigrams of every 4-gram
+        trigrams.update(map(operator.rshift, quads, repeat(8)))
+        get = postings.get
+        for trigram in trigrams:
+            ids = get(trigram)
+            if ids is None: postings[trigram] = array('I', (block,))
+            else: ids.append(block)
+        starts.append(pos)
+        pos, block = stop, block + 1
+    return starts, {trigram: (_encode_postings(ids), ids[-1]) for trigram, ids in postings.items()}
+
+class TrigramIndex:
+    """
+    Inverted index from the trigrams in the words of a log (3 bytes, ASCII lower-cased)
+    to the blocks of about BLOCK_SIZE bytes containing them. A search intersects the posting lists of
+    its literals' trigrams and only verifies the candidate blocks, plus whatever was
+    appended after the last extend(). Posting lists are delta + varint encoded (mostly a
+    byte per block), so the index stays at a few percent of the log. Built in the
+    background once a large log is loaded and saved with its IndexCache entry.
+    """
+    BLOCK_SIZE = 64 * 1024
+    MIN_SIZE = 32 * 1024 * 1024 # Smaller logs are scanned faster than the index pays off
+
+    def __init__(self):
+        self.blocks = array('Q') # Start offset of every block
+        self.size = 0 # Bytes indexed; the blocks cover [0, size)
+        self.postings = {} # trigram (int of its 3 bytes in native order) -> bytearray of encoded block ids
+        self._last = {} # trigram -> its last block id, to append to its posting list
+        self._lock = threading.Lock()
+
+    def memory(self):
+        """Approximate bytes held (block offsets, posting lists and their dict entries)."""
+        with self._lock: return _array_bytes(self.blocks) + sum(map(len, self.postings.values())) + len(self.postings) * 160
+
+    @classmethod
+    def worthwhile(cls, index):
+        return index.size >= cls.MIN_SIZE and not index.max_lines and LineIndex.is_ascii_compatible(index.encoding)
+
+    @staticmethod
+    def trigrams(literal):
+        """The trigram keys of a search literal: only those within its words, of printable ASCII (blocks are lower-cased byte-wise)."""
+        keys = set()
+        for piece in re.split(r"[^\x21-\x7e]+", literal.lower()):
+            data = piece.encode('ascii')
+            keys.update(int.from_bytes(data[i:i + 3], sys.byteorder) for i in range(len(data) - 2))
+        return keys
+
+    def extend(self, index, stopped=None):
+        """
+        Indexes the whole lines added to an index since the last call (worker thread).
+        Large ranges go through the ParallelScanner; stopped() is polled between chunks.
+        """
+        start = self.size
+        end = index.line_span(index.line_count - 1)[0] # The last line may be incomplete
+        if end <= start: return
+        if index.file_path and ParallelScanner.worthwhile(end - start, index.encoding):
+            chunks = (result for _, _, result in ParallelScanner(index.file_path, index.encoding).scan("trigrams", start=start, end=end))
+        else: chunks = self._chunks(index, start, end)
+        for length, starts, postings in chunks:
+            if (stopped and stopped()) or index.closed: return
+            self._merge(length, starts, postings)
+
+    def _chunks(self, index, pos, end):
+        while pos < end:
+            data = index.read(pos, min(end, pos + ParallelScanner.CHUNK_SIZE))
+            if not data: return
+            if pos + len(data) < end: data = data[:data.rfind(b'\n') + 1 or len(data)]
+            pos += len(data)
+            yield (len(data),) + _chunk_trigrams(data, self.BLOCK_SIZE)
+
+    def _merge(self, length, starts, postings):
+        """Appends the blocks of a chunk; its block ids start at 0 and are shifted behind the existing ones."""
+        first = len(self.blocks)
+        with self._lock:
+            for trigram, (encoded, last) in postings.items():
+                # Re-base the first delta of the chunk's list, the rest is relative already
+                pos = 0
+                while encoded[pos] & 128: pos += 1
+                head = _decode_postings(encoded[:pos + 1])
+                ids = self.postings.get(trigram)
+                if ids is None: ids = self.postings[trigram] = bytearray()
+                ids += _encode_postings([first + next(head)], self._last.get(trigram, -1))
+                ids += encoded[pos + 1:]
+                self._last[trigram] = first + last
+            self.blocks.extend(self.size + offset for offset in starts)
+            self.size += length
+
+    def candidates(self, literals):
+        """
+        Returns the sorted (start, end) byte ranges that can contain all literals: the
+        blocks holding all their trigrams, then the unindexed rest (end None). Returns
+        None if the literals have no trigram to look up.
+        """
+        keys = set()
+        for literal in literals: keys |= self.trigrams(literal)
+        if not keys: return None
+        with self._lock:
+            lists = sorted((self.postings.get(key, b"") for key in keys), key=len)
+            ids = set(_decode_postings(lists[0]))
+            for encoded in lists[1:]:
+                if not ids: break
+                ids.intersection_update(_decode_postings(encoded))
+            blocks, size = self.blocks, self.size
+            ranges = [(blocks[b], blocks[b + 1] if b + 1 < len(blocks) else size) for b in sorted(ids)]
+        ranges.append((size, None))
+        return ranges
+
+    def candidate_lines(self, index, literals):
+        """candidates() as LineRuns of an index, or None if nothing can be ruled out."""
+        ranges = self.candidates(literals)
+        if ranges is None: return None
+        runs = LineRuns()
+        first = index.first_line
+        for start, end in ranges:
+            stop = index.line_count if end is None else index.line_at_offset(end - 1) + 1
+            runs.add_run(max(first, index.line_at_offset(start)), stop)
+        return runs
+
+    def get_state(self):
+        with self._lock:
+            keys = array('I', self.postings)
+            lengths = array('Q', map(len, self.postings.values()))
+            lasts = array('I', map(self._last.__getitem__, keys))
+            return {"size": self.size}, [self.blocks.tobytes(), keys.tobytes(), lengths.tobytes(), lasts.tobytes(), b"".join(self.postings.values())]
+
+    def set_state(self, state, blobs):
+        keys, lengths, lasts = array('I', blobs[1]), array('Q', blobs[2]), array('I', blobs[3])
+        data, pos, postings = blobs[4], 0, {}
+        for key, length in zip(keys, lengths):
+            postings[key] = bytearray(data[pos:pos + length])
+            pos += length
+        with self._lock:
+            self.blocks, self.size = array('Q', blobs[0]), state["size"]
+            self.postings, self._last = postings, dict(zip(keys, lasts))
+
+def candidate_view(index, pattern, view_map=None):
+    """Narrows a view (None = all lines) to the lines the trigram index cannot rule out for a TermPattern."""
+    candidates = index.trigrams.candidate_lines(index, pattern.literals()) if index.trigrams else None
+    if candidates is None: return view_map
+    return candidates if view_map is None else candidates.intersect(view_map)
+
+# --- Structured Fields ---
+def _number(value):
+    try: return float(value)
+    except (TypeError, ValueError): return math.nan
+
+def _text(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+def _pivot(rows, prefix=""):
+    """{field: column} of a list of {field: value} dicts; nested objects (JSON) become dotted fields."""
+    columns = {}
+    for key in set().union(*rows):
+        column = list(map(operator.methodcaller("get", key, ""), rows))
+        if any(map(isinstance, column, repeat(dict))):
+            columns.update(_pivot([value if isinstance(value, dict) else {} for value in column], f"{prefix}{key}."))
+        else: columns[prefix + key] = column
+    return columns
+
+class FieldParser:
+    """
+    Extracts the fields of structured log lines: JSON lines, logfmt (key=value pairs) and
+    Apache/nginx access logs (common and combined format). A batch of lines becomes one
+    column per field, with "" where a line lacks the field; lines of other formats simply
+    have no fields. JSON values stay as parsed until a query reads them (see FieldBlock).
+    The format is detected once from a sample of lines.
+    """
+    LOGFMT = re.compile(r'([\w.\-/@]+)="?((?<=")(?:[^"\\]|\\.)*|[^\s"]*)"?') # Quoted values come without their quotes
+    ACCESS = re.compile(r'(\S+) \S+ (\S+) \[([^\]]+)\] "(\S+) (\S+)(?: ([^"]*))?" (\d{3}) (\d+|-)(?: "([^"]*)" "([^"]*)")?')
+    ACCESS_FIELDS = ("remote_addr", "user", "time", "method", "path", "protocol", "status", "bytes", "referer", "user_agent")
+    FORMATS = ("json", "access", "logfmt") # Detection order: access log requests may contain key=value pairs
+    SAMPLE_LINES = 50
+
+    def __init__(self, fmt=None):
+        self.format = fmt # None: no fields
+
+    @classmethod
+    def detect(cls, texts):
+        """Returns the format most of the (non-blank) sample lines are in, or None."""
+        sample = [text for text in texts[:cls.SAMPLE_LINES * 4] if text.strip()][:cls.SAMPLE_LINES]
+        for fmt in cls.FORMATS:
+            rows = cls(fmt).rows(sample)
+            if rows and sum(map(bool, rows)) * 2 > len(sample): return fmt
+        return None
+
+    def rows(self, texts):
+        """One {field: value} dict per line."""
+        if self.format == "json":
+            loads = json.loads
+            try:
+                # Fast path: a batch of nothing but JSON objects is parsed by one map()
+                rows = list(map(loads, texts))
+                if all(map(isinstance, rows, repeat(dict))): return rows
+            except ValueError: pass
+            rows = []
+            for text in texts:
+                start = text.find("{") # Tolerates a prefix such as a timestamp or a merge badge
+                try: obj = loads(text[start:]) if start >= 0 else None
+                except ValueError: obj = None
+                rows.append(obj if isinstance(obj, dict) else {})
+            return rows
+        if self.format == "logfmt":
+            return list(map(dict, map(self.LOGFMT.findall, texts)))
+        if self.format == "access":
+            return [dict(zip(self.ACCESS_FIELDS, m.groups(""))) if m else {} for m in map(self.ACCESS.search, texts)]
+        return [{} for _ in texts]
+
+    def columns(self, texts):
+        """Returns {field: column} for a batch of lines."""
+        if self.format == "access":
+            # Fixed fields: the regex groups are pivoted into columns without a dict per line
+            empty = ("",) * len(self.ACCESS_FIELDS)
+            groups = [m.groups("") if m else empty for m in map(self.ACCESS.search, texts)]
+            return dict(zip(self.ACCESS_FIELDS, map(list, zip(*groups)))) if groups else {}
+        return _pivot(self.rows(texts))
+
+class FieldBlock:
+    """The fields of a run of lines as columns; text, numeric and lower-case views are derived on first use."""
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+        self._strings = {}
+        self._numbers = {}
+        self._folded = {}
+        self._parsed = None
+
+    def __len__(self):
+        return self.length
+
+    def memory(self):
+        """Approximate bytes held: about 64 per cell (a short str and its slot), 8 per derived number."""
+        cells = sum(map(len, self.columns.values())) + sum(map(len, self._folded.values()))
+        return cells * 64 + sum(map(len, self._numbers.values())) * 8
+
+    def extend(self, keep, columns, length):
+        """Replaces the lines from `keep` on with `length` new lines, in place (Live Watch appends)."""
+        added = FieldBlock(columns, length)
+        for field in columns.keys() - self.columns.keys(): self.columns[field] = [""] * self.length
+        for field, column in self.columns.items(): column[keep:] = columns.get(field, [""] * length)
+        # Views already derived are only derived for the new lines
+        for field, values in list(self._strings.items()):
+            if values is not self.columns.get(field): values[keep:] = added.strings(field)
+            elif added.strings(field) is not added.columns.get(field): del self._strings[field] # No longer all text
+        for field, values in self._numbers.items(): values[keep:] = added.numbers(field)
+        for field, values in self._folded.items(): values[keep:] = added.folded(field)
+        if self._parsed is not None: self._parsed = self._parsed[:keep] + added.parsed()
+        self.length = keep + length
+
+    def parsed(self):
+        """One byte per line, 1 if the line has any field (0 for blank lines and lines of another format)."""
+        if self._parsed is None:
+            parsed = bytes(self.length)
+            for column in self.columns.values(): parsed = bytes(map(operator.or_, parsed, map(operator.ne, column, repeat(""))))
+            self._parsed = parsed
+        return self._parsed
+
+    def strings(self, field):
+        if field not in self._strings:
+            column = self.columns.get(field, [""] * self.length)
+            # JSON numbers, booleans and lists are turned into text only when a query reads them as text
+            self._strings[field] = column if all(map(isinstance, column, repeat(str))) else list(map(_text, column))
+        return self._strings[field]
+
+    def folded(self, field):
+        if field not in self._folded: self._folded[field] = [text.casefold() for text in self.strings(field)]
+        return self._folded[field]
+
+    def numbers(self, field):
+        """The column as floats (NaN where a line has no number, so every comparison is false)."""
+        if field not in self._numbers:
+            column = self.columns.get(field)
+            self._numbers[field] = array('d', map(_number, column) if column is not None else repeat(math.nan, self.length))
+        return self._numbers[field]
+
+class FieldQuery:
+    """
+    A field filter such as `status>=500 AND path~/api/` or `level=error OR NOT user=bot`:
+    comparisons joined by AND (also implied between two comparisons), OR, NOT and
+    parentheses. `=` and `!=` compare text case-insensitively, `<` `<=` `>` `>=` compare
+    numbers and `~` searches a regex. Lines without any field never match, so `NOT` and
+    `!=` only select among structured lines. Every comparison runs over a whole column at
+    once (C-level map() calls), never a per-line Python loop. Raises ValueError for an invalid query.
+    """
+    TOKEN = re.compile(r'\s*(?:(\()|(\))|(AND|OR|NOT)(?![\w.\-/@])|([\w.\-/@]+)\s*(!=|>=|<=|=|<|>|~)\s*'
+                       r'("(?:[^"\\]|\\.)*"|[^\s()"]+(?:\([^\s()]*\)[^\s()]*)*))', re.IGNORECASE)
+    NUMERIC = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+    _NOT = bytes([1, 0]) + bytes(254)
+
+    def __init__(self, query):
+        self.query = query
+        self.tokens = self._tokenize(query)
+        self.tree = self._parse_or()
+        if self.tokens: raise ValueError(f"Unexpected {self.tokens[0][1]!r} in query")
+
+    def _tokenize(self, query):
+        tokens, pos = [], 0
+        query = query.rstrip()
+        while pos < len(query):
+            m = self.TOKEN.match(query, pos)
+            if not m: raise ValueError(f"Cannot read the query at {query[pos:].strip()!r}")
+            pos = m.end()
+            lparen, rparen, word, field, op, value = m.groups()
+            if field:
+                if value[:1] == '"': value = value[1:-1].replace('\\"', '"')
+                tokens.append(("cmp", self._comparison(field, op, value)))
+            else: tokens.append(("(", "(") if lparen else (")", ")") if rparen else (word.upper(), word))
+        tokens.reverse() # Consumed with pop()
+        return tokens
+
+    @classmethod
+    def _comparison(cls, field, op, value):
+        if op in cls.NUMERIC:
+            number = _number(value)
+            if math.isnan(number): raise ValueError(f"{field}{op}{value}: {op} needs a number")
+            return field, op, number
+        if op == "~":
+            try: return field, op, re.compile(value, re.IGNORECASE)
+            except re.error as e: raise ValueError(f"Invalid regex {value!r}: {e}") from None
+        return field, op, value.casefold()
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self.tokens and self.tokens[-1][0] == "OR":
+            self.tokens.pop()
+            node = ("or", node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self.tokens and self.tokens[-1][0] in ("AND", "NOT", "cmp", "("):
+            if self.tokens[-1][0] == "AND": self.tokens.pop()
+            node = ("and", node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        if not self.tokens: raise ValueError("Incomplete query")
+        kind, value = self.tokens.pop()
+        if kind == "NOT": return ("not", self._parse_not())
+        if kind == "cmp": return ("cmp", *value)
+        if kind == "(":
+            node = self._parse_or()
+            if not self.tokens or self.tokens.pop()[0] != ")": raise ValueError("Missing )")
+            return node
+        raise ValueError(f"Unexpected {value!r} in query")
+
+    def fields(self, node=None):
+        """The field names the query reads."""
+        node = node or self.tree
+        if node[0] == "cmp": return {node[1]}
+        return set().union(*(self.fields(child) for child in node[1:]))
+
+    def mask(self, block, skip=0):
+        """Returns the keep mask (one byte per line, 1 = match) of the lines of a FieldBlock after the first `skip`."""
+        return bytes(map(operator.and_, self._mask(block, skip, self.tree), block.parsed()[skip:]))
+
+    def _mask(self, block, skip, node):
+        kind = node[0]
+        if kind == "and": return bytes(map(operator.and_, self._mask(block, skip, node[1]), self._mask(block, skip, node[2])))
+        if kind == "or": return bytes(map(operator.or_, self._mask(block, skip, node[1]), self._mask(block, skip, node[2])))
+        if kind == "not": return self._mask(block, skip, node[1]).translate(self._NOT)
+        _, field, op, value = node
+        if op in self.NUMERIC: column, compare = block.numbers(field), self.NUMERIC[op]
+        elif op == "~": return bytes(map(bool, map(value.search, islice(block.strings(field), skip, None))))
+        else: column, compare = block.folded(field), operator.eq if op == "=" else operator.ne
+        return bytes(map(compare, islice(column, skip, None), repeat(value)))
+
+class FieldStore:
+    """
+    Columnar field cache of one LineIndex, filled lazily: a block of BLOCK_LINES lines is
+    parsed the first time a query touches it and kept for later queries (least recently
+    used blocks are dropped past MAX_BLOCKS). Once the last block is cached, lines
+    appended by Live Watch only parse the new lines. The first parse of a large log runs
+    on a worker while the UI thread may query the cached blocks: a lock guards them.
+    """
+    BLOCK_LINES = 65536
+    MAX_BLOCKS = 64
+
+    def __init__(self, index):
+        self.index = index
+        self.parser = None # Detected from the first block parsed
+        self._blocks = OrderedDict() # Block number -> (first line, stop line, FieldBlock)
+        self._lock = threading.Lock()
+
+    def memory(self):
+        return sum(block.memory() for _, _, block in list(self._blocks.values()))
+
+    def cached(self, start=None):
+        """True if the blocks from `start` on are parsed, so a query only runs over cached columns (the last block may lack appended lines)."""
+        index = self.index
+        start = max(index.first_line, start or 0)
+        last = -(-index.line_count // self.BLOCK_LINES) - 1
+        with self._lock:
+            for k in range(start // self.BLOCK_LINES, last + 1):
+                cached = self._blocks.get(k)
+                if not cached or cached[0] != max(k * self.BLOCK_LINES, index.first_line): return False
+                if k < last and cached[1] != (k + 1) * self.BLOCK_LINES: return False
+        return True
+
+    def block(self, k):
+        """Returns (first line, FieldBlock) of block k, parsing only what is not cached yet."""
+        index = self.index
+        start = max(k * self.BLOCK_LINES, index.first_line)
+        stop = min((k + 1) * self.BLOCK_LINES, index.line_count)
+        cached = self._blocks.get(k)
+        if cached and cached[0] == start and cached[1] == stop:
+            self._blocks.move_to_end(k)
+            return start, cached[2]
+        if self.parser is None: self.parser = FieldParser(FieldParser.detect(index.get_text(start, min(stop, start + 1000))))
+        if cached and cached[0] == start and start < cached[1] < stop:
+            # Grown: the previous last line (it may have been partial) and the new lines are parsed
+            texts = index.get_text(cached[1] - 1, stop)
+            block = cached[2]
+            block.extend(cached[1] - 1 - start, self.parser.columns(texts), len(texts))
+        else:
+            texts = index.get_text(start, stop)
+            block = FieldBlock(self.parser.columns(texts), len(texts))
+        self._blocks[k] = (start, stop, block)
+        self._blocks.move_to_end(k)
+        if len(self._blocks) > self.MAX_BLOCKS: self._blocks.popitem(last=False)
+        return start, block
+
+    def masks(self, query, start=None, stop=None):
+        """Yields (first line, keep mask) per block for the lines [start, stop) (default: all retained lines)."""
+        index = self.index
+        start = max(index.first_line, start or 0)
+        stop = index.line_count if stop is None else min(stop, index.line_count)
+        for k in range(start // self.BLOCK_LINES, -(-stop // self.BLOCK_LINES)):
+            with self._lock:
+                first, block = self.block(k)
+                skip = max(0, start - first)
+                mask = query.mask(block, skip)
+            yield first + skip, mask[:stop - first - skip]
+
+def field_view(index, query, start=None, stop=None, stopped=None):
+    """
+    LineRuns of the lines [start, stop) whose fields match a FieldQuery, read from the
+    index's FieldStore. Returns None once stopped() turns true (the first parse of a
+    large log runs on a worker).
+    """
+    if index.fields is None: index.fields = FieldStore(index)
+    view = LineRuns()
+    for first, mask in index.fields.masks(query, start, stop):
+        if stopped and stopped(): return None
+        view.add_mask(mask, first)
+    return view
+
+# --- Live Watch ---
+class TailWatcher:
+    """
+    Follows a growing log like `tail -F`. Wakes on inotify events on Linux (polling
+    elsewhere), detects rotation by inode and truncation by size, and coalesces bursts
+    so the callbacks fire at most MAX_RATE times per second. Callbacks run on the
+    watcher thread: on_change() after the file grew, on_reset() after it was rotated
+    or truncated.
+    """
+    MAX_RATE = 10 # Callbacks per second
+    POLL_INTERVAL = 1.0
+    SAFETY_INTERVAL = 5.0 # With inotify the file is still re-checked this often
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    INOTIFY_MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+    _EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, name length
+
+    def __init__(self, path, on_change, on_reset):
+        self.path = path
+        self.on_change = on_change
+        self.on_reset = on_reset
+        self._stop = threading.Event()
+        self._identity, self._size = self._stat()
+        self._inotify_fd = self._open_inotify()
+        self.mode = "inotify" if self._inotify_fd is not None else "polling"
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return (st.st_dev, st.st_ino), st.st_size
+
+    def _open_inotify(self):
+        """Watches the parent directory, so events keep coming after the file was rotated."""
+        if not sys.platform.startswith("linux"): return None
+        import ctypes, ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0: return None
+            directory = os.path.dirname(os.path.abspath(self.path)).encode()
+            if libc.inotify_add_watch(fd, directory, self.INOTIFY_MASK) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError): return None
+
+    def _wait_for_event(self):
+        """Blocks until the watched file may have changed, or a timeout elapsed."""
+        if self._inotify_fd is None:
+            self._stop.wait(self.POLL_INTERVAL)
+            return
+        name = os.path.basename(self.path).encode()
+        deadline = time.monotonic() + self.SAFETY_INTERVAL
+        while not self._stop.is_set():
+            timeout = min(0.5, deadline - time.monotonic()) # Short slices so stop() is noticed
+            if timeout <= 0: return
+            readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+            if readable and name in self._read_event_names(): return
+
+    def _read_event_names(self):
+        names = set()
+        while True:
+            try: buf = os.read(self._inotify_fd, 65536)
+            except BlockingIOError: return names
+            pos = 0
+            while pos + self._EVENT_HEADER.size <= len(buf):
+                _, _, _, length = self._EVENT_HEADER.unpack_from(buf, pos)
+                pos += self._EVENT_HEADER.size
+                names.add(buf[pos:pos + length].rstrip(b"\0"))
+                pos += length
+
+    def _check(self):
+        """Returns "reset", "grown" or None, compared with the last check."""
+        try: identity, size = self._stat()
+        except FileNotFoundError: return None # Rotation in progress: the new file is not there yet
+        if identity != self._identity: change = "reset"
+        elif size < self._size: change = "reset"
+        elif size > self._size: change = "grown"
+        else: change = None
+        self._identity, self._size = identity, size
+        return change
+
+    def _run(self):
+        last_callback = 0
+        try:
+            while not self._stop.is_set():
+                self._wait_for_event()
+                # Coalesce bursts: whatever is written until the next frame is handled in one go
+                delay = last_callback + 1 / self.MAX_RATE - time.monotonic()
+                if delay > 0 and self._stop.wait(delay): break
+                change = self._check()
+                if not change or self._stop.is_set(): continue
+                last_callback = time.monotonic()
+                try:
+                    if change == "reset": self.on_reset()
+                    else: self.on_change()
+                except Exception: pass # A failed update must not end the watch
+        finally:
+            if self._inotify_fd is not None: os.close(self._inotify_fd)
+
+# --- Alerts ---
+def trie_pattern(words):
+    """
+    A regex source matching any of the words, shaped as a trie ("err(?:or|no)"): the
+    regex engine then follows one branch per character at every position, much like
+    Aho-Corasick, instead of trying every word in turn.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word: node = node.setdefault(ch, {})
+        node[""] = None # End of a word
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches: return ""
+        group = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{group})?" if "" in node else group
+    return build(trie)
+
+class AlertRule:
+    """
+    One alert rule, written as a line of text:
+        timeout                   keyword, any case
+        /conn(ection)? reset/     regex, any case
+        >50 ERROR in 60s          rate: more than 50 lines within 60 s (or m, h) of arrival. A level
+                                  name counts lines of that level; a keyword or /regex/ counts its hits
+    Raises ValueError for an empty rule or an invalid regex.
+    """
+    RATE = re.compile(r">\s*(\d+)\s+(.+?)\s+in\s+(\d+)\s*([smh]?)$", re.IGNORECASE)
+    UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+    def __init__(self, text):
+        self.text = body = text.strip()
+        self.threshold = self.window = None
+        self.level = self.literal = self.regex = None
+        rate = self.RATE.match(body)
+        if rate:
+            self.threshold, body = int(rate[1]), rate[2]
+            self.window = int(rate[3]) * self.UNITS[rate[4].lower()]
+            self.level = next((code for code, name in LevelIndex.NAMES.items() if name == body.upper()), None)
+        if self.level is not None: return
+        if len(body) > 2 and body[0] == body[-1] == "/":
+            try: self.regex = re.compile(body[1:-1], re.IGNORECASE)
+            except re.error as e: raise ValueError(f"{self.text}: {e}")
+        elif body: self.literal = body.lower()
+        else: raise ValueError("empty alert rule")
+
+    def __repr__(self):
+        return f"AlertRule({self.text!r})"
+
+    def hits(self, lowered):
+        """True if the (lower-cased) line matches the rule's keyword or regex."""
+        if self.literal is not None: return self.literal in lowered
+        return self.regex.search(lowered) is not None
+
+    @classmethod
+    def parse(cls, text):
+        """The rules of a block of text, one per line; blank lines and lines starting with # are skipped."""
+        return [cls(line) for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+
+class AlertEngine:
+    """
+    Evaluates a set of alert rules against the lines appended to a log in Live Watch.
+    All keywords and regexes are folded into one pattern (keywords as a trie), so a
+    chunk is scanned once however many rules there are; only the lines with a hit are
+    then checked rule by rule. Rate rules sum per-chunk counts over a sliding window and
+    fire once when the threshold is crossed, again only after the rate has dropped back.
+    scan() runs on the watcher thread.
+    """
+    HISTORY = 3600 # Seconds of alert history kept for recent()
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.matched = [rule for rule in rules if rule.level is None]
+        parts = []
+        keywords = [rule.literal for rule in self.matched if rule.literal]
+        if keywords: parts.append(trie_pattern(set(keywords)))
+        # Lines are lower-cased before the scan, so only the regexes need IGNORECASE (scoped: it slows keywords down)
+        parts.extend(f"(?i:{rule.regex.pattern})" for rule in self.matched if rule.regex is not None)
+        # MULTILINE: a chunk is scanned as one text, and ^/$ of a rule must still mean the start/end of a line
+        self.per_line = False
+        try: self.matcher = re.compile("|".join(parts), re.MULTILINE) if parts else None
+        except re.error: self.matcher, self.per_line = None, True # Regexes that cannot be combined (back-references, global flags): every line is checked rule by rule
+        self.windows = {rule: deque() for rule in rules if rule.threshold is not None} # Rule -> (time, count) per chunk
+        self.firing = set()
+        self.counts = {rule: 0 for rule in rules} # Alerts raised per rule
+        self.history = deque() # (time, alerts) per scan that raised any
+        self.next_line = None # First line not scanned yet
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def recent(self, seconds=60, now=None):
+        """Alerts raised within the last `seconds`."""
+        since = (now or time.monotonic()) - seconds
+        with self._lock: return sum(n for t, n in self.history if t >= since)
+
+    def start(self, index):
+        """Skips what is already in the index: only lines appended from now on raise alerts."""
+        self.next_line = max(index.line_count - 1, index.first_line)
+
+    def scan(self, index, now=None):
+        """
+        Checks the complete lines appended since the last call (the last line may still be
+        partial and waits for the next one). Returns the alerts as sorted [(line, rule)].
+        """
+        now = now or time.monotonic()
+        if self.next_line is None: self.start(index)
+        start, stop = max(self.next_line, index.first_line), index.line_count - 1
+        if stop <= start: return []
+        self.next_line = stop
+        hits, found = {}, {} # Rule -> matching lines in this chunk; line -> rules
+        if self.per_line:
+            for line, text in enumerate(index.get_text(start, stop), start):
+                rules = [rule for rule in self.matched if rule.hits(text.lower())]
+                if rules: found[line] = rules
+                for rule in rules: hits.setdefault(rule, []).append(line)
+        elif self.matcher is not None:
+            text = "\n".join(index.get_text(start, stop)).lower()
+            search, pos, line = self.matcher.search, 0, start
+            m = search(text)
+            while m:
+                # One hit is enough to find the line; the rules are told apart on that line only
+                line += text.count("\n", pos, m.start())
+                pos = text.rfind("\n", 0, m.start()) + 1
+                end = text.find("\n", m.start())
+                if end < 0: end = len(text)
+                rules = [rule for rule in self.matched if rule.hits(text[pos:end])]
+                if rules: found[line] = rules
+                for rule in rules: hits.setdefault(rule, []).append(line)
+                m = search(text, end + 1) if end < len(text) else None
+        alerts = [(line, rule) for line, rules in found.items() for rule in rules if rule.threshold is None]
+        for rule, window in self.windows.items():
+            if rule.level is not None:
+                codes = index.levels.slice(start, stop)
+                count = codes.count(rule.level)
+            else:
+                lines = hits.get(rule, ())
+                count = len(lines)
+            while window and window[0][0] <= now - rule.window: window.popleft()
+            before = sum(n for _, n in window)
+            if count: window.append((now, count))
+            if before + count <= rule.threshold: self.firing.discard(rule)
+            elif rule not in self.firing and count:
+                # Raised on the line that crossed the threshold
+                self.firing.add(rule)
+                nth = max(1, rule.threshold + 1 - before)
+                if rule.level is None: line = lines[nth - 1]
+                else:
+                    pos = -1
+                    for _ in range(nth): pos = codes.find(rule.level, pos + 1)
+                    line = start + pos
+                alerts.append((line, rule))
+        alerts.sort(key=lambda alert: alert[0])
+        with self._lock:
+            for _, rule in alerts: self.counts[rule] += 1
+            if alerts: self.history.append((now, len(alerts)))
+            while self.history and self.history[0][0] < now - self.HISTORY: self.history.popleft()
+        return alerts
+
+# --- Merged Timeline ---
+class _MergeSource:
+    """One input of a LogMerger: the file streamed in chunks of whole lines, read up to `pos`."""
+    LINEAR_LINES = 8
+    def __init__(self, path, badge, chunk_size):
+        self.badge = badge
+        self.parser = TimestampParser()
+        self.chunks = stream_chunks(path, chunk_size)
+        self.data, self.pos = b"", 0
+        self.last = -1 # Timestamp of the last line handed out; lines before the first timestamp sort first
+        self.encoding = None # Set for chunks that are not UTF-8 already (converted when written)
+        self._stop, self._stop_time = -1, None # Where the last run ended and the timestamp found there
+
+    def advance(self):
+        """Loads the next chunk once the current one is used up. Returns False at the end of the file."""
+        if self.pos < len(self.data): return True
+        for _, data, encoding in self.chunks:
+            self.data, self.pos, self._stop = data + b'\n', 0, -1
+            self.encoding = None if codecs.lookup(encoding).name in ("utf-8", "ascii") else encoding
+            return True
+        return False
+
+    def head_time(self):
+        """Timestamp of the next line; lines without one (stack traces) inherit the last one."""
+        seconds = self._stop_time if self._stop == self.pos else self.parser.time_at(self.data, self.pos, self.pos)
+        if seconds is not None: self.last = seconds
+        return self.last
+
+    def run_end(self, bound):
+        """
+        Byte offset of the first line stamped at or after `bound`. Runs are mostly a few
+        lines long, so the first lines are checked one by one; longer runs are galloped
+        over and binary-searched.
+        """
+        data, pos, end = self.data, self.pos, len(self.data)
+        parse, width = self.parser.parse, TimestampParser.SEARCH_WIDTH
+        for _ in range(self.LINEAR_LINES):
+            pos = data.find(b'\n', pos, end - 1) + 1
+            if not pos: return end
+            stop = data.find(b'\n', pos, pos + width)
+            seconds = parse(data[pos:stop if stop >= 0 else pos + width])
+            if seconds is not None and seconds >= bound:
+                self._stop, self._stop_time = pos, seconds # The next head_time() is known already
+                return pos
+        lo, step = pos, 4096
+        while True:
+            probe = data.find(b'\n', min(lo + step, end - 1)) + 1 or end
+            if probe >= end: return self.parser.search(data, bound, lo, end)
+            seconds = self.parser.time_at(data, probe, lo)
+            if seconds is not None and seconds >= bound: return self.parser.search(data, bound, lo, probe)
+            lo, step = probe, step * 2
+
+class LogMerger:
+    """
+    Merges several logs (a rotated set, or the logs of several services) into one
+    timeline, ordered by the timestamp of each line. It is a k-way heap merge over
+    files streamed front to back, so memory stays at one chunk per file however large
+    they are. Every line gets a [file name] badge; lines without a timestamp stay with
+    the line above. Instead of a heap step per line, the file at the top of the heap
+    hands out its whole run of lines up to the next file's timestamp in one slice.
+
+    Written into a UTF-8 spool, it acts as the transcoder of a LineIndex (see
+    open_merged), so search, filters and go-to-time work on the merged view as on a file.
+    """
+    CHUNK_SIZE = 1024 * 1024 # Per file: dozens of files stay within a few dozen MB
+
+    def __init__(self, paths, out=None):
+        self.paths = list(paths)
+        self.badges = self.badge_names(self.paths)
+        self.total = sum(os.path.getsize(p) for p in self.paths)
+        self.position = 0 # Source bytes merged so far (decompressed bytes for compressed files)
+        self._sources = [_MergeSource(p, f"[{name}] ".encode('utf-8'), self.CHUNK_SIZE) for p, name in zip(self.paths, self.badges)]
+        self._heap = [(source.head_time(), i) for i, source in enumerate(self._sources) if source.advance()]
+        heapq.heapify(self._heap)
+        self.spool = None
+        if out is None:
+            import tempfile
+            self.spool = out = tempfile.NamedTemporaryFile(prefix="omnilog-merge-", suffix=".log", delete=False)
+        self.out = out
+        self.path = self.spool.name if self.spool else None
+        self.encoding = "utf-8"
+
+    @staticmethod
+    def badge_names(paths):
+        """File names for the badges; files with the same name get their parent directory too."""
+        names = [os.path.basename(p) for p in paths]
+        return [os.path.join(os.path.basename(os.path.dirname(os.path.abspath(p))), n) if names.count(n) > 1 else n
+                for p, n in zip(paths, names)]
+
+    @property
+    def progress(self):
+        """Fraction of the sources merged so far (0.0 - 1.0)."""
+        if not self._heap: return 1.0
+        return min(0.99, self.position / self.total) if self.total else 1.0
+
+    def pump(self, max_bytes=None):
+        """Merges (about max_bytes of) the next lines into the output. Returns the bytes read, 0 once all files are merged."""
+        heap, written = self._heap, 0
+        while heap and (not max_bytes or written < max_bytes):
+            seconds, i = heap[0]
+            source = self._sources[i]
+            if len(heap) > 1:
+                # Hand out every line that sorts before the runner-up (ties go to the earlier file)
+                next_seconds, j = min(heap[1:3])
+                end = source.run_end(next_seconds + 1 if i < j else next_seconds)
+            else: end = len(source.data)
+            end = max(end, source.data.find(b'\n', source.pos) + 1) # At least one line, even from a log out of time order
+            written += self._write(source, end)
+            if source.advance(): heapq.heapreplace(heap, (source.head_time(), i))
+            else: heapq.heappop(heap)
+        self.out.flush()
+        self.position += written
+        return written
+
+    def _write(self, source, end):
+        data = source.data[source.pos:end]
+        source.pos = end
+        if source.encoding: data = data.decode(source.encoding, 'replace').encode('utf-8')
+        badge = source.badge
+        self.out.write(badge + data[:-1].replace(b'\n', b'\n' + badge) + b'\n')
+        return len(data)
+
+    def close(self):
+        self._heap = []
+        for source in self._sources:
+            try: source.chunks.close()
+            except ValueError: pass # Still being read by the loader thread
+        if self.spool:
+            self.spool.close()
+            try: os.remove(self.path)
+            except OSError: pass
+
+# --- Data Management ---
+class Annotation:
+    """The mark color and/or note of one line."""
+    __slots__ = ("color", "note")
+
+    def __init__(self, color=None, note=None):
+        self.color = color
+        self.note = note
+
+    def to_dict(self):
+        return {k: v for k, v in (("color", self.color), ("note", self.note)) if v}
+
+class LogMeta:
+    """
+    Marks and notes by line number (1-based), kept sorted in an int array with a
+    parallel list of Annotation slots objects: a lookup or the next/previous mark is a
+    binary search, the marks of the viewport are one range slice. Lines left with
+    neither a color nor a note are dropped. Exports stream one annotation at a time.
+    """
+    def __init__(self):
+        self.lines = array('Q') # Annotated line numbers, ascending
+        self.items = [] # Annotation of every entry of `lines`
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _find(self, line):
+        k = bisect_left(self.lines, line)
+        return k, k < len(self.lines) and self.lines[k] == line
+
+    def add_annotation(self, line_index, color=None, note=None):
+        if not color and not note: return
+        k, found = self._find(line_index)
+        if not found:
+            self.lines.insert(k, line_index)
+            self.items.insert(k, Annotation())
+        item = self.items[k]
+        if color: item.color = color
+        if note: item.note = note
+
+    def clear_annotation(self, line_index, color=True, note=True):
+        """Removes the mark and/or note of a line; the entry goes once it holds neither."""
+        k, found = self._find(line_index)
+        if not found: return
+        item = self.items[k]
+        if color: item.color = None
+        if note: item.note = None
+        if not item.color and not item.note:
+            del self.lines[k]
+            del self.items[k]
+
+    def get_annotation(self, line_index):
+        """The Annotation of a line, or None. O(log n)."""
+        k, found = self._find(line_index)
+        return self.items[k] if found else None
+
+    def in_range(self, start, stop):
+        """Yields (line, Annotation) for the annotated lines in [start, stop), in order."""
+        lo, hi = bisect_left(self.lines, start), bisect_left(self.lines, stop)
+        return zip(self.lines[lo:hi], self.items[lo:hi])
+
+    def count_range(self, start, stop):
+        return bisect_left(self.lines, stop) - bisect_left(self.lines, start)
+
+    def next_line(self, line_index, direction=1):
+        """The closest annotated line after (direction 1) or before (-1) a line, or None. O(log n)."""
+        if direction > 0:
+            k = bisect_right(self.lines, line_index)
+            return self.lines[k] if k < len(self.lines) else None
+        k = bisect_left(self.lines, line_index)
+        return self.lines[k - 1] if k else None
+
+    def get_all_notes(self):
+        """[(line, note)] of the annotated lines with a note, in line order."""
+        return [(line, item.note) for line, item in zip(self.lines, self.items) if item.note]
+
+    def update(self, entries):
+        """Adds (line, color, note) entries, e.g. from an import; one sort for the lot instead of an insert each. Returns the number stored."""
+        merged = dict(zip(self.lines, self.items))
+        count = 0
+        for line, color, note in entries:
+            if not color and not note: continue # Nothing to store
+            item = merged.setdefault(int(line), Annotation())
+            if color: item.color = color
+            if note: item.note = note
+            count += 1
+        order = sorted(merged)
+        self.lines = array('Q', order)
+        self.items = [merged[line] for line in order]
+        return count
+
+    def export_json(self, f, filename=None):
+        """Writes {"filename": ..., "annotations": {"<line>": {...}}} one annotation per line, without building it in memory."""
+        f.write('{"filename": %s, "annotations": {' % json.dumps(filename))
+        sep = "\n"
+        for line, item in zip(self.lines, self.items):
+            f.write(f'{sep}  "{line}": {json.dumps(item.to_dict())}')
+            sep = ",\n"
+        f.write("\n}}\n")
+
+    def export_jsonl(self, f):
+        """Writes one {"line": ..., "color": ..., "note": ...} object per line."""
+        for line, item in zip(self.lines, self.items): f.write(json.dumps({"line": line, **item.to_dict()}) + "\n")
+
+    def import_file(self, f):
+        """
+        Loads annotations exported by export_json (also the older indented exports) or
+        export_jsonl onto this log. JSON lines are read one at a time. Returns the number
+        of annotations read; raises ValueError for anything else.
+        """
+        head = f.read(1)
+        while head.isspace(): head = f.read(1)
+        if head != "{": raise ValueError("Not an annotation export")
+        first = head + f.readline()
+        try: record = json.loads(first)
+        except ValueError: record = None
+        if isinstance(record, dict) and "line" in record:
+            # JSON lines: streamed, whatever the number of annotations
+            records = chain((record,), (json.loads(text) for text in f if text.strip()))
+            entries = (self._entry(r.get("line") if isinstance(r, dict) else None, r) for r in records)
+        else:
+            document = json.loads(first + f.read())
+            annotations = document.get("annotations") if isinstance(document, dict) else None
+            if not isinstance(annotations, dict): raise ValueError("Not an annotation export")
+            entries = (self._entry(line, a) for line, a in annotations.items())
+        return self.update(entries) # Raises before anything is stored if an entry is malformed
+
+    @staticmethod
+    def _entry(line, annotation):
+        """(line, color, note) of one imported annotation; raises ValueError if it is malformed."""
+        if not isinstance(annotation, dict): raise ValueError(f"Not an annotation: {annotation!r}")
+        color, note = annotation.get("color"), annotation.get("note")
+        if not all(isinstance(value, (str, type(None))) for value in (color, note)): raise ValueError(f"Line {line}: color and note must be text")
+        try: return int(line), color, note
+        except (TypeError, ValueError): raise ValueError(f"Not a line number: {line!r}") from None
+
+# --- Index Cache ---
+class IndexCache:
+    """
+    Sidecar cache of what indexing a log computed (line offsets, the state of every
+    consumer such as level codes and timestamps, the trigram index if one was built, the
+    detected encoding), one file per log. An entry is keyed by the log's path, size, mtime and a hash of its head and
+    tail, so it is reused when the same log is opened again and also when the log has
+    only grown since: then just the new bytes are indexed. The directory is kept below
+    max_bytes by evicting the least recently used entries.
+    """
+    VERSION = 3 # Bump whenever the entry layout or the state of a consumer changes
+    MAGIC = b"OMNILOG-INDEX\n"
+    MIN_SIZE = 16 * 1024 * 1024 # Smaller logs are indexed about as fast as an entry is read
+    MAX_BYTES = 1024 * 1024 * 1024
+    HASH_SPAN = 64 * 1024 # Bytes hashed at the head and at the tail of the indexed part
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        self.directory = directory or self.default_directory()
+        self.max_bytes = max_bytes
+        self._current = {} # Entry path -> (indexed size, trigram-indexed size) it holds, to skip rewriting it unchanged
+
+    @staticmethod
+    def default_directory():
+        base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, "omnilog", "index")
+
+    def entry_path(self, file_path):
+        import hashlib # Deferred: only needed once a large log is opened
+        key = hashlib.sha1(os.path.realpath(file_path).encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, key + ".idx")
+
+    def _fingerprint(self, file_path, size):
+        import hashlib
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            digest.update(f.read(min(size, self.HASH_SPAN)))
+            f.seek(max(0, size - self.HASH_SPAN))
+            digest.update(f.read(min(size, self.HASH_SPAN)))
+        return digest.hexdigest()
+
+    def cacheable(self, index):
+        """Only complete indexes of large files are cached (no ring-buffer or transcoded UTF-16/32 ones)."""
+        return bool(index.file_path) and index.transcoder is None and index.first_line == 0 and index.size >= self.MIN_SIZE and not index.closed
+
+    def save(self, index):
+        """Writes (or replaces) the entry of an index. Returns True if it was written."""
+        if not self.cacheable(index): return False
+        path = self.entry_path(index.file_path)
+        trigrams = index.trigrams
+        version = (index.size, trigrams.size if trigrams else 0)
+        if self._current.get(path) == version: return False
+        with index._build_lock:
+            size, offsets = index.size, index.offsets.tobytes()
+            states = [(type(c).__name__,) + c.get_state() for c in index.consumers]
+            if trigrams: states.append(("TrigramIndex",) + trigrams.get_state())
+        try:
+            st = os.stat(index.file_path)
+            header = {"path": os.path.realpath(index.file_path), "size": size, "mtime": st.st_mtime_ns if st.st_size == size else None,
+                      "fingerprint": self._fingerprint(index.file_path, size), "encoding": index.encoding,
+                      "byteorder": sys.byteorder, "offsets": len(offsets),
+                      "consumers": [[name, state, [len(b) for b in blobs]] for name, state, blobs in states]}
+            header = json.dumps(header).encode()
+            os.makedirs(self.directory, exist_ok=True)
+            temp = f"{path}.{os.getpid()}.tmp"
+            with open(temp, 'wb') as f:
+                f.write(self.MAGIC + struct.pack("<II", self.VERSION, len(header)) + header + offsets)
+                for _, _, blobs in states:
+                    for blob in blobs: f.write(blob)
+            os.replace(temp, path) # Readers never see a half-written entry
+        except (OSError, TypeError, ValueError): return False
+        self._current[path] = version
+        self.evict()
+        return True
+
+    def load(self, file_path):
+        """
+        Returns a LineIndex restored from the cache, or None if there is no valid entry.
+        build() on it only indexes the bytes appended since the entry was written.
+        """
+        path = self.entry_path(file_path)
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC: return None
+                version, length = struct.unpack("<II", f.read(8))
+                if version != self.VERSION: return None
+                header = json.loads(f.read(length))
+                st = os.stat(file_path)
+                size = header["size"]
+                if header["byteorder"] != sys.byteorder or header["path"] != os.path.realpath(file_path): return None
+                # The log may have grown since, but the indexed part must be unchanged
+                if st.st_size < size or (st.st_size == size and header["mtime"] not in (None, st.st_mtime_ns)): return None
+                if self._fingerprint(file_path, size) != header["fingerprint"]: return None
+                offsets = array('Q', f.read(header["offsets"]))
+                states = [(name, state, [f.read(n) for n in lengths]) for name, state, lengths in header["consumers"]]
+            os.utime(path) # Most recently used: evicted last
+        except (OSError, ValueError, KeyError, TypeError, struct.error): return None
+        index = LineIndex(file_path, encoding=header["encoding"])
+        if states and states[-1][0] == "TrigramIndex":
+            index.trigrams = TrigramIndex()
+            index.trigrams.set_state(*states.pop()[1:])
+        if [type(c).__name__ for c in index.consumers] != [name for name, _, _ in states]:
+            index.close()
+            return None
+        for consumer, (_, state, blobs) in zip(index.consumers, states): consumer.set_state(state, blobs)
+        index.offsets, index.size = offsets, size
+        self._current[path] = (size, index.trigrams.size if index.trigrams else 0)
+        return index
+
+    def evict(self):
+        """Deletes the least recently used entries until the directory fits into max_bytes."""
+        try:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".idx"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError: return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            try: os.remove(path)
+            except OSError: pass
+            total -= size
+
+# --- Engine API ---
+SCAN_BATCH = 20000 # Lines decoded per step when scanning a whole index
+
+def open_log(file_path, cache=None):
+    """
+    Opens a log for indexing; call build() on the result, it is not indexed yet.
+    Returns (LineIndex, detected encoding). UTF-16/32 sources are indexed through a UTF-8 spool.
+    Compressed logs (gzip, bz2, xz, zstd) are decompressed while they are indexed.
+    With an IndexCache, a log indexed before is restored and build() only indexes new bytes.
+    """
+    index = cache.load(file_path) if cache else None
+    if index: return index, index.encoding
+    compression = detect_compression(file_path)
+    encoding = EncodingDetector.detect(file_path)
+    if compression == "gzip" and LineIndex.is_ascii_compatible(encoding):
+        # Random access through seek points: no decompressed copy on disk
+        source = GzipSource(file_path)
+        return LineIndex(data=source, encoding=encoding, transcoder=source), encoding
+    if not compression and LineIndex.is_ascii_compatible(encoding): return LineIndex(file_path, encoding=encoding), encoding
+    # UTF-16/32 cannot be split on b'\n', other compressed streams cannot seek: index a spool filled while loading
+    transcoder = Transcoder(file_path, encoding, compression)
+    return LineIndex(transcoder.path, encoding=transcoder.encoding, transcoder=transcoder), encoding
+
+def open_merged(paths):
+    """Opens several logs as one timeline merged by timestamp (see LogMerger); call build() on the result. Returns (LineIndex, "utf-8")."""
+    merger = LogMerger(paths)
+    return LineIndex(merger.path, encoding=merger.encoding, transcoder=merger), merger.encoding
+
+def iter_text_batches(index, view_map=None, batch_size=SCAN_BATCH):
+    """Yields (line indices, texts) batches for every retained line of an index, or only for the lines of a view."""
+    first = 0 if view_map is not None else index.first_line
+    total = len(view_map) if view_map is not None else index.line_count
+    for start in range(first, total, batch_size):
+        if view_map is not None: lines = view_map[start:start + batch_size]
+        else: lines = range(start, min(start + batch_size, total))
+        yield lines, index.get_text_at(lines)
+
+def stream_chunks(file_path, chunk_size=LineIndex.CHUNK_SIZE):
+    """
+    Yields (first line, data, encoding) for chunks of whole lines (without the final newline)
+    of a file read front to back, without building an index: memory stays constant however
+    large the file is (used by the CLI).
+    """
+    encoding = EncodingDetector.detect(file_path)
+    decoder = None
+    if not LineIndex.is_ascii_compatible(encoding):
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        encoding = "utf-8"
+    first_line, tail = 0, b""
+    with open_decompressed(file_path, detect_compression(file_path)) as f:
+        while True:
+            block = f.read(chunk_size)
+            data = decoder.decode(block, final=not block).encode('utf-8') if decoder else block
+            data = tail + data
+            # Only whole lines are handed out; the rest waits for the next block
+            cut = data.rfind(b'\n') + 1 if block else len(data)
+            whole, tail = data[:cut], data[cut:]
+            if whole.endswith(b'\n'): whole = whole[:-1]
+            if cut:
+                yield first_line, whole, encoding
+                first_line += whole.count(b'\n') + 1
+            if not block: return
+
+def stream_lines(file_path, chunk_size=LineIndex.CHUNK_SIZE):
+    """Yields (first line, texts, level codes) batches of a file, see stream_chunks."""
+    for first_line, data, encoding in stream_chunks(file_path, chunk_size):
+        yield first_line, data.replace(b'\r\n', b'\n').decode(encoding, 'replace').split('\n'), LevelIndex.classify(data)
+
+class LineFilter:
+    """
+    The sidebar filters as one keep mask per batch of lines: lines containing `include`,
+    at one of `levels`, not containing `exclude` and matching the field query `where`.
+    Masks are computed with C-level calls (level codes through a translate table, text
+    patterns through map()), never a per-line Python loop. Raises re.error for an invalid
+    `include` regex and ValueError for an invalid `where` query.
+    """
+    def __init__(self, include=None, exclude=None, levels=None, use_regex=False, where=None):
+        self.keep_pattern = TermPattern(include, use_regex) if include else None
+        self.drop_pattern = TermPattern(exclude) if exclude else None
+        self.level_table = LevelIndex.mask_table(levels) if levels else None
+        self.field_query = FieldQuery(where) if where else None
+        self.field_parser = None # Detected from the first batch (the GUI uses a FieldStore instead)
+
+    def __bool__(self):
+        return bool(self.keep_pattern or self.drop_pattern or self.level_table or self.field_query)
+
+    @property
+    def needs_text(self):
+        return bool(self.keep_pattern or self.drop_pattern or self.field_query)
+
+    def mask(self, texts, codes):
+        """Returns the keep mask (one byte per line, 1 = visible) of a batch of texts and their level codes."""
+        mask = self.keep_pattern.line_mask(texts) if self.keep_pattern else b"\x01" * len(texts)
+        if self.level_table: mask = bytes(map(operator.and_, mask, codes.translate(self.level_table)))
+        if self.drop_pattern: mask = bytes(map(operator.gt, mask, self.drop_pattern.line_mask(texts))) # keep AND NOT drop
+        if self.field_query:
+            if self.field_parser is None: self.field_parser = FieldParser(FieldParser.detect(texts))
+            fields = FieldBlock(self.field_parser.columns(texts), len(texts))
+            mask = bytes(map(operator.and_, mask, self.field_query.mask(fields)))
+        return mask
+
+def kept_lines(texts, mask):
+    """Returns (positions, texts) of the lines a keep mask keeps."""
+    positions, kept = [], []
+    for m in LineRuns.RUN_PATTERN.finditer(mask):
+        positions.extend(range(m.start(), m.end()))
+        kept.extend(texts[m.start():m.end()])
+    return positions, kept
+
+def build_view(index, line_filter, start=None, stop=None, stopped=None, on_progress=None):
+    """
+    Runs a LineFilter over the lines [start, stop) of an index (default: all retained
+    lines) and collapses it into LineRuns. A pure level filter never reads the text; with
+    a trigram index only candidate lines are read; other text filters over large files
+    are spread over all cores. Meant for a worker thread: a full scan reports
+    on_progress(fraction done) as it goes, and returns None once stopped() turns true
+    (chunks still queued in the process pool are dropped).
+    """
+    view = LineRuns()
+    first = max(index.first_line, start or 0)
+    count = index.line_count if stop is None else min(stop, index.line_count)
+    if first >= count: return view
+    if not line_filter.needs_text:
+        view.add_mask(index.levels.slice(first, count).translate(line_filter.level_table), first)
+        return view
+    candidates = candidate_view(index, line_filter.keep_pattern) if line_filter.keep_pattern else None
+    if candidates is not None:
+        for run_start, run_stop in zip(candidates.starts, candidates.stops):
+            for a in range(max(run_start, first), min(run_stop, count), SCAN_BATCH):
+                if stopped and stopped(): return None
+                b = min(a + SCAN_BATCH, run_stop, count)
+                view.add_mask(line_filter.mask(index.get_text(a, b), index.levels.slice(a, b)), a)
+        return view
+    begin = index.line_span(first)[0]
+    end = index.size if count == index.line_count else index.line_span(count)[0]
+    if index.file_path and ParallelScanner.worthwhile(end - begin):
+        scanner = ParallelScanner(index.file_path, index.encoding)
+        for chunk_first, lines, runs in scanner.scan("runs", line_filter, start=begin, end=end, first_line=first, trailing=end == index.size):
+            if stopped and stopped(): return None # Leaving the scan cancels the chunks still queued
+            view.extend(runs, chunk_first)
+            if on_progress: on_progress((chunk_first + lines - first) / (count - first))
+        return view
+    for a in range(first, count, SCAN_BATCH):
+        if stopped and stopped(): return None
+        b = min(a + SCAN_BATCH, count)
+        view.add_mask(line_filter.mask(index.get_text(a, b), index.levels.slice(a, b)), a)
+        if on_progress: on_progress((b - first) / (count - first))
+    return view
+
+TIME_QUERY = re.compile(r"(?:(\d{4})-(\d\d)-(\d\d)[T ])?(\d{1,2}):(\d\d)(?::(\d\d))?")
+TIME_SEPARATOR = re.compile(r"\s*(?:-|–|\.\.|to)?\s*")
+
+def parse_time_range(query, reference=None):
+    """
+    Parses a point in time ("14:32:05", "2024-03-01 14:32") or a range ("14:00-14:15")
+    into (start, stop) seconds since the epoch; stop is None for a point. The end of a
+    range counts to its precision, so "14:15" includes 14:15:59. Times without a date
+    take the date of `reference` (seconds, e.g. the time of the current line) or today.
+    Raises ValueError for anything else.
+    """
+    matches = list(TIME_QUERY.finditer(query))
+    if not matches or len(matches) > 2: raise ValueError(f"Not a time or time range: {query!r}")
+    gaps = [query[:matches[0].start()], query[matches[-1].end():]]
+    if len(matches) == 2: gaps.append(query[matches[0].end():matches[1].start()])
+    if any(not TIME_SEPARATOR.fullmatch(gap) for gap in gaps): raise ValueError(f"Not a time or time range: {query!r}")
+    day = (reference if reference is not None else time.time()) // 86400 * 86400
+    times = []
+    for m in matches:
+        y, mo, d, h, mi, s = m.groups()
+        if int(h) > 23 or int(mi) > 59 or int(s or 0) > 59: raise ValueError(f"Invalid time: {m.group()!r}")
+        if y: day = calendar.timegm((int(y), int(mo), int(d), 0, 0, 0)) # The end of a range defaults to the date of its start
+        times.append((int(day) + int(h) * 3600 + int(mi) * 60 + int(s or 0), 1 if s else 60))
+    start = times[0][0]
+    if len(times) == 1: return start, None
+    stop = times[1][0] + times[1][1]
+    if stop <= start and not matches[1].group(1): stop += 86400 # "23:50-00:10" ends the next day
+    return start, stop
+
+def time_view(index, start, stop):
+    """LineRuns of the lines stamped in [start, stop): two binary searches over the timestamp index, no scan."""
+    view = LineRuns()
+    view.add_run(index.line_at_time(start), index.line_at_time(stop))
+    return view
+
+def template_view(index, hidden, start=None):
+    """LineRuns of the lines (from `start` on) whose template is not hidden: a mask over the template IDs, no text is read."""
+    view = LineRuns()
+    start = max(index.first_line, start or 0)
+    view.add_mask(index.templates.mask(hidden, start, index.line_count), start)
+    return view
+
+# --- Export ---
+EXPORT_FORMATS = {".txt": "txt", ".log": "txt", ".jsonl": "jsonl", ".csv": "csv"} # File extension -> export format
+
+def export_view(index, f, fmt="txt", view_map=None, meta=None, stopped=None, on_progress=None):
+    """
+    Streams the lines of a view (every retained line if view_map is None) to the text
+    file f, one batch of SCAN_BATCH lines at a time read back from the index, so memory
+    stays constant however large the export. "txt" writes the lines as they are; "jsonl"
+    and "csv" give each line its number (1-based, as shown), level, and the mark color
+    and note from `meta` (a LogMeta). on_progress(lines written, total) follows every
+    batch. Returns the number of lines written, fewer if stopped() turned true.
+    """
+    if fmt not in EXPORT_FORMATS.values(): raise ValueError(f"Unknown export format: {fmt!r}")
+    total = len(view_map) if view_map is not None else index.line_count - index.first_line
+    if fmt == "csv":
+        import csv # Deferred: only CSV exports need it
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(("line", "level", "color", "note", "text"))
+    names, unmarked, written = LevelIndex.NAMES, Annotation(), 0
+    for lines, texts in iter_text_batches(index, view_map):
+        if stopped and stopped(): break
+        if not texts: continue
+        if fmt == "txt": f.writelines(f"{text}\n" for text in texts)
+        else:
+            notes = dict(meta.in_range(lines[0] + 1, lines[-1] + 2)) if meta else {} # The annotations of this batch only
+            rows = zip(lines, map(names.get, map(index.levels.code, lines)), (notes.get(line + 1, unmarked) for line in lines), texts)
+            if fmt == "jsonl": f.writelines(json.dumps({"line": line + 1, "level": level, **item.to_dict(), "text": text}) + "\n" for line, level, item, text in rows)
+            else: writer.writerows((line + 1, level or "", item.color or "", item.note or "", text) for line, level, item, text in rows)
+        written += len(texts)
+        if on_progress: on_progress(written, total)
+    return written
+
+# --- Parallel Scan ---
+_pool = None
+_pool_lock = threading.Lock()
+
+def process_pool():
+    """The shared worker pool (one process per core), created on first use."""
+    global _pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with _pool_lock:
+        # spawn everywhere: forking a process that runs Tk and helper threads is not safe
+        if _pool is None: _pool = ProcessPoolExecutor(os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _chunk_stats(data, codes):
+    """
+    Returns (lines per level code, TimelineIndex buckets, lead, last minute) of a chunk of
+    whole lines. Lines without a timestamp at the start of the chunk belong to the last
+    minute of the chunk before, unknown here: lead counts them per level code for the
+    caller to add there. The last minute is None if no line of the chunk has a timestamp.
+    """
+    timeline = TimelineIndex()
+    timeline.add(data, codes)
+    lead = array('I', bytes(4 * (len(LevelIndex.NAMES) + 1)))
+    parse, pos = timeline.parser.parse, 0
+    for code in codes:
+        stop = data.find(b'\n', pos)
+        if stop < 0: stop = len(data)
+        if parse(data[pos:min(stop, pos + TimestampParser.SEARCH_WIDTH)]) is not None: break
+        lead[code] += 1
+        pos = stop + 1
+    return tuple(map(codes.count, range(len(LevelIndex.NAMES) + 1))), timeline.buckets, lead, timeline._minute
+
+def _scan_chunk(path, start, end, trailing, encoding, line_filter, collect):
+    """
+    Pool worker: scans the whole lines in the byte range [start, end) of a file.
+    Returns (line count, result), result depending on `collect`: "stats" = _chunk_stats()
+    output, "runs" = LineRuns of the kept lines, "lines" =
+    kept_lines() output, "trigrams" = (byte length, _chunk_trigrams() output).
+    Line numbers in results are relative to the chunk.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        data = m[start:end]
+    if collect == "trigrams": return data.count(b'\n'), (end - start,) + _chunk_trigrams(data, TrigramIndex.BLOCK_SIZE)
+    # A chunk ends with a newline; only the index counts the empty line after the last one
+    if not trailing and data.endswith(b'\n'): data = data[:-1]
+    codes = LevelIndex.classify(data)
+    if collect == "stats": return len(codes), _chunk_stats(data, codes)
+    texts = data.replace(b'\r\n', b'\n').decode(encoding, 'replace').split('\n')
+    mask = line_filter.mask(texts, codes)
+    if collect == "lines": return len(texts), kept_lines(texts, mask)
+    runs = LineRuns()
+    runs.add_mask(mask, 0)
+    return len(texts), runs
+
+class ParallelScanner:
+    """
+    Scans a file on all cores: it is cut into CHUNK_SIZE pieces at newline boundaries,
+    every piece is memory-mapped and scanned (level classification, filter masks) by a
+    worker process, and the results come back in file order with absolute line numbers.
+    Only the chunk results cross process boundaries, never the text.
+    """
+    CHUNK_SIZE = 16 * 1024 * 1024
+    MIN_SIZE = 64 * 1024 * 1024 # Smaller scans are faster in-process than shipped to workers
+    IN_FLIGHT = 2 # Chunks queued per worker; bounds the memory of results waiting to be merged
+
+    def __init__(self, path, encoding="utf-8", executor=None, workers=None):
+        self.path = path
+        self.encoding = encoding
+        self.executor = executor # Defaults to the shared process_pool()
+        self.workers = workers or os.cpu_count() or 1
+
+    @classmethod
+    def worthwhile(cls, size, encoding="utf-8"):
+        """True if a scan of `size` bytes is worth spreading over worker processes."""
+        return size >= cls.MIN_SIZE and (os.cpu_count() or 1) > 1 and LineIndex.is_ascii_compatible(encoding)
+
+    def split(self, start, end):
+        """Returns [start, end) cut into (start, end) pieces of about CHUNK_SIZE bytes that begin at line starts."""
+        bounds = [start]
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            while bounds[-1] + self.CHUNK_SIZE < end:
+                cut = m.find(b'\n', bounds[-1] + self.CHUNK_SIZE, end)
+                if cut < 0 or cut + 1 >= end: break
+                bounds.append(cut + 1)
+        return list(zip(bounds, bounds[1:] + [end]))
+
+    def scan(self, collect, line_filter=None, start=0, end=None, first_line=0, trailing=False):
+        """
+        Yields (first line, line count, result) per chunk, in file order (see _scan_chunk).
+        With trailing=True the empty line after a final newline counts, like in LineIndex.
+        """
+        if end is None: end = os.path.getsize(self.path)
+        executor = self.executor or process_pool()
+        pending = deque()
+        try:
+            for a, b in self.split(start, end):
+                pending.append(executor.submit(_scan_chunk, self.path, a, b, trailing and b == end, self.encoding, line_filter, collect))
+                while len(pending) > self.workers * self.IN_FLIGHT or (pending and pending[0].done()):
+                    count, result = pending.popleft().result()
+                    yield first_line, count, result
+                    first_line += count
+            while pending:
+                count, result = pending.popleft().result()
+                yield first_line, count, result
+                first_line += count
+        finally:
+            for future in pending: future.cancel() # Consumer stopped early
+
+# --- Command Line Interface ---
+def _iter_kept(path, line_filter):
+    """Yields (first line, positions, texts) of the kept lines per chunk; large files are scanned on all cores."""
+    encoding = EncodingDetector.detect(path)
+    if ParallelScanner.worthwhile(os.path.getsize(path), encoding) and not detect_compression(path):
+        for first_line, _, (positions, texts) in ParallelScanner(path, encoding).scan("lines", line_filter):
+            yield first_line, positions, texts
+        return
+    for first_line, texts, codes in stream_lines(path):
+        yield (first_line, *kept_lines(texts, line_filter.mask(texts, codes)))
+
+def _iter_stats(path):
+    """Yields (line count, *_chunk_stats() output) per chunk; large files are scanned on all cores."""
+    encoding = EncodingDetector.detect(path)
+    if ParallelScanner.worthwhile(os.path.getsize(path), encoding) and not detect_compression(path):
+        for _, count, stats in ParallelScanner(path, encoding).scan("stats"): yield (count, *stats)
+        return
+    for _, data, _ in stream_chunks(path):
+        codes = LevelIndex.classify(data)
+        yield (len(codes), *_chunk_stats(data, codes))
+
+def _run_filter(args, line_filter):
+    """Streams the lines kept by a filter to stdout (or only counts them). Returns the exit code."""
+    matched = 0
+    out = sys.stdout
+    for first_line, positions, texts in _iter_kept(args.file, line_filter):
+        matched += len(texts)
+        if args.count: continue
+        if args.line_number: out.writelines(f"{first_line + i + 1}:{text}\n" for i, text in zip(positions, texts))
+        else: out.writelines(f"{text}\n" for text in texts)
+    if args.count: print(matched)
+    return 0 if matched else 1 # grep convention: 1 = nothing matched
+
+def _run_stats(args):
+    counts = dict.fromkeys(LevelIndex.NAMES.values(), 0)
+    timeline = TimelineIndex()
+    total, minute = 0, None # Minute of the last timestamped line so far
+    for count, per_level, buckets, lead, last in _iter_stats(args.file):
+        total += count
+        for level, name in LevelIndex.NAMES.items(): counts[name] += per_level[level]
+        timeline.merge(buckets)
+        # Continuation lines at the start of a chunk count towards the minute the chunk before ended in
+        if minute is not None and any(lead): timeline.merge({minute: lead})
+        if last is not None: minute = last
+    resolution = {"minute": 60, "hour": 3600}.get(args.timeline)
+    series = [(time.strftime("%Y-%m-%d %H:%M", time.gmtime(start)), {name: per_level[level] for level, name in LevelIndex.NAMES.items()})
+              for start, per_level in timeline.series(resolution)] if resolution else []
+    if args.json:
+        report = {"file": args.file, "lines": total, "levels": counts}
+        if resolution: report["timeline"] = [{"start": start, **per_level} for start, per_level in series]
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{args.file}: {total} lines")
+    for name, count in counts.items(): print(f"  {name:<6} {count:>10}  {count / total if total else 0:6.1%}")
+    if series:
+        print(f"\n{'start':<18}" + "".join(f"{name:>10}" for name in LevelIndex.NAMES.values()))
+        for start, per_level in series: print(f"{start:<18}" + "".join(f"{n:>10}" for n in per_level.values()))
+    return 0
+
+def _run_patterns(args):
+    """Prints the line templates of a log, most frequent first."""
+    templates, total = None, 0
+    for first_line, data, encoding in stream_chunks(args.file):
+        if templates is None: templates = TemplateIndex(encoding)
+        templates.count(data)
+        total = first_line + data.count(b'\n') + 1
+    ranked = templates.top() if templates else []
+    top = ranked[:args.top]
+    if args.json:
+        print(json.dumps([{"id": tid, "lines": n, "template": templates.template(tid)} for tid, n in top], indent=2))
+        return 0
+    print(f"{args.file}: {total} lines, {len(ranked)} templates")
+    for tid, n in top: print(f"{n:>10}  {n / total:6.1%}  {templates.template(tid)}")
+    return 0
+
+def _run_merge(args):
+    """Streams the files merged by timestamp to stdout, every line prefixed with its [file name]."""
+    sys.stdout.flush()
+    merger = LogMerger(args.files, out=sys.stdout.buffer)
+    try:
+        while merger.pump(LineIndex.CHUNK_SIZE): pass
+    finally: merger.close()
+    return 0
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="omnilog", description="Headless Omnilog: search, filter and summarize logs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    grep = commands.add_parser("grep", help="print the lines containing a term")
+    grep.add_argument("file")
+    grep.add_argument("pattern")
+    grep.add_argument("-e", "--regex", action="store_true", help="treat the pattern as a regular expression")
+
+    flt = commands.add_parser("filter", help="print the lines kept by the level/include/exclude filters")
+    flt.add_argument("file")
+    flt.add_argument("--level", nargs="+", type=str.upper, choices=["ERROR", "WARN", "INFO", "DEBUG"])
+    flt.add_argument("--include", help="only lines containing this text")
+    flt.add_argument("--exclude", help="drop lines containing this text")
+    flt.add_argument("--where", help='field query on JSON lines, logfmt or access logs, e.g. "status>=500 AND path~/api/"')
+    flt.add_argument("-e", "--regex", action="store_true", help="treat --include as a regular expression")
+
+    for sub in (grep, flt):
+        sub.add_argument("-n", "--line-number", action="store_true", help="prefix lines with their line number")
+        sub.add_argument("-c", "--count", action="store_true", help="only print the number of matching lines")
+
+    stats = commands.add_parser("stats", help="count the lines per log level")
+    stats.add_argument("file")
+    stats.add_argument("--json", action="store_true")
+    stats.add_argument("--timeline", choices=["minute", "hour"], help="also print the lines per level per minute or hour")
+
+    patterns = commands.add_parser("patterns", help="list the line templates (message patterns) by count")
+    patterns.add_argument("file")
+    patterns.add_argument("--top", type=int, default=50, help="how many templates to print (default 50)")
+    patterns.add_argument("--json", action="store_true")
+
+    merge = commands.add_parser("merge", help="print several logs as one timeline, ordered by timestamp")
+    merge.add_argument("files", nargs="+", metavar="file")
+
+    args = parser.parse_args(argv)
+    if hasattr(sys.stdout, "reconfigure"): sys.stdout.reconfigure(errors="replace")
+    try:
+        if args.command == "stats": return _run_stats(args)
+        if args.command == "merge": return _run_merge(args)
+        if args.command == "patterns": return _run_patterns(args)
+        if args.command == "grep": line_filter = LineFilter(include=args.pattern, use_regex=args.regex)
+        else: line_filter = LineFilter(include=args.include, exclude=args.exclude, levels=args.level, use_regex=args.regex, where=args.where)
+        return _run_filter(args, line_filter)
+    except BrokenPipeError:
+        # Output piped into e.g. `head`: stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except re.error as e:
+        print(f"omnilog: invalid regex: {e}", file=sys.stderr)
+    except ValueError as e:
+        print(f"omnilog: invalid query: {e}", file=sys.stderr)
+    except OSError as e:
+        print(f"omnilog: {e}", file=sys.stderr)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import io
+import json
+import sys
+import types
+
+import pytest
+
+import omnilog_core
+from omnilog_core import AlertEngine, AlertRule, EncodingDetector, FieldQuery, LineFilter, LineIndex, LogMeta, TemplateIndex, field_view
+
+
+def test_alert_rules_anchor_per_line():
+    text = "\n".join([f"line {i} ok" for i in range(16)] + ["job failed", "panic: boom failed", ""])
+    for rules in ("/^panic/\n/failed$/", "/(?s)^panic/\n/failed$/"): # The second cannot be combined: checked line by line
+        index = LineIndex.from_text(text)
+        engine = AlertEngine(AlertRule.parse(rules))
+        engine.next_line = 0
+        alerts = [(line, rule.text) for line, rule in engine.scan(index)]
+        anchored = rules.split("\n")[0]
+        assert alerts == [(16, "/failed$/"), (17, anchored), (17, "/failed$/")]
+
+
+def test_get_text_of_trimmed_lines():
+    index = LineIndex.from_text("\n".join(f"line {i}" for i in range(12)))
+    index.trim(3)
+    assert index.first_line == 9
+    assert index.get_text(0, 3) == ["", "", ""] # Wholly before first_line: one empty text per line
+    assert index.get_text(7, 11) == ["", "", "line 9", "line 10"]
+    assert index.get_text_at([1, 2, 10]) == ["", "", "line 10"]
+
+
+def test_stats_timeline_keeps_continuation_lines_across_chunks(tmp_path, monkeypatch, capsys):
+    lines = []
+    for minute in range(30):
+        lines.append(f"2024-05-01 10:{minute:02d}:00 ERROR request failed")
+        lines.extend(f"    exception frame {i}" for i in range(40)) # Stack trace: no timestamps
+    path = tmp_path / "app.log"
+    path.write_text("\n".join(lines) + "\n")
+    stream_chunks = omnilog_core.stream_chunks # Small chunks: most start inside a stack trace
+    monkeypatch.setattr(omnilog_core, "stream_chunks", lambda file_path: stream_chunks(file_path, chunk_size=500))
+    omnilog_core.main(["stats", str(path), "--json", "--timeline", "minute"])
+    report = json.loads(capsys.readouterr().out)
+    assert [bucket["ERROR"] for bucket in report["timeline"]] == [41] * 30
+
+
+def test_annotation_update_counts_stored_entries():
+    meta = LogMeta()
+    assert meta.update([(3, "red", None), (5, None, None), (7, None, "check"), (9, "", "")]) == 2
+    assert list(meta.lines) == [3, 7]
+
+
+@pytest.mark.parametrize("text", ['{"annotations": {"3": "note"}}', '{"annotations": {"x": {"note": "a"}}}',
+                                  '{"line": 3, "note": "a"}\n[4, "note"]\n', '{"line": null, "note": "a"}\n'])
+def test_annotation_import_rejects_malformed_entries(text):
+    meta = LogMeta()
+    meta.update([(1, "red", None)])
+    with pytest.raises(ValueError): meta.import_file(io.StringIO(text))
+    assert list(meta.lines) == [1] # Nothing of a rejected import is stored
+
+
+def test_negated_field_queries_skip_lines_without_fields(tmp_path):
+    records = [{"level": "error", "status": 500}, {"level": "info", "status": 200}, {"level": "warn", "status": 404}]
+    path = tmp_path / "app.jsonl"
+    path.write_text("\n".join(map(json.dumps, records)) + "\nplain text, no fields\n")
+    index = LineIndex(str(path))
+    index.build()
+    assert index.line_count == 5 # The empty line after the final newline counts too
+    for query in ("NOT status>=500", "level!=error"):
+        assert field_view(index, FieldQuery(query))[0:5] == [1, 2]
+    index.close()
+    line_filter = LineFilter(where="NOT status>=500")
+    texts = path.read_text().split("\n")
+    assert line_filter.mask(texts, bytes(len(texts))) == b"\x00\x01\x01\x00\x00"
+
+
+def test_encoding_detection_samples_past_the_first_16kb(monkeypatch):
+    sample = b"2024-01-01 12:00:00 INFO plain ascii line\n" * 500 + "caf\xe9 na\xefve\n".encode("latin-1")
+    assert sample.index(b"\xe9") > EncodingDetector.CHARDET_SAMPLE_SIZE
+    seen = []
+    def detect(window): # Answers like chardet: "ascii" for ASCII-only input
+        seen.append(window)
+        return {"encoding": "ascii" if window.isascii() else "ISO-8859-1"}
+    monkeypatch.setitem(sys.modules, "chardet", types.SimpleNamespace(detect=detect))
+    assert EncodingDetector.detect_bytes(sample) == "ISO-8859-1"
+    assert b"\xe9" in seen[0]
+    monkeypatch.setitem(sys.modules, "chardet", types.SimpleNamespace(detect=lambda window: {"encoding": "ascii"}))
+    assert EncodingDetector.detect_bytes(sample) == "cp1252" # Never "ascii" for a sample with non-ASCII bytes
+
+
+def test_templates_ignore_timestamps_and_keep_levels():
+    lines = [f"2024-01-0{day}T10:0{day}:00.{day}23Z {level} [api] Heartbeat ok" for day in range(1, 7) for level in ("INFO", "ERROR")]
+    lines += [f"[0{day}/Jan/2024:12:00:00 +0000] caf\xe9 user {day}" for day in range(1, 4)]
+    templates = TemplateIndex("latin-1")
+    templates.count("\n".join(lines).encode("latin-1"))
+    assert sorted((templates.template(tid), n) for tid, n in templates.top()) == [
+        ("ERROR [api] Heartbeat ok", 6), ("INFO [api] Heartbeat ok", 6), ("caf\xe9 user <*>", 3)]